@@ -0,0 +1,346 @@
+"""
+Admission control for the chat endpoints
+
+- Token buckets per client IP and per session, so one visitor (or a
+  runaway script) can't take all the capacity: over the limit -> 429.
+- A cap on chat turns in flight per process, with a short bounded queue
+  in front of it: when the queue is full, or a request waits too long,
+  it is turned away at once -> 503. Admitted requests keep their latency
+  instead of everyone slowing down together (and running into Anthropic
+  rate limits).
+
+Rejections carry a Retry-After estimate. Every limit can be switched off
+with 0.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Callable, Iterator, AsyncIterator
+
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", 60))
+RATE_LIMIT_IP_BURST = int(os.environ.get("RATE_LIMIT_IP_BURST", 20))
+RATE_LIMIT_SESSION_PER_MINUTE = float(os.environ.get("RATE_LIMIT_SESSION_PER_MINUTE", 20))
+RATE_LIMIT_SESSION_BURST = int(os.environ.get("RATE_LIMIT_SESSION_BURST", 5))
+
+# Chat turns running at once per process, and how many more may wait for a slot
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", 32))
+ADMISSION_QUEUE = int(os.environ.get("ADMISSION_QUEUE", 32))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 5))
+
+# Proxies in front of the server that append to X-Forwarded-For (Replit,
+# Railway, a load balancer...); 0 when clients connect directly
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 1))
+
+# Upstream statuses that mean "slow down" rather than a failed request
+UPSTREAM_OVERLOAD_STATUSES = (429, 529)
+
+
+class Rejected(Exception):
+    """A request turned away before any work was done"""
+
+    status = 503
+
+    def __init__(self, message: str, retry_after: Optional[float]):
+        super().__init__(message)
+        self.message = message
+        # Whole seconds, for the header (None when retrying won't help)
+        self.retry_after = max(1, math.ceil(retry_after)) if retry_after is not None else None
+
+
+class RateLimited(Rejected):
+    """A client or session is over its request rate"""
+
+    status = 429
+
+
+class Overloaded(Rejected):
+    """The server (or the model API) has no capacity for the request right now"""
+
+    status = 503
+
+
+class TokenBuckets:
+    """
+    A token bucket per key (client IP or session id)
+    Thread-safe; the least recently used buckets are dropped past max_keys.
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        burst: int,
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key: str) -> float:
+        """
+        Take a token for key
+
+        Returns:
+            0 if allowed, otherwise seconds until a token is available
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.rate
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "per_minute": round(self.rate * 60, 2),
+                "burst": self.burst,
+                "tracked": len(self._buckets),
+                "rejected": self.rejected
+            }
+
+
+class Slot:
+    """A held in-flight slot; release() is idempotent and runs on garbage collection too"""
+
+    def __init__(self, release: Callable[[float], None]):
+        self._release = release
+        self._started = time.perf_counter()
+        self._released = False
+
+    @property
+    def released(self) -> bool:
+        return self._released
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._release(time.perf_counter() - self._started)
+
+    def __del__(self):
+        # Backstop for a stream whose body was never iterated
+        self.release()
+
+
+class InFlightLimit:
+    """
+    Cap on concurrent chat turns with a bounded wait queue, for threaded servers
+    A request that finds the queue full, or waits longer than queue_timeout,
+    is rejected with Overloaded.
+    """
+
+    def __init__(
+        self,
+        limit: int = MAX_IN_FLIGHT,
+        queue_size: int = ADMISSION_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT
+    ):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._avg_seconds = 1.0  # Moving average turn time, for Retry-After
+        self._changed = threading.Condition()
+        self._metrics = {"admitted": 0, "queued": 0, "queue_full": 0, "queue_timeouts": 0}
+
+    def acquire(self) -> Slot:
+        """
+        Take an in-flight slot, waiting in the queue if none is free
+
+        Raises:
+            Overloaded: if the queue is full or the wait timed out
+        """
+        if self.limit <= 0:
+            return Slot(lambda seconds: None)
+        with self._changed:
+            if self.in_flight >= self.limit:
+                if self.waiting >= self.queue_size:
+                    self._metrics["queue_full"] += 1
+                    raise Overloaded("Server busy, please retry shortly", self._retry_after())
+                self._metrics["queued"] += 1
+                self.waiting += 1
+                try:
+                    free = self._changed.wait_for(lambda: self.in_flight < self.limit, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not free:
+                    self._metrics["queue_timeouts"] += 1
+                    raise Overloaded("Server busy, please retry shortly", self._retry_after())
+            self.in_flight += 1
+            self._metrics["admitted"] += 1
+        return Slot(self._release)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a slot for the block"""
+        slot = self.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def _release(self, seconds: float):
+        with self._changed:
+            self.in_flight -= 1
+            self._observe(seconds)
+            self._changed.notify()
+
+    def _observe(self, seconds: float):
+        self._avg_seconds += 0.1 * (seconds - self._avg_seconds)
+
+    def _retry_after(self) -> float:
+        # Time for everything ahead (running and queued) to drain
+        return self._avg_seconds * (1 + self.waiting / max(self.limit, 1))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "avg_turn_ms": round(self._avg_seconds * 1000, 1)
+        }
+
+
+class AsyncInFlightLimit(InFlightLimit):
+    """InFlightLimit for an asyncio server - waiters are served first come, first served"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters: deque = deque()
+
+    async def acquire(self) -> Slot:
+        if self.limit <= 0:
+            return Slot(lambda seconds: None)
+        if self.in_flight >= self.limit or self._waiters:
+            if self.waiting >= self.queue_size:
+                self._metrics["queue_full"] += 1
+                raise Overloaded("Server busy, please retry shortly", self._retry_after())
+            self._metrics["queued"] += 1
+            # A releasing request hands its slot straight to the first waiter
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not waiter.done():
+                    waiter.cancel()
+                    self._metrics["queue_timeouts"] += 1
+                    raise Overloaded("Server busy, please retry shortly", self._retry_after())
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(0.0)  # Handed a slot we won't use
+                else:
+                    waiter.cancel()
+                raise
+            finally:
+                self.waiting -= 1
+        else:
+            self.in_flight += 1
+        self._metrics["admitted"] += 1
+        return Slot(self._release)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        slot = await self.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def _release(self, seconds: float):
+        self._observe(seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # in_flight is unchanged - the slot moves on
+                return
+        self.in_flight -= 1
+
+
+class AdmissionControl:
+    """Rate limits and the in-flight cap used by one server process"""
+
+    def __init__(self, in_flight: Optional[InFlightLimit] = None):
+        self.ip_limits = TokenBuckets(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+        self.session_limits = TokenBuckets(RATE_LIMIT_SESSION_PER_MINUTE, RATE_LIMIT_SESSION_BURST)
+        self.in_flight = in_flight if in_flight is not None else InFlightLimit()
+
+    def check_rate(self, client_ip: str, session_id: str):
+        """
+        Count a chat request against its client's and session's buckets
+
+        Raises:
+            RateLimited: if either is out of tokens
+        """
+        wait = self.ip_limits.take(client_ip)
+        if wait:
+            raise RateLimited("Too many requests from this address, please slow down", wait)
+        wait = self.session_limits.take(session_id)
+        if wait:
+            raise RateLimited("Too many messages in this conversation, please slow down", wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight.stats(),
+            "ip_rate_limit": self.ip_limits.stats(),
+            "session_rate_limit": self.session_limits.stats()
+        }
+
+
+def client_ip(remote_addr: Optional[str], forwarded_for: Optional[str]) -> str:
+    """
+    The client's address, taking TRUSTED_PROXY_HOPS entries of X-Forwarded-For
+    into account (entries further left can be set by the client, so are ignored)
+    """
+    if TRUSTED_PROXY_HOPS > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return remote_addr or "unknown"
+
+
+def upstream_overload(error: Exception) -> Optional[Overloaded]:
+    """
+    An Overloaded rejection for an Anthropic rate-limit/overloaded error
+    (with the API's own retry-after if it sent one), or None for other errors
+    """
+    if getattr(error, "status_code", None) not in UPSTREAM_OVERLOAD_STATUSES:
+        return None
+    retry_after = 5.0
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", retry_after))
+        except (TypeError, ValueError):
+            pass
+    return Overloaded("The assistant is busy right now, please retry shortly", retry_after)
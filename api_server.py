@@ -3,23 +3,94 @@ Simple API server for the chatbot
 Deploy this to Replit, Railway, or any Python hosting service
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import os
+import threading
+import time
+import metrics
 from chatbot import VitalMechanicalChatbot
+from session_store import create_session_store
+from admission import AdmissionControl, Rejected, client_ip, upstream_overload
+from resilience import get_resilience
+from session_guard import SessionLocks, SessionBusy, IdempotencyCache, idempotency_key
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Store chatbot instances per session
-# In production, use Redis or similar for session management
-chatbot_sessions = {}
+
+# Per-route timings for /metrics
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    rule = request.url_rule.rule if request.url_rule else None
+    metrics.observe_request(request.method, rule, response.status_code, g.get("request_started"))
+    return response
+
+
+# Per-session conversation state - SESSION_BACKEND=sqlite or redis shares it
+# between worker processes, so any worker can serve any session
+session_store = create_session_store()
+
+# Turns for one session run in order; retried requests replay their result
+session_locks = SessionLocks()
+idempotency_cache = IdempotencyCache()
+SESSION_BUSY = "Another message for this session is still being processed"
+
+# Per-IP and per-session rate limits, and the cap on chat turns in flight
+admission = AdmissionControl()
+
+# Sessions, admission and upstream state on /metrics
+metrics.register_server_metrics(session_store, admission)
+
+# One chatbot per process, shared by all sessions
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+
+def get_chatbot() -> VitalMechanicalChatbot:
+    """Get the shared chatbot, creating it on first use"""
+    global _chatbot
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                _chatbot = VitalMechanicalChatbot()
+    return _chatbot
+
+
+def _rejected(error: Rejected):
+    """Response for a request turned away by admission control (429/503 with Retry-After)"""
+    return jsonify({"error": error.message, "retry_after": error.retry_after}), error.status, {
+        "Retry-After": str(error.retry_after)
+    }
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: stage, tool and route latency histograms, tokens, sessions (404 when METRICS=off)"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "vital-mechanical-chatbot"}), 200
+    """
+    Health check endpoint
+    Stays 200 while the Anthropic API is failing (the process is fine); "status"
+    is "degraded" and "upstream" shows the circuit breaker while answers come
+    from the fallback
+    """
+    breaker = get_resilience().breaker.stats()
+    return jsonify({
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
+        "service": "vital-mechanical-chatbot",
+        "upstream": breaker
+    }), 200
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -47,25 +118,45 @@ def chat():
 
         user_message = data['message']
         session_id = data.get('session_id', 'default')
+        admission.check_rate(client_ip(request.remote_addr, request.headers.get("X-Forwarded-For")), session_id)
+
+        try:
+            chatbot = get_chatbot()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
 
-        # Get or create chatbot for this session
-        if session_id not in chatbot_sessions:
-            try:
-                chatbot_sessions[session_id] = VitalMechanicalChatbot()
-            except ValueError as e:
-                return jsonify({"error": str(e)}), 500
+        key = idempotency_key(request.headers, data)
 
-        chatbot = chatbot_sessions[session_id]
+        # Bounded concurrency, then one turn at a time per session - a double
+        # submit waits for the first
+        with admission.in_flight.slot(), session_locks.hold(session_id):
+            body = idempotency_cache.get(session_id, key)
+            if body is not None:
+                return jsonify(body), 200, {"Idempotent-Replay": "true"}
 
-        # Get response
-        response = chatbot.chat(user_message)
+            # Get or create conversation state for this session
+            session = session_store.get_or_create(session_id)
 
-        return jsonify({
-            "response": response,
-            "session_id": session_id
-        }), 200
+            # Get response
+            response = chatbot.chat(user_message, session.conversation_history)
+            session_store.save(session)
 
+            body = {
+                "response": response,
+                "session_id": session_id
+            }
+            idempotency_cache.put(session_id, key, body)
+
+        return jsonify(body), 200
+
+    except Rejected as e:
+        return _rejected(e)
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
     except Exception as e:
+        overload = upstream_overload(e)
+        if overload is not None:
+            return _rejected(overload)
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
@@ -83,12 +174,16 @@ def reset_session():
         data = request.get_json()
         session_id = data.get('session_id', 'default')
 
-        if session_id in chatbot_sessions:
-            chatbot_sessions[session_id].reset_conversation()
+        with session_locks.hold(session_id):
+            found = session_store.reset(session_id)
+
+        if found:
             return jsonify({"message": "Session reset successfully"}), 200
         else:
             return jsonify({"message": "Session not found"}), 404
 
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -0,0 +1,523 @@
+"""
+Async (ASGI) API Server
+Same routes as api_server_enhanced.py, served on asyncio with AsyncAnthropic
+so one worker can hold hundreds of concurrent chats open.
+
+Run with:
+    hypercorn api_server_async:app --bind 0.0.0.0:$PORT
+"""
+
+from quart import Quart, g, request, jsonify, send_from_directory
+from quart_cors import cors
+import asyncio
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from chatbot_enhanced import STARTUP_WARMUP, EnhancedVitalMechanicalChatbot, preload
+from chatbot_tools import feature_flags
+from session_store import create_session_store
+import lead_store
+import metrics
+from faq_cache import get_faq_cache
+from admission import AdmissionControl, AsyncInFlightLimit, Rejected, client_ip, upstream_overload
+from resilience import get_resilience
+from outbox import get_outbox
+from traces import get_trace_log
+from token_budget import DEFAULT_TENANT, get_token_ledger
+from session_guard import AsyncSessionLocks, SessionBusy, IdempotencyCache, idempotency_key
+
+app = cors(Quart(__name__))
+
+
+# Per-route timings for /metrics
+@app.before_request
+async def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def _record_request(response):
+    rule = request.url_rule.rule if request.url_rule else None
+    metrics.observe_request(request.method, rule, response.status_code, g.get("request_started"))
+    # Sampled chat turns for the trace log; a stream that started records itself when it ends
+    if trace_log.enabled and (
+        request.endpoint == 'chat' or (request.endpoint == 'chat_stream' and response.status_code != 200)
+    ):
+        trace_log.record(request.path, response.status_code, g.get("request_started"),
+                         await request.get_json(silent=True), g.get("chat_result"))
+    return response
+
+
+# Per-session conversation state - SESSION_BACKEND=sqlite or redis shares it
+# between worker processes, so any worker can serve any session
+session_store = create_session_store()
+
+
+async def sessions(method: str, *args):
+    """Call a session store method, in a worker thread if the backend does I/O"""
+    fn = getattr(session_store, method)
+    if session_store.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+# Turns for one session run in order; retried requests replay their result
+session_locks = AsyncSessionLocks()
+idempotency_cache = IdempotencyCache()
+SESSION_BUSY = "Another message for this session is still being processed"
+
+# Per-IP and per-session rate limits, and the cap on chat turns in flight
+admission = AdmissionControl(AsyncInFlightLimit())
+
+# Token budgets per session and tenant, checked before a turn is admitted
+token_ledger = get_token_ledger()
+
+# Answers to common opening questions, shared by all sessions (None if disabled)
+faq_cache = get_faq_cache()
+
+# Background delivery of tool side effects (CRM pushes), including any
+# still queued from before a restart
+outbox = get_outbox()
+
+# Sampled, redacted chat turns for replay (off unless TRACE_SAMPLE_RATE is set)
+trace_log = get_trace_log()
+
+# Sessions, admission, upstream, token usage and outbox state on /metrics
+metrics.register_server_metrics(
+    session_store, admission, lambda: _chatbot.get_usage_stats() if _chatbot else None, outbox
+)
+
+# One chatbot per process, shared by all sessions
+_chatbot = None
+
+
+def get_chatbot() -> EnhancedVitalMechanicalChatbot:
+    """Get the shared chatbot, creating it on first use (single event loop, no lock needed)"""
+    global _chatbot
+    if _chatbot is None:
+        _chatbot = EnhancedVitalMechanicalChatbot()
+    return _chatbot
+
+
+async def warm_up():
+    """
+    Load the SDK and first-turn artifacts (on a thread, so the loop keeps
+    answering /health), then build the chatbot on the loop
+    """
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, preload)
+        get_chatbot()
+    except Exception as e:
+        print(f"Warm-up failed, loading on first request instead: {e}")
+
+
+@app.before_serving
+async def _start_warm_up():
+    if STARTUP_WARMUP:
+        app.add_background_task(warm_up)
+
+
+# Directory for storing data (shared with the chatbot's lead store)
+DATA_DIR = lead_store.DATA_DIR
+os.makedirs(DATA_DIR, exist_ok=True)
+
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _rejected(error: Rejected):
+    """Response for a request turned away before any model call (429/503 with Retry-After, 413)"""
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after is not None else {}
+    return jsonify({"error": error.message, "retry_after": error.retry_after}), error.status, headers
+
+
+def _request_ip() -> str:
+    """Client address for rate limiting"""
+    return client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+
+
+def _request_tenant() -> str:
+    """Tenant whose token budget a turn counts against (set X-Tenant-ID at the proxy)"""
+    return request.headers.get("X-Tenant-ID") or DEFAULT_TENANT
+
+
+@app.route('/', methods=['GET'])
+async def home():
+    """API information endpoint"""
+    return jsonify({
+        "service": "Vital Mechanical Chatbot API",
+        "version": "2.0",
+        "server": "asgi",
+        "features": {
+            "chat": True,
+            "lead_capture": True,
+            "booking": False,  # Will enable later
+            "quotes": False    # Will enable later
+        },
+        "endpoints": {
+            "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
+            "leads": "/api/leads",
+            "health": "/health",
+            "metrics": "/metrics"
+        }
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """Prometheus metrics - same as the Flask server (404 when METRICS=off)"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    # Gauges read the session store and outbox, which may do I/O
+    body = await asyncio.to_thread(metrics.registry.render)
+    return body, 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """
+    Health check endpoint
+    Stays 200 while the Anthropic API is failing (the process is fine); "status"
+    is "degraded" and "upstream" shows the circuit breaker while answers come
+    from the fallback
+    """
+    breaker = get_resilience().breaker.stats()
+    return jsonify({
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
+        "service": "vital-mechanical-chatbot",
+        "upstream": breaker,
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """
+    Main chat endpoint with tool support
+
+    Expected JSON:
+    {
+        "message": "user message",
+        "session_id": "optional-session-id"
+    }
+    """
+    try:
+        data = await request.get_json()
+
+        if not data or 'message' not in data:
+            return jsonify({"error": "Missing 'message' in request body"}), 400
+
+        user_message = data['message']
+        session_id = data.get('session_id', 'default')
+        admission.check_rate(_request_ip(), session_id)
+        budget = token_ledger.for_turn(session_id, _request_tenant())
+
+        try:
+            chatbot = get_chatbot()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
+
+        key = idempotency_key(request.headers, data)
+
+        # One turn at a time per session - a double submit waits for the
+        # first - then bounded concurrency. The slot is only taken once the
+        # lock is held, so a waiting duplicate doesn't keep one from others
+        async with session_locks.hold(session_id):
+            body = idempotency_cache.get(session_id, key)
+            if body is not None:
+                g.chat_result = body
+                return jsonify(body), 200, {"Idempotent-Replay": "true"}
+
+            async with admission.in_flight.slot():
+                session = await sessions('get_or_create', session_id)
+
+                result = await chatbot.achat(user_message, session.conversation_history, budget)
+                await sessions('save', session)
+
+                body = {
+                    "response": result["response"],
+                    "actions": result.get("actions", []),
+                    "usage": result.get("usage", {}),
+                    "cached": result.get("cached", False),
+                    "coalesced": result.get("coalesced", False),
+                    "degraded": result.get("degraded", False),
+                    "history_tokens": result.get("history_tokens", 0),
+                    "model": result.get("model"),
+                    "session_id": session_id,
+                    "timestamp": datetime.now().isoformat()
+                }
+                idempotency_cache.put(session_id, key, body)
+                g.chat_result = body
+
+        return jsonify(body), 200
+
+    except Rejected as e:
+        return _rejected(e)
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
+    except Exception as e:
+        overload = upstream_overload(e)
+        if overload is not None:
+            return _rejected(overload)
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Streaming chat endpoint (Server-Sent Events) - same events as the Flask server"""
+    data = await request.get_json(silent=True)
+
+    if not data or 'message' not in data:
+        return jsonify({"error": "Missing 'message' in request body"}), 400
+
+    user_message = data['message']
+    session_id = data.get('session_id', 'default')
+
+    try:
+        chatbot = get_chatbot()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 500
+
+    # Turned away before the stream starts, so clients get a real 429/503
+    try:
+        admission.check_rate(_request_ip(), session_id)
+        budget = token_ledger.for_turn(session_id, _request_tenant())
+        slot = await admission.in_flight.acquire()
+    except Rejected as e:
+        return _rejected(e)
+
+    key = idempotency_key(request.headers, data)
+    request_started, path = g.get("request_started"), request.path
+
+    async def generate():
+        nonlocal slot
+        started = time.perf_counter()
+        first_token_ms = None
+        done = None
+        try:
+            # Held for the whole stream - a double submit waits for the first,
+            # handing back its in-flight slot while it waits
+            async with session_locks.hold(session_id, on_wait=slot.release):
+                done = idempotency_cache.get(session_id, key)
+                if done is not None:
+                    yield _sse("text", {"text": done["response"]}).encode()
+                    yield _sse("done", done).encode()
+                    return
+                if slot.released:
+                    slot = await admission.in_flight.acquire()
+
+                session = await sessions('get_or_create', session_id)
+                try:
+                    async for event in chatbot.achat_stream(user_message, session.conversation_history, budget):
+                        if event["event"] == "text" and first_token_ms is None:
+                            first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                        elif event["event"] == "done":
+                            event["data"] = {
+                                **event["data"],
+                                "session_id": session_id,
+                                "first_token_ms": first_token_ms,
+                                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                                "timestamp": datetime.now().isoformat()
+                            }
+                            idempotency_cache.put(session_id, key, event["data"])
+                            done = event["data"]
+                        yield _sse(event["event"], event["data"]).encode()
+                finally:
+                    await sessions('save', session)
+        except SessionBusy:
+            yield _sse("error", {"error": SESSION_BUSY}).encode()
+        except Rejected as e:
+            yield _sse("error", {"error": e.message, "retry_after": e.retry_after}).encode()
+        except Exception as e:
+            overload = upstream_overload(e)
+            if overload is not None:
+                yield _sse("error", {"error": overload.message, "retry_after": overload.retry_after}).encode()
+            else:
+                yield _sse("error", {"error": f"An error occurred: {str(e)}"}).encode()
+        finally:
+            slot.release()
+            trace_log.record(path, 200, request_started, data, done)
+
+    return generate(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+
+
+@app.route('/api/leads', methods=['GET'])
+async def get_leads():
+    """
+    Get captured leads, one page at a time - same parameters as the Flask server
+    Protected endpoint - add authentication in production!
+    """
+    try:
+        leads, next_cursor = await asyncio.to_thread(
+            lead_store.get_lead_store().query,
+            limit=request.args.get('limit', lead_store.DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor', type=int),
+            **lead_store.filters_from_args(request.args)
+        )
+        return jsonify({
+            "leads": leads,
+            "count": len(leads),
+            "next_cursor": next_cursor
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/leads/export', methods=['GET'])
+async def export_leads():
+    """
+    Export leads as CSV, streamed straight from the database
+    Protected endpoint - add authentication in production!
+    """
+    try:
+        store = lead_store.get_lead_store()
+        if not await asyncio.to_thread(store.has_leads):
+            return "No leads to export", 404
+
+        filters = lead_store.filters_from_args(request.args)
+
+        async def generate():
+            # SQLite connections are per-thread, so read every chunk on one
+            # dedicated worker thread
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=1) as reader:
+                chunks = store.iter_csv(**filters)
+                while True:
+                    chunk = await loop.run_in_executor(reader, next, chunks, None)
+                    if chunk is None:
+                        return
+                    yield chunk.encode()
+
+        return generate(), 200, {
+            "Content-Type": "text/csv",
+            "Content-Disposition": "attachment; filename=leads.csv"
+        }
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/reset', methods=['POST'])
+async def reset_session():
+    """Reset a conversation session"""
+    try:
+        data = await request.get_json()
+        session_id = data.get('session_id', 'default')
+
+        async with session_locks.hold(session_id):
+            found = await sessions('reset', session_id)
+
+        if found:
+            return jsonify({"message": "Session reset successfully"}), 200
+        else:
+            return jsonify({"message": "Session not found"}), 404
+
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/features', methods=['GET'])
+async def get_features():
+    """Get current feature status"""
+    try:
+        # Process-wide flags - no need to build a chatbot (and load the SDK) to read them
+        return jsonify(feature_flags.as_dict()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/features/<feature_name>', methods=['POST'])
+async def toggle_feature(feature_name):
+    """
+    Enable/disable features
+    Protected endpoint - add authentication in production!
+
+    Body: {"enabled": true/false}
+    """
+    try:
+        data = await request.get_json()
+        enabled = data.get('enabled', True)
+
+        # Feature flags are process-wide, so this applies to every session
+        if not feature_flags.set(feature_name, enabled):
+            return jsonify({"error": f"Unknown feature: {feature_name}"}), 404
+
+        return jsonify({
+            "feature": feature_name,
+            "enabled": enabled,
+            "message": f"Feature {feature_name} {'enabled' if enabled else 'disabled'}"
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/stats', methods=['GET'])
+async def get_stats():
+    """
+    Get chatbot usage statistics - same parameters as the Flask server
+    """
+    try:
+        lead_stats = await asyncio.to_thread(
+            lead_store.get_lead_store().stats,
+            hours=request.args.get('hours', 24, type=int),
+            days=request.args.get('days', 30, type=int)
+        )
+        outbox_stats = await asyncio.to_thread(outbox.stats)
+        stats = {
+            "active_sessions": await sessions('__len__'),
+            "sessions": await sessions('stats'),
+            "token_usage": _chatbot.get_usage_stats() if _chatbot else {},
+            "faq_cache": faq_cache.stats() if faq_cache is not None else {},
+            "routing": _chatbot.router.stats() if _chatbot else {},
+            "coalescing": _chatbot.aflights.stats() if _chatbot else {},
+            "concurrency": {
+                "session_locks": session_locks.stats(),
+                "idempotency": idempotency_cache.stats()
+            },
+            "admission": admission.stats(),
+            "upstream": get_resilience().stats(),
+            "outbox": outbox_stats,
+            "traces": trace_log.stats(),
+            "token_budget": token_ledger.stats(),
+            **lead_stats
+        }
+
+        return jsonify(stats), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Serve the widget HTML (for testing)
+@app.route('/widget')
+async def widget():
+    """Serve the chat widget for testing"""
+    return await send_from_directory('.', 'web_widget_enhanced.html')
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+
+    if not os.environ.get('ANTHROPIC_API_KEY'):
+        print("⚠️  WARNING: ANTHROPIC_API_KEY environment variable not set!")
+        print("   The chatbot will not work without an API key.")
+    else:
+        print("✅ API key found")
+
+    print(f"\n🚀 Starting Async Vital Mechanical Chatbot API on port {port}")
+    print(f"   For production, run: hypercorn api_server_async:app --bind 0.0.0.0:{port}\n")
+
+    app.run(host='0.0.0.0', port=port)
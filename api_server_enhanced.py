@@ -2,24 +2,128 @@
 Enhanced API Server with Lead Capture, Booking, and Quote Capabilities
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import json
+import threading
+import time
 from datetime import datetime
-from chatbot_enhanced import EnhancedVitalMechanicalChatbot
+from chatbot_enhanced import STARTUP_WARMUP, EnhancedVitalMechanicalChatbot, preload
+from chatbot_tools import feature_flags
+from session_store import create_session_store
+import lead_store
+import metrics
+from faq_cache import get_faq_cache
+from admission import AdmissionControl, Rejected, client_ip, upstream_overload
+from resilience import get_resilience
+from outbox import get_outbox
+from traces import get_trace_log
+from token_budget import DEFAULT_TENANT, get_token_ledger
+from session_guard import SessionLocks, SessionBusy, IdempotencyCache, idempotency_key
 
 app = Flask(__name__)
 CORS(app)
 
-# Store chatbot instances per session
-chatbot_sessions = {}
 
-# Directory for storing data
-DATA_DIR = "data"
+# Per-route timings for /metrics
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    rule = request.url_rule.rule if request.url_rule else None
+    metrics.observe_request(request.method, rule, response.status_code, g.get("request_started"))
+    # Sampled chat turns for the trace log; a stream that started records itself when it ends
+    if trace_log.enabled and (
+        request.endpoint == 'chat' or (request.endpoint == 'chat_stream' and response.status_code != 200)
+    ):
+        trace_log.record(request.path, response.status_code, g.get("request_started"),
+                         request.get_json(silent=True), g.get("chat_result"))
+    return response
+
+
+# Per-session conversation state - SESSION_BACKEND=sqlite or redis shares it
+# between worker processes, so any worker can serve any session
+session_store = create_session_store()
+
+# Turns for one session run in order; retried requests replay their result
+session_locks = SessionLocks()
+idempotency_cache = IdempotencyCache()
+SESSION_BUSY = "Another message for this session is still being processed"
+
+# Per-IP and per-session rate limits, and the cap on chat turns in flight
+admission = AdmissionControl()
+
+# Token budgets per session and tenant, checked before a turn is admitted
+token_ledger = get_token_ledger()
+
+# Answers to common opening questions, shared by all sessions (None if disabled)
+faq_cache = get_faq_cache()
+
+# Background delivery of tool side effects (CRM pushes), including any
+# still queued from before a restart
+outbox = get_outbox()
+
+# Sampled, redacted chat turns for replay (off unless TRACE_SAMPLE_RATE is set)
+trace_log = get_trace_log()
+
+# Sessions, admission, upstream, token usage and outbox state on /metrics
+metrics.register_server_metrics(
+    session_store, admission, lambda: _chatbot.get_usage_stats() if _chatbot else None, outbox
+)
+
+# One chatbot per process, shared by all sessions
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+
+def get_chatbot() -> EnhancedVitalMechanicalChatbot:
+    """Get the shared chatbot, creating it on first use"""
+    global _chatbot
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                _chatbot = EnhancedVitalMechanicalChatbot()
+    return _chatbot
+
+
+def warm_up():
+    """
+    Load the SDK and first-turn artifacts and build the chatbot, so the
+    first chat doesn't pay for them. Run on a background thread once the
+    server is answering /health
+    """
+    try:
+        preload()
+        get_chatbot()
+    except Exception as e:
+        print(f"Warm-up failed, loading on first request instead: {e}")
+
+
+# Directory for storing data (shared with the chatbot's lead store)
+DATA_DIR = lead_store.DATA_DIR
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
+def _rejected(error: Rejected):
+    """Response for a request turned away before any model call (429/503 with Retry-After, 413)"""
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after is not None else {}
+    return jsonify({"error": error.message, "retry_after": error.retry_after}), error.status, headers
+
+
+def _request_ip() -> str:
+    """Client address for rate limiting"""
+    return client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+
+
+def _request_tenant() -> str:
+    """Tenant whose token budget a turn counts against (set X-Tenant-ID at the proxy)"""
+    return request.headers.get("X-Tenant-ID") or DEFAULT_TENANT
+
+
 @app.route('/', methods=['GET'])
 def home():
     """API information endpoint"""
@@ -34,18 +138,35 @@ def home():
         },
         "endpoints": {
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
             "leads": "/api/leads",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: stage, tool and route latency histograms, tokens, sessions (404 when METRICS=off)"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint
+    Stays 200 while the Anthropic API is failing (the process is fine); "status"
+    is "degraded" and "upstream" shows the circuit breaker while answers come
+    from the fallback
+    """
+    breaker = get_resilience().breaker.stats()
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
         "service": "vital-mechanical-chatbot",
+        "upstream": breaker,
         "timestamp": datetime.now().isoformat()
     }), 200
 
@@ -76,48 +197,191 @@ def chat():
 
         user_message = data['message']
         session_id = data.get('session_id', 'default')
+        admission.check_rate(_request_ip(), session_id)
+        budget = token_ledger.for_turn(session_id, _request_tenant())
+
+        try:
+            chatbot = get_chatbot()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
+
+        key = idempotency_key(request.headers, data)
+
+        # One turn at a time per session - a double submit waits for the
+        # first - then bounded concurrency. The slot is only taken once the
+        # lock is held, so a waiting duplicate doesn't keep one from others
+        with session_locks.hold(session_id):
+            body = idempotency_cache.get(session_id, key)
+            if body is not None:
+                g.chat_result = body
+                return jsonify(body), 200, {"Idempotent-Replay": "true"}
+
+            with admission.in_flight.slot():
+                # Get or create conversation state for this session
+                session = session_store.get_or_create(session_id)
+
+                # Get response with any tool calls
+                result = chatbot.chat(user_message, session.conversation_history, budget)
+                session_store.save(session)
+
+                body = {
+                    "response": result["response"],
+                    "actions": result.get("actions", []),
+                    "usage": result.get("usage", {}),
+                    "cached": result.get("cached", False),
+                    "coalesced": result.get("coalesced", False),
+                    "degraded": result.get("degraded", False),
+                    "history_tokens": result.get("history_tokens", 0),
+                    "model": result.get("model"),
+                    "session_id": session_id,
+                    "timestamp": datetime.now().isoformat()
+                }
+                idempotency_cache.put(session_id, key, body)
+                g.chat_result = body
+
+        return jsonify(body), 200
+
+    except Rejected as e:
+        return _rejected(e)
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
+    except Exception as e:
+        overload = upstream_overload(e)
+        if overload is not None:
+            return _rejected(overload)
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-        # Get or create chatbot for this session
-        if session_id not in chatbot_sessions:
-            try:
-                chatbot_sessions[session_id] = EnhancedVitalMechanicalChatbot()
-            except ValueError as e:
-                return jsonify({"error": str(e)}), 500
 
-        chatbot = chatbot_sessions[session_id]
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        # Get response with any tool calls
-        result = chatbot.chat(user_message)
 
-        return jsonify({
-            "response": result["response"],
-            "actions": result.get("actions", []),
-            "session_id": session_id,
-            "timestamp": datetime.now().isoformat()
-        }), 200
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events)
 
-    except Exception as e:
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    Expected JSON: same as /api/chat
+
+    Streams events as they happen:
+        event: text         data: {"text": "..."}            (reply chunks)
+        event: tool_use     data: {"tool": ..., "input": ...}
+        event: tool_result  data: {"tool": ..., "result": ...}
+        event: done         data: {"response", "actions", "usage", "session_id",
+                                   "first_token_ms", "total_ms", "timestamp"}
+        event: error        data: {"error": "..."}
+    """
+    data = request.get_json(silent=True)
+
+    if not data or 'message' not in data:
+        return jsonify({"error": "Missing 'message' in request body"}), 400
+
+    user_message = data['message']
+    session_id = data.get('session_id', 'default')
+
+    try:
+        chatbot = get_chatbot()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 500
+
+    # Turned away before the stream starts, so clients get a real 429/503
+    try:
+        admission.check_rate(_request_ip(), session_id)
+        budget = token_ledger.for_turn(session_id, _request_tenant())
+        slot = admission.in_flight.acquire()
+    except Rejected as e:
+        return _rejected(e)
+
+    key = idempotency_key(request.headers, data)
+    request_started, path = g.get("request_started"), request.path
+
+    def generate():
+        nonlocal slot
+        started = time.perf_counter()
+        first_token_ms = None
+        done = None
+        try:
+            # Held for the whole stream - a double submit waits for the first,
+            # handing back its in-flight slot while it waits
+            with session_locks.hold(session_id, on_wait=slot.release):
+                done = idempotency_cache.get(session_id, key)
+                if done is not None:
+                    yield _sse("text", {"text": done["response"]})
+                    yield _sse("done", done)
+                    return
+                if slot.released:
+                    slot = admission.in_flight.acquire()
+
+                session = session_store.get_or_create(session_id)
+                try:
+                    for event in chatbot.chat_stream(user_message, session.conversation_history, budget):
+                        if event["event"] == "text" and first_token_ms is None:
+                            first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                        elif event["event"] == "done":
+                            event["data"] = {
+                                **event["data"],
+                                "session_id": session_id,
+                                "first_token_ms": first_token_ms,
+                                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                                "timestamp": datetime.now().isoformat()
+                            }
+                            idempotency_cache.put(session_id, key, event["data"])
+                            done = event["data"]
+                        yield _sse(event["event"], event["data"])
+                finally:
+                    session_store.save(session)
+        except SessionBusy:
+            yield _sse("error", {"error": SESSION_BUSY})
+        except Rejected as e:
+            yield _sse("error", {"error": e.message, "retry_after": e.retry_after})
+        except Exception as e:
+            overload = upstream_overload(e)
+            if overload is not None:
+                yield _sse("error", {"error": overload.message, "retry_after": overload.retry_after})
+            else:
+                yield _sse("error", {"error": f"An error occurred: {str(e)}"})
+        finally:
+            slot.release()
+            trace_log.record(path, 200, request_started, data, done)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Don't let proxies buffer the stream
+        }
+    )
+    # Frees the slot even if the client went away before the stream started
+    response.call_on_close(slot.release)
+    return response
 
 
 @app.route('/api/leads', methods=['GET'])
 def get_leads():
     """
-    Get all captured leads
+    Get captured leads, one page at a time
     Protected endpoint - add authentication in production!
+
+    Query parameters (all optional):
+        limit: page size (default 100, max 1000)
+        cursor: next_cursor from the previous page
+        since / until: ISO timestamp range (since inclusive, until exclusive)
+        urgency: emergency, urgent, normal or flexible
+        service: service interest (case-insensitive)
     """
     try:
-        leads_file = os.path.join(DATA_DIR, "leads.json")
-
-        if not os.path.exists(leads_file):
-            return jsonify({"leads": [], "count": 0}), 200
-
-        with open(leads_file, 'r') as f:
-            leads = json.load(f)
+        leads, next_cursor = lead_store.get_lead_store().query(
+            limit=request.args.get('limit', lead_store.DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor', type=int),
+            **lead_store.filters_from_args(request.args)
+        )
 
         return jsonify({
             "leads": leads,
-            "count": len(leads)
+            "count": len(leads),
+            "next_cursor": next_cursor
         }), 200
 
     except Exception as e:
@@ -127,30 +391,18 @@ def get_leads():
 @app.route('/api/leads/export', methods=['GET'])
 def export_leads():
     """
-    Export leads as CSV
+    Export leads as CSV, streamed straight from the database
+    Accepts the same filters as /api/leads
     Protected endpoint - add authentication in production!
     """
     try:
-        leads_file = os.path.join(DATA_DIR, "leads.json")
+        store = lead_store.get_lead_store()
 
-        if not os.path.exists(leads_file):
+        if not store.has_leads():
             return "No leads to export", 404
 
-        with open(leads_file, 'r') as f:
-            leads = json.load(f)
-
-        # Convert to CSV
-        import csv
-        import io
-
-        output = io.StringIO()
-        if leads:
-            writer = csv.DictWriter(output, fieldnames=leads[0].keys())
-            writer.writeheader()
-            writer.writerows(leads)
-
-        response = app.response_class(
-            response=output.getvalue(),
+        response = Response(
+            stream_with_context(store.iter_csv(**lead_store.filters_from_args(request.args))),
             status=200,
             mimetype='text/csv'
         )
@@ -168,12 +420,16 @@ def reset_session():
         data = request.get_json()
         session_id = data.get('session_id', 'default')
 
-        if session_id in chatbot_sessions:
-            chatbot_sessions[session_id].reset_conversation()
+        with session_locks.hold(session_id):
+            found = session_store.reset(session_id)
+
+        if found:
             return jsonify({"message": "Session reset successfully"}), 200
         else:
             return jsonify({"message": "Session not found"}), 404
 
+    except SessionBusy:
+        return jsonify({"error": SESSION_BUSY}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -182,9 +438,8 @@ def reset_session():
 def get_features():
     """Get current feature status"""
     try:
-        # Create a temp chatbot to check features
-        chatbot = EnhancedVitalMechanicalChatbot()
-        return jsonify(chatbot.features), 200
+        # Process-wide flags - no need to build a chatbot (and load the SDK) to read them
+        return jsonify(feature_flags.as_dict()), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -201,12 +456,9 @@ def toggle_feature(feature_name):
         data = request.get_json()
         enabled = data.get('enabled', True)
 
-        # Update all active sessions
-        for session_id, chatbot in chatbot_sessions.items():
-            if enabled:
-                chatbot.enable_feature(feature_name)
-            else:
-                chatbot.disable_feature(feature_name)
+        # Feature flags are process-wide, so this applies to every session
+        if not feature_flags.set(feature_name, enabled):
+            return jsonify({"error": f"Unknown feature: {feature_name}"}), 404
 
         return jsonify({
             "feature": feature_name,
@@ -222,41 +474,35 @@ def toggle_feature(feature_name):
 def get_stats():
     """
     Get chatbot usage statistics
+    Lead counts come from aggregates maintained as leads are captured
+
+    Query parameters (optional):
+        hours: hourly lead buckets to return (default 24)
+        days: daily lead buckets to return (default 30)
     """
     try:
-        leads_file = os.path.join(DATA_DIR, "leads.json")
-
         stats = {
-            "active_sessions": len(chatbot_sessions),
-            "total_leads": 0,
-            "leads_by_urgency": {},
-            "leads_by_service": {},
-            "recent_activity": []
+            "active_sessions": len(session_store),
+            "sessions": session_store.stats(),
+            "token_usage": _chatbot.get_usage_stats() if _chatbot else {},
+            "faq_cache": faq_cache.stats() if faq_cache is not None else {},
+            "routing": _chatbot.router.stats() if _chatbot else {},
+            "coalescing": _chatbot.flights.stats() if _chatbot else {},
+            "concurrency": {
+                "session_locks": session_locks.stats(),
+                "idempotency": idempotency_cache.stats()
+            },
+            "admission": admission.stats(),
+            "upstream": get_resilience().stats(),
+            "outbox": outbox.stats(),
+            "traces": trace_log.stats(),
+            "token_budget": token_ledger.stats(),
+            **lead_store.get_lead_store().stats(
+                hours=request.args.get('hours', 24, type=int),
+                days=request.args.get('days', 30, type=int)
+            )
         }
 
-        if os.path.exists(leads_file):
-            with open(leads_file, 'r') as f:
-                leads = json.load(f)
-
-            stats["total_leads"] = len(leads)
-
-            # Count by urgency
-            for lead in leads:
-                urgency = lead.get('urgency', 'normal')
-                stats["leads_by_urgency"][urgency] = stats["leads_by_urgency"].get(urgency, 0) + 1
-
-            # Count by service
-            for lead in leads:
-                service = lead.get('service_interest', 'Unknown')
-                stats["leads_by_service"][service] = stats["leads_by_service"].get(service, 0) + 1
-
-            # Get recent leads (last 5)
-            stats["recent_activity"] = sorted(
-                leads,
-                key=lambda x: x.get('timestamp', ''),
-                reverse=True
-            )[:5]
-
         return jsonify(stats), 200
 
     except Exception as e:
@@ -286,9 +532,13 @@ if __name__ == '__main__':
     print(f"\n📊 Endpoints:")
     print(f"   Health: http://localhost:{port}/health")
     print(f"   Chat: http://localhost:{port}/api/chat")
+    print(f"   Chat (streaming): http://localhost:{port}/api/chat/stream")
     print(f"   Leads: http://localhost:{port}/api/leads")
     print(f"   Stats: http://localhost:{port}/api/stats")
     print(f"   Widget Test: http://localhost:{port}/widget")
     print(f"\n")
 
+    if STARTUP_WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,89 @@
+"""
+Coalescing benchmark: a burst of identical opening questions
+
+Starts the mock Anthropic API, then the server with first-turn coalescing
+on and then off (FAQ cache disabled, so every request would otherwise
+reach the model). Fires a burst of new sessions asking the same question
+at once and reports the turns that went to the model, latency and the
+coalesce ratio, from /api/stats.
+
+Usage:
+    python benchmarks/bench_coalescing.py --burst 50 100 --latency 0.8 --server flask
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from loadgen import http_request, run_load, wait_until_up
+from load_test import SERVERS, HOST, BENCH_DIR, REPO_DIR, start_process, stop_process
+
+QUESTION = "What services do you offer?"
+
+
+async def run_burst(name, port, env, workdir, burst, coalescing):
+    command = [part.format(port=port) for part in SERVERS[name]]
+    process = start_process(command, {
+        **env,
+        "PORT": str(port),
+        "COALESCE_FIRST_TURNS": "on" if coalescing else "off",
+    }, workdir)
+    try:
+        await wait_until_up(HOST, port)
+        requests = [
+            ("POST", "/api/chat", {"message": QUESTION, "session_id": f"burst-{coalescing}-{burst}-{i}"})
+            for i in range(burst)
+        ]
+        summary = await run_load(HOST, port, requests, burst)
+        _, _, body = await http_request(HOST, port, "GET", "/api/stats")
+        stats = json.loads(body)
+        summary["model_turns"] = stats["token_usage"]["turns"]
+        summary["coalescing"] = stats.get("coalescing", {})
+        return summary
+    finally:
+        stop_process(process)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="chatbot-coalesce-")
+    mock = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"), "--port", str(args.mock_port),
+         "--latency", str(args.latency)],
+        os.environ.copy(), workdir
+    )
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "mock-key",
+        "ANTHROPIC_BASE_URL": f"http://{HOST}:{args.mock_port}",
+        "PYTHONPATH": REPO_DIR,
+        "FAQ_CACHE_SIZE": "0",
+        "RATE_LIMIT_IP_PER_MINUTE": "0",
+        "MAX_IN_FLIGHT": "0",
+    }
+
+    await asyncio.sleep(0.5)
+    print(f"Mock model latency: {args.latency}s, server: {args.server}\n")
+    print(f"{'burst':>6} {'coalescing':>11} {'model turns':>12} {'p50 ms':>9} {'p99 ms':>9} {'ratio':>7}")
+    try:
+        for burst in args.burst:
+            for coalescing in (True, False):
+                summary = await run_burst(args.server, args.port, env, workdir, burst, coalescing)
+                ratio = summary["coalescing"].get("coalesce_ratio", 0.0)
+                print(f"{burst:6d} {'on' if coalescing else 'off':>11} {summary['model_turns']:12d} "
+                      f"{summary['p50_ms']:9.1f} {summary['p99_ms']:9.1f} {ratio:7.2f}  {summary['statuses']}",
+                      flush=True)
+    finally:
+        stop_process(mock)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identical first-question burst with and without coalescing")
+    parser.add_argument("--server", default="flask", choices=sorted(SERVERS))
+    parser.add_argument("--burst", nargs="+", type=int, default=[20, 100])
+    parser.add_argument("--latency", type=float, default=0.8, help="mock model latency (seconds)")
+    parser.add_argument("--port", type=int, default=5150)
+    parser.add_argument("--mock-port", type=int, default=8788)
+    asyncio.run(main(parser.parse_args()))
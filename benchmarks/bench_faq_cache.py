@@ -0,0 +1,95 @@
+"""
+FAQ cache benchmark: lookup latency and hit rate
+
+Fills the cache with the questions in example_questions.py, then looks up
+the same questions reworded (different case, punctuation and filler words)
+plus questions that should miss, and checks that lookalikes of personal or
+specific questions (another name, a negation) never get their answers.
+
+Usage:
+    python benchmarks/bench_faq_cache.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from example_questions import EXAMPLE_QUESTIONS
+from faq_cache import FAQCache
+
+UNRELATED = [
+    "My rooftop unit on 5th Ave is leaking refrigerant, can someone come Tuesday?",
+    "Can you quote a chiller replacement for a 40,000 sq ft office?",
+    "Do you service boilers in Tacoma on weekends?",
+]
+
+# (cached question, lookalike that must not get its answer)
+LOOKALIKES = [
+    ("Hi, I am John Smith from Acme Corp. What services do you offer?",
+     "Hi, I am Jane Smith from Acme Corp. What services do you offer?"),
+    ("Hi, I am John Smith from Acme Corp. What services do you offer?",
+     "Hi, I am John Smyth from Acme Corp. What services do you offer?"),
+    ("my name is john smith, what services do you offer?",
+     "my name is joan smith, what services do you offer?"),
+    ("Do you service boilers in Tacoma?", "Do you not service boilers in Tacoma?"),
+    ("Do you service boilers in Tacoma?", "Do you service boilers in Tacoma or Kent?"),
+]
+
+
+def reword(question: str) -> str:
+    """A near-duplicate of a question, as a customer might type it"""
+    return f"Hi! {question.lower().rstrip('?')} please??"
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_lookups(cache: FAQCache, questions, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        for question in questions:
+            start = time.perf_counter()
+            cache.get(question)
+            timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    questions = [q for group in EXAMPLE_QUESTIONS.values() for q in group]
+
+    cache = FAQCache()
+    for question in questions:
+        cache.put(question, f"Answer to: {question}")
+
+    exact = time_lookups(cache, questions, iterations)
+    reworded = [reword(q) for q in questions]
+    near = time_lookups(cache, reworded, iterations)
+    hits = sum(cache.get(q) is not None for q in reworded)
+    misses = time_lookups(cache, UNRELATED, iterations)
+    false_hits = sum(cache.get(q) is not None for q in UNRELATED)
+
+    lookalikes = FAQCache()
+    for question, _ in LOOKALIKES:
+        lookalikes.put(question, f"Answer to: {question}")
+    wrong_answers = sum(lookalikes.get(lookalike) is not None for _, lookalike in LOOKALIKES)
+
+    print("=" * 60)
+    print("FAQ answer cache")
+    print("=" * 60)
+    print(f"Cached questions:        {len(questions)}")
+    for label, timings in (("Exact hit", exact), ("Reworded", near), ("Miss", misses)):
+        print(f"{label + ' p50 / p99:':25s}{percentile(timings, 50):6.0f} / {percentile(timings, 99):6.0f} us")
+    print()
+    print(f"Reworded questions hit:  {hits} of {len(reworded)}")
+    print(f"Unrelated questions hit: {false_hits} of {len(UNRELATED)}")
+    print(f"Lookalikes answered:     {wrong_answers} of {len(LOOKALIKES)}")
+    print(f"Hit rate (all lookups):  {cache.stats()['hit_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+History windowing benchmark: input tokens per turn over a long conversation
+
+Plays the questions in example_questions.py as one long conversation against
+the mock Anthropic API, once with the full history re-sent every turn and
+once with history windowing, and prints the input tokens of each turn.
+
+Usage:
+    python benchmarks/bench_history.py [turns] [budget]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+MOCK_PORT = 8791
+os.environ["ANTHROPIC_API_KEY"] = "mock-key"
+os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{MOCK_PORT}"
+# Measure the model path only
+os.environ["FAQ_CACHE_SIZE"] = "0"
+
+from chatbot_enhanced import EnhancedVitalMechanicalChatbot
+from example_questions import EXAMPLE_QUESTIONS
+from history_window import HISTORY_TOKEN_BUDGET
+
+
+def run_conversation(budget: int, turns: int):
+    """Per-turn total input tokens (uncached + cache write + cache read)"""
+    chatbot = EnhancedVitalMechanicalChatbot()
+    chatbot.history_budget = budget
+    questions = [q for group in EXAMPLE_QUESTIONS.values() for q in group]
+
+    history = []
+    per_turn = []
+    for turn in range(turns):
+        usage = chatbot.chat(questions[turn % len(questions)], history)["usage"]
+        per_turn.append(
+            usage["input_tokens"]
+            + usage["cache_creation_input_tokens"]
+            + usage["cache_read_input_tokens"]
+        )
+    return per_turn, chatbot.usage_totals["compactions"]
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else HISTORY_TOKEN_BUDGET
+
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"),
+         "--port", str(MOCK_PORT), "--latency", "0"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        time.sleep(1.0)
+        full, _ = run_conversation(0, turns)
+        windowed, compactions = run_conversation(budget, turns)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    print("=" * 60)
+    print(f"Input tokens per turn ({turns} turns, budget {budget})")
+    print("=" * 60)
+    print(f"{'turn':>6} {'full history':>14} {'windowed':>10}")
+    for turn in range(0, turns, max(1, turns // 12)):
+        print(f"{turn + 1:6d} {full[turn]:14d} {windowed[turn]:10d}")
+    print(f"{turns:6d} {full[-1]:14d} {windowed[-1]:10d}")
+    print()
+    print(f"Total input tokens:  full {sum(full):,}  windowed {sum(windowed):,}")
+    print(f"Compactions:         {compactions}")
+
+
+if __name__ == "__main__":
+    main()
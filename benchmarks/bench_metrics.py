@@ -0,0 +1,65 @@
+"""
+Metrics overhead benchmark
+
+Times the instrumentation a chat turn adds - the stage spans, a tool
+timing and the token counters - with metrics on and off, and how long
+rendering /metrics takes once the histograms have series.
+
+Usage:
+    python benchmarks/bench_metrics.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import metrics
+
+# Roughly what one tool-using turn records
+STAGES = ("history", "retrieval", "model_first", "tools", "model_followup")
+USAGE = {"input_tokens": 1200, "output_tokens": 300, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 4000}
+
+
+def one_turn():
+    for stage in STAGES:
+        with metrics.span(stage):
+            pass
+    metrics.observe_tool("capture_lead", 0.002, True)
+    metrics.observe_stage("turn", 1.5)
+    metrics.count_tokens("claude-sonnet-4-20250514", USAGE)
+
+
+def time_per_turn(iterations: int) -> float:
+    """Average instrumentation cost per turn in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        one_turn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    metrics.METRICS_ENABLED = False
+    off_us = time_per_turn(iterations)
+    metrics.METRICS_ENABLED = True
+    on_us = time_per_turn(iterations)
+
+    start = time.perf_counter()
+    body = metrics.registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    print("=" * 60)
+    print("Metrics overhead per chat turn")
+    print("=" * 60)
+    print(f"Iterations:        {iterations}")
+    print(f"Metrics off:       {off_us:8.2f} us per turn")
+    print(f"Metrics on:        {on_us:8.2f} us per turn")
+    print(f"Render /metrics:   {render_ms:8.2f} ms ({len(body.splitlines())} lines)")
+    print("\nFor scale: a model call takes hundreds of milliseconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Retrieval benchmark: knowledge-base lookup latency and prompt size
+
+Runs every question in example_questions.py through the knowledge index and
+compares the tokens it injects per turn with pasting the whole knowledge file
+into the prompt.
+
+Usage:
+    python benchmarks/bench_retrieval.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from example_questions import EXAMPLE_QUESTIONS
+from knowledge_index import KNOWLEDGE_FILE, TOP_K, KnowledgeIndex, load_index
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)"""
+    return len(text) // 4
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    questions = [q for group in EXAMPLE_QUESTIONS.values() for q in group]
+
+    with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    start = time.perf_counter()
+    KnowledgeIndex.build(text)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    index = load_index()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    injected = []
+    misses = 0
+    for _ in range(iterations):
+        for question in questions:
+            t0 = time.perf_counter()
+            index.context_for(question)
+            timings.append((time.perf_counter() - t0) * 1e6)
+
+    for question in questions:
+        context = index.context_for(question)
+        injected.append(estimate_tokens(context))
+        misses += not context
+
+    full_tokens = estimate_tokens(text)
+    avg_injected = sum(injected) / len(injected)
+
+    print("=" * 60)
+    print("Knowledge retrieval")
+    print("=" * 60)
+    print(f"Sections indexed:        {len(index.chunks)}")
+    print(f"Index build:             {build_ms:8.1f} ms")
+    print(f"Index load (.npz):       {load_ms:8.1f} ms")
+    print(f"Questions:               {len(questions)} x {iterations} iterations, top_k={TOP_K}")
+    print(f"Lookup p50 / p95 / p99:  {percentile(timings, 50):.0f} / "
+          f"{percentile(timings, 95):.0f} / {percentile(timings, 99):.0f} us")
+    print()
+    print(f"Whole knowledge file:    {full_tokens:6d} tokens per turn")
+    print(f"Retrieved (avg):         {avg_injected:6.0f} tokens per turn")
+    print(f"Retrieved (max):         {max(injected):6d} tokens per turn")
+    print(f"No relevant section:     {misses} of {len(questions)} questions")
+    print(f"Reduction:               {full_tokens / max(avg_injected, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
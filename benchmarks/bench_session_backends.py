@@ -0,0 +1,141 @@
+"""
+Session backend benchmark: serialization and per-turn store overhead
+
+1. Encodes conversation histories of increasing length as JSON and msgpack
+   (size, encode and decode time).
+2. Replays chat turns (load session, add a user/assistant exchange, save)
+   against the memory, SQLite and Redis backends - Redis through
+   fake_redis.py, started locally - and reports the overhead per turn.
+
+Usage:
+    python benchmarks/bench_session_backends.py [sessions] [turns]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from session_store import (
+    SessionStore, SQLiteSessionStore, RedisSessionStore,
+    serialize_history, deserialize_history,
+)
+from fake_redis import FakeRedisServer
+
+USER_TEXT = "We have a rooftop unit at our Bellevue office that keeps short cycling. Can someone take a look this week?"
+ASSISTANT_TEXT = (
+    "I'm sorry to hear about the short cycling - that usually points to a thermostat, refrigerant "
+    "or airflow issue, and it's worth having a technician look before it wears out the compressor. "
+) * 3
+
+
+def make_history(turns: int):
+    """A realistic history: text turns with one capture_lead exchange"""
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{USER_TEXT} ({turn})"})
+        if turn == 1:
+            history.append({"role": "assistant", "content": [
+                {"type": "text", "text": "Let me record your details."},
+                {"type": "tool_use", "id": "toolu_01", "name": "capture_lead",
+                 "input": {"name": "Sam Lee", "email": "sam@example.com", "urgency": "urgent"}},
+            ]})
+            history.append({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": "toolu_01",
+                 "content": '{"success": true, "lead_id": 42}', "is_error": False},
+            ]})
+        history.append({"role": "assistant", "content": ASSISTANT_TEXT})
+    return history
+
+
+def time_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_serialization():
+    print(f"{'turns':>6} {'json bytes':>11} {'msgpack bytes':>14} "
+          f"{'json enc/dec us':>16} {'msgpack enc/dec us':>19}")
+    for turns in (1, 5, 10, 20, 40):
+        history = make_history(turns)
+        row = [f"{turns:6d}"]
+        timings = []
+        for serializer in ("json", "msgpack"):
+            data = serialize_history(history, serializer)
+            assert deserialize_history(data) == history
+            row.append(f"{len(data):>11d}" if serializer == "json" else f"{len(data):>14d}")
+            encode = time_us(lambda: serialize_history(history, serializer), 200)
+            decode = time_us(lambda: deserialize_history(data), 200)
+            timings.append(f"{encode:7.1f} / {decode:6.1f}")
+        print(" ".join(row), f"{timings[0]:>16}", f"{timings[1]:>19}")
+
+
+def replay_turns(store, sessions: int, turns: int):
+    """Per-turn store overhead (load + save), in microseconds"""
+    timings = []
+    for turn in range(turns):
+        for i in range(sessions):
+            start = time.perf_counter()
+            session = store.get_or_create(f"bench-{i}")
+            session.conversation_history.append({"role": "user", "content": USER_TEXT})
+            session.conversation_history.append({"role": "assistant", "content": ASSISTANT_TEXT})
+            store.save(session)
+            timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def start_fake_redis():
+    """Run fake_redis in a background thread; returns its port"""
+    loop = asyncio.new_event_loop()
+    server = FakeRedisServer()
+    port = loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return port
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print("=" * 72)
+    print("History serialization")
+    print("=" * 72)
+    bench_serialization()
+
+    import redis
+    port = start_fake_redis()
+    workdir = tempfile.mkdtemp(prefix="chatbot-sessions-")
+
+    print()
+    print("=" * 72)
+    print(f"Store overhead per turn ({sessions} sessions x {turns} turns)")
+    print("=" * 72)
+    for serializer in ("json", "msgpack"):
+        backends = {
+            "memory": SessionStore(max_sessions=sessions * 2),
+            "sqlite": SQLiteSessionStore(os.path.join(workdir, f"sessions-{serializer}.db"), serializer=serializer),
+            "redis": RedisSessionStore(
+                redis.Redis(port=port), serializer=serializer,
+                key_prefix=f"bench:{serializer}:", active_key=f"bench:{serializer}-active"
+            ),
+        }
+        for name, store in backends.items():
+            if name == "memory" and serializer == "msgpack":
+                continue  # Not serialized
+            timings = sorted(replay_turns(store, sessions, turns))
+            label = name if name == "memory" else f"{name} ({serializer})"
+            stats = store.stats()
+            written = f"{stats['avg_bytes_per_save']} B/save" if "avg_bytes_per_save" in stats else "not serialized"
+            print(f"{label:18s} avg {sum(timings) / len(timings):8.1f} us  "
+                  f"p50 {timings[len(timings) // 2]:8.1f} us  p99 {timings[int(len(timings) * 0.99)]:8.1f} us  {written}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Startup benchmark: per-session chatbot construction cost
+
+Compares building a chatbot the old way (new Anthropic client, freshly
+formatted system prompt and tool list per session) against the shared
+client and prebuilt prompt/tool artifacts.
+
+Usage:
+    python benchmarks/bench_session_setup.py [iterations]
+"""
+
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark-key")
+
+from anthropic import Anthropic
+from chatbot_enhanced import EnhancedVitalMechanicalChatbot, build_system_prompt
+from chatbot_tools import feature_flags
+from tool_registry import registry
+from llm_client import reset_clients
+
+
+def construct_uncached():
+    """Per-session construction as it worked before the shared artifacts"""
+    client = Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+    system_prompt = build_system_prompt.__wrapped__()
+    tools = copy.deepcopy(registry.build_definitions(feature_flags.enabled))
+    return client, system_prompt, tools
+
+
+def construct_shared():
+    """Per-session construction with the shared client and cached prompt/tools"""
+    return EnhancedVitalMechanicalChatbot()
+
+
+def time_per_call(fn, iterations: int) -> float:
+    """Average wall time per call in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    reset_clients()
+    first_start = time.perf_counter()
+    construct_shared()
+    first_us = (time.perf_counter() - first_start) * 1e6
+
+    uncached_us = time_per_call(construct_uncached, iterations)
+    shared_us = time_per_call(construct_shared, iterations)
+
+    print("=" * 60)
+    print("Per-session chatbot construction")
+    print("=" * 60)
+    print(f"Iterations:                 {iterations}")
+    print(f"First shared construction:  {first_us:10.1f} us (builds client + artifacts)")
+    print(f"Uncached (old) per session: {uncached_us:10.1f} us")
+    print(f"Shared per session:         {shared_us:10.1f} us")
+    print(f"Speedup:                    {uncached_us / shared_us:10.1f}x")
+    print("\nNote: the uncached path also pays a fresh TLS handshake on its")
+    print("first request; the shared client reuses keep-alive connections.")
+
+
+if __name__ == "__main__":
+    main()
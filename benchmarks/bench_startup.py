@@ -0,0 +1,170 @@
+"""
+Cold start benchmark
+
+Times what a visitor waits for when a platform that scales to zero starts
+a fresh process: importing the server module, the first /health response
+after spawning it, and the first chat reply (against the mock Anthropic
+API, so it's the server's own warm-up, not the model).
+
+The import of the server module is checked against a budget: it must take
+less than --budget-ms, and the modules that are deferred to the first
+turn (DEFERRED) must not be imported with it. Either failure exits
+non-zero. Timings depend on the machine; the default budget leaves room
+for a slow container.
+
+Usage:
+    python benchmarks/bench_startup.py --server flask --runs 5
+    python benchmarks/bench_startup.py --server asgi --budget-ms 500
+    python benchmarks/bench_startup.py --no-warmup    # everything loads on the first chat
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from loadgen import http_request, wait_until_up
+from load_test import SERVERS, HOST, BENCH_DIR, REPO_DIR, start_process, stop_process
+
+# Module each server command imports
+SERVER_MODULES = {
+    "flask": "api_server_enhanced",
+    "asgi": "api_server_async",
+}
+
+# Loaded on the first turn (or by the background warm-up), never at import
+DEFERRED = ("anthropic", "numpy")
+
+IMPORT_BUDGET_MS = 750
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        (total ms, heaviest top-level packages as (name, ms), deferred modules that got imported)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, env={**os.environ, "PYTHONPATH": REPO_DIR},
+        capture_output=True, text=True, check=True
+    )
+    total_us = 0
+    packages: Dict[str, int] = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        root = name.split(".")[0]
+        imported.add(root)
+        if name == module:
+            total_us = cumulative
+        elif indent <= 3 or root not in packages:
+            # Outermost import of each package is its cumulative cost
+            packages[root] = max(packages.get(root, 0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:8]
+    return (
+        total_us / 1000,
+        [(name, us / 1000) for name, us in heaviest],
+        [name for name in DEFERRED if name in imported],
+    )
+
+
+async def cold_start(args, workdir: str) -> Dict[str, float]:
+    """Spawn the server; seconds to the first /health and to the first chat reply"""
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "mock-key",
+        "ANTHROPIC_BASE_URL": f"http://{HOST}:{args.mock_port}",
+        "PYTHONPATH": REPO_DIR,
+        "PORT": str(args.port),
+        "SESSION_BACKEND": "memory",
+        "STARTUP_WARMUP": "off" if args.no_warmup else "on",
+    }
+    command = [part.format(port=args.port) for part in SERVERS[args.server]]
+    start = time.perf_counter()
+    server = start_process(command, env, workdir)
+    try:
+        await wait_until_up(HOST, args.port, timeout=args.timeout)
+        health = time.perf_counter() - start
+        if args.chat_delay:
+            await asyncio.sleep(args.chat_delay)
+        sent = time.perf_counter()
+        status, _, _ = await http_request(HOST, args.port, "POST", "/api/chat",
+                                          {"message": "Hello", "session_id": "cold-start"}, timeout=args.timeout)
+        if status != 200:
+            raise RuntimeError(f"first chat returned {status}")
+        return {"health_s": health, "first_chat_s": time.perf_counter() - sent}
+    finally:
+        stop_process(server)
+
+
+async def run_cold_starts(args) -> List[Dict[str, float]]:
+    workdir = tempfile.mkdtemp(prefix="chatbot-startup-")
+    mock = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"),
+         "--port", str(args.mock_port), "--latency", "0"],
+        os.environ.copy(), workdir
+    )
+    try:
+        await asyncio.sleep(0.5)
+        return [await cold_start(args, workdir) for _ in range(args.runs)]
+    finally:
+        stop_process(mock)
+
+
+def main(args) -> int:
+    module = SERVER_MODULES[args.server]
+    import_ms, heaviest, deferred_loaded = measure_import(module)
+    runs = asyncio.run(run_cold_starts(args))
+
+    print("=" * 60)
+    print(f"Cold start: {args.server} ({module}), {args.runs} runs"
+          + (", warm-up off" if args.no_warmup else ""))
+    print("=" * 60)
+    print(f"Import {module}: {import_ms:7.1f} ms (budget {args.budget_ms} ms)")
+    for name, ms in heaviest:
+        print(f"    {name:24s} {ms:7.1f} ms")
+    health = [run["health_s"] * 1000 for run in runs]
+    first_chat = [run["first_chat_s"] * 1000 for run in runs]
+    print(f"Spawn to first /health: median {statistics.median(health):7.1f} ms, max {max(health):7.1f} ms")
+    print(f"First chat reply:       median {statistics.median(first_chat):7.1f} ms, max {max(first_chat):7.1f} ms"
+          + (f" (sent {args.chat_delay}s after /health)" if args.chat_delay else ""))
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"import took {import_ms:.1f} ms, over the {args.budget_ms} ms budget")
+    if deferred_loaded:
+        failures.append(f"{', '.join(deferred_loaded)} imported with {module}; they should load on first use")
+    if failures:
+        print("\nOVER BUDGET:")
+        for message in failures:
+            print(f"  {message}")
+        return 1
+    print("\nOK: within the import budget")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure server import time, time to first /health and first chat")
+    parser.add_argument("--server", default="flask", choices=sorted(SERVERS))
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to time")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="import time budget for the server module")
+    parser.add_argument("--chat-delay", type=float, default=0.0,
+                        help="seconds between /health and the first chat (time for the warm-up to finish)")
+    parser.add_argument("--no-warmup", action="store_true", help="start with STARTUP_WARMUP=off")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=5400)
+    parser.add_argument("--mock-port", type=int, default=8807)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,333 @@
+"""
+Offline benchmark suite with regression baselines
+
+Starts the mock Anthropic API and a server pointed at it, then replays two
+workloads from example_questions.py with concurrent simulated visitors:
+
+- questions: every EXAMPLE_QUESTIONS entry as the opening turn of a new session
+- conversations: every CONVERSATION_SCRIPTS script, turn by turn, on its own session
+
+Reports throughput, latency percentiles and tokens per turn for each
+workload, and the memory each session costs the server. The FAQ cache and
+first-turn coalescing are off so every turn reaches the (mock) model and
+token counts are the same on every run.
+
+Results are compared with benchmarks/baselines/<server>.json. A metric worse
+than its tolerance is flagged and the script exits non-zero. After an
+intended change, record a new baseline with --save-baseline. Timings
+depend on the machine, so only compare baselines recorded on the same one.
+
+Usage:
+    python benchmarks/bench_suite.py --server flask --visitors 20 --rounds 5
+    python benchmarks/bench_suite.py --server asgi --save-baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loadgen import http_request, percentile, wait_until_up
+from load_test import SERVERS, HOST, BENCH_DIR, REPO_DIR, start_process, stop_process
+
+sys.path.insert(0, REPO_DIR)
+
+from example_questions import EXAMPLE_QUESTIONS, CONVERSATION_SCRIPTS
+
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+# (metric, better direction, allowed relative change) checked per workload
+WORKLOAD_CHECKS = (
+    ("throughput_rps", "higher", 0.15),
+    ("p50_ms", "lower", 0.25),
+    ("p95_ms", "lower", 0.25),
+    ("p99_ms", "lower", 0.25),
+    ("input_tokens_per_turn", "lower", 0.02),
+    ("output_tokens_per_turn", "lower", 0.02),
+)
+MEMORY_CHECKS = (
+    ("session_store_bytes_per_session", "lower", 0.10),
+)
+
+Conversation = Tuple[str, List[str]]
+
+
+def build_workloads(rounds: int) -> Dict[str, List[Conversation]]:
+    """Sessions to replay per workload, as (session_id, messages)"""
+    questions = [
+        question
+        for category in EXAMPLE_QUESTIONS.values()
+        for question in category
+    ]
+    return {
+        "questions": [
+            (f"bench-q-{round_number}-{index}", [question])
+            for round_number in range(rounds)
+            for index, question in enumerate(questions)
+        ],
+        "conversations": [
+            (f"bench-c-{round_number}-{name}", turns)
+            for round_number in range(rounds)
+            for name, turns in CONVERSATION_SCRIPTS.items()
+        ],
+    }
+
+
+async def replay(port: int, conversations: List[Conversation], visitors: int, timeout: float) -> Dict[str, Any]:
+    """
+    Replay conversations with a number of concurrent visitors
+    Each visitor sends one session's turns in order, waiting for each reply
+
+    Returns:
+        Throughput, latency percentiles (ms) of answered turns, status
+        counts and average tokens per answered turn
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for conversation in conversations:
+        queue.put_nowait(conversation)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    tokens = {"input": 0, "output": 0}
+    actions = 0
+
+    async def visitor():
+        nonlocal actions
+        while True:
+            try:
+                session_id, messages = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for message in messages:
+                start = time.perf_counter()
+                try:
+                    status, _, body = await http_request(
+                        HOST, port, "POST", "/api/chat",
+                        {"message": message, "session_id": session_id}, timeout=timeout
+                    )
+                    key = str(status)
+                except Exception as e:
+                    key = type(e).__name__
+                elapsed = (time.perf_counter() - start) * 1000
+                statuses[key] = statuses.get(key, 0) + 1
+                if key != "200":
+                    break  # The rest of the script depends on this turn
+                latencies.append(elapsed)
+                result = json.loads(body)
+                usage = result.get("usage") or {}
+                tokens["input"] += (
+                    usage.get("input_tokens", 0)
+                    + usage.get("cache_creation_input_tokens", 0)
+                    + usage.get("cache_read_input_tokens", 0)
+                )
+                tokens["output"] += usage.get("output_tokens", 0)
+                actions += len(result.get("actions") or [])
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(visitor() for _ in range(visitors)))
+    wall = time.perf_counter() - begin
+
+    turns = len(latencies)
+    return {
+        "sessions": len(conversations),
+        "turns": turns,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(turns / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        "statuses": statuses,
+        "errors": sum(count for key, count in statuses.items() if key != "200"),
+        "input_tokens_per_turn": round(tokens["input"] / turns, 1) if turns else 0.0,
+        "output_tokens_per_turn": round(tokens["output"] / turns, 1) if turns else 0.0,
+        "actions": actions,
+    }
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """
+    Resident memory of a process and its children in KB (hypercorn serves
+    from a worker process). None where /proc isn't available
+    """
+    try:
+        total = 0
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    total += rss_kb(int(child)) or 0
+        return total
+    except OSError:
+        return None
+
+
+async def run_suite(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    mock = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"),
+         "--port", str(args.mock_port), "--latency", str(args.latency)],
+        os.environ.copy(), workdir
+    )
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "mock-key",
+        "ANTHROPIC_BASE_URL": f"http://{HOST}:{args.mock_port}",
+        "PYTHONPATH": REPO_DIR,
+        "PORT": str(args.port),
+        # Every turn reaches the model, so token counts don't depend on timing
+        "FAQ_CACHE_SIZE": "0",
+        "COALESCE_FIRST_TURNS": "off",
+        # All visitors come from one address and scripts outpace a person typing;
+        # measure the server, not admission control
+        "RATE_LIMIT_IP_PER_MINUTE": "0",
+        "RATE_LIMIT_SESSION_PER_MINUTE": "0",
+        "MAX_IN_FLIGHT": "0",
+        "SESSION_BACKEND": "memory",
+    }
+    command = [part.format(port=args.port) for part in SERVERS[args.server]]
+    server = start_process(command, env, workdir)
+    try:
+        await asyncio.sleep(0.5)
+        await wait_until_up(HOST, args.port)
+
+        # Warm up (chatbot, client, knowledge index) before taking the memory baseline
+        await http_request(HOST, args.port, "POST", "/api/chat",
+                           {"message": "Hello", "session_id": "bench-warmup"}, timeout=args.timeout)
+        rss_before = rss_kb(server.pid)
+
+        workloads = {}
+        for name, conversations in build_workloads(args.rounds).items():
+            workloads[name] = await replay(args.port, conversations, args.visitors, args.timeout)
+
+        rss_after = rss_kb(server.pid)
+        _, _, body = await http_request(HOST, args.port, "GET", "/api/stats")
+        sessions = json.loads(body)["sessions"]
+    finally:
+        stop_process(server)
+        stop_process(mock)
+
+    measured = sum(workload["sessions"] for workload in workloads.values())
+    active = sessions.get("active_sessions", 0)
+    return {
+        "server": args.server,
+        "config": {
+            "visitors": args.visitors,
+            "rounds": args.rounds,
+            "latency": args.latency,
+        },
+        "workloads": workloads,
+        "memory": {
+            "sessions": active,
+            "session_store_bytes_per_session": round(sessions.get("memory_bytes", 0) / active) if active else 0,
+            "rss_kb_per_session": (
+                round((rss_after - rss_before) / measured, 1)
+                if rss_before is not None and rss_after is not None and measured else None
+            ),
+        },
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _check(label: str, current: Optional[float], baseline: Optional[float], direction: str, tolerance: float) -> Optional[str]:
+    """A regression message if current is worse than baseline by more than tolerance"""
+    if current is None or not baseline:
+        return None
+    change = (current - baseline) / baseline
+    worse = -change if direction == "higher" else change
+    if worse > tolerance:
+        return f"{label}: {baseline} -> {current} ({change:+.1%}, allowed {tolerance:.0%})"
+    return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Regressions of results against a baseline recorded with the same config"""
+    regressions = []
+    for name, workload in results["workloads"].items():
+        reference = baseline["workloads"].get(name)
+        if reference is None:
+            continue
+        if workload["errors"] > reference["errors"]:
+            regressions.append(f"{name}.errors: {reference['errors']} -> {workload['errors']}")
+        for metric, direction, tolerance in WORKLOAD_CHECKS:
+            message = _check(f"{name}.{metric}", workload.get(metric), reference.get(metric), direction, tolerance)
+            if message:
+                regressions.append(message)
+    for metric, direction, tolerance in MEMORY_CHECKS:
+        message = _check(f"memory.{metric}", results["memory"].get(metric),
+                         baseline["memory"].get(metric), direction, tolerance)
+        if message:
+            regressions.append(message)
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    config = results["config"]
+    print("=" * 72)
+    print(f"Benchmark suite: {results['server']} server, {config['visitors']} visitors, "
+          f"{config['rounds']} rounds, mock latency {config['latency']}s")
+    print("=" * 72)
+    for name, workload in results["workloads"].items():
+        print(f"{name:14s} {workload['turns']:5d} turns  {workload['throughput_rps']:7.1f} req/s  "
+              f"p50 {workload['p50_ms']:7.1f}  p95 {workload['p95_ms']:7.1f}  p99 {workload['p99_ms']:7.1f} ms")
+        print(f"{'':14s} tokens/turn in {workload['input_tokens_per_turn']:7.1f}  "
+              f"out {workload['output_tokens_per_turn']:5.1f}  actions {workload['actions']}  "
+              f"statuses {workload['statuses']}")
+    memory = results["memory"]
+    rss = memory["rss_kb_per_session"]
+    print(f"{'memory':14s} {memory['sessions']} sessions, "
+          f"{memory['session_store_bytes_per_session']} bytes each in the store"
+          + (f", {rss} KB RSS each" if rss is not None else ""))
+
+
+def main(args) -> int:
+    results = asyncio.run(run_suite(args))
+    print_results(results)
+
+    path = args.baseline or os.path.join(BASELINE_DIR, f"{args.server}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {path}")
+        return 0
+
+    if not os.path.exists(path):
+        print(f"\nNo baseline at {path} - record one with --save-baseline")
+        return 0
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print(f"\nBaseline {path} was recorded with {baseline.get('config')}; not comparing")
+        return 0
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"\nREGRESSION against {path} (recorded {baseline.get('recorded_at')}):")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"\nOK: within tolerance of {path} (recorded {baseline.get('recorded_at')})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the example questions and scripts against a mock model")
+    parser.add_argument("--server", default="flask", choices=sorted(SERVERS))
+    parser.add_argument("--visitors", type=int, default=20, help="concurrent simulated visitors")
+    parser.add_argument("--rounds", type=int, default=5, help="times each question and script is replayed")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock model latency (seconds)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-turn timeout (seconds)")
+    parser.add_argument("--baseline", help="baseline file (default benchmarks/baselines/<server>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--port", type=int, default=5300)
+    parser.add_argument("--mock-port", type=int, default=8797)
+    sys.exit(main(parser.parse_args()))
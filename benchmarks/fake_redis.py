@@ -0,0 +1,219 @@
+"""
+Local fake Redis server for testing the redis session backend
+
+Speaks enough of the Redis protocol for redis-py (RESP2 or 3) and
+RedisSessionStore: HELLO, PING, GET, SET (EX/PX/NX/XX), DEL, EXISTS, EXPIRE, TTL,
+SCAN, DBSIZE, FLUSHDB, CLIENT and the sorted-set commands ZADD, ZREM, ZCARD and
+ZREMRANGEBYSCORE. Data lives in memory; key expiry is lazy.
+
+Usage:
+    python benchmarks/fake_redis.py --port 6390
+    SESSION_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 python api_server_enhanced.py
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Optional, Dict, List, Tuple
+
+
+class FakeRedisServer:
+    """Minimal asyncio Redis-protocol server"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.zsets: Dict[bytes, Dict[bytes, float]] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening; returns the bound port"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = {"proto": 2}  # HELLO 3 switches the connection to RESP3
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                self.commands += 1
+                writer.write(self.execute(command, connection))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # Inline command (e.g. from redis-cli or telnet)
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            parts.append((await reader.readexactly(length + 2))[:-2])
+        return parts
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def execute(self, command: List[bytes], connection: Dict[str, int]) -> bytes:
+        """Run one command and return its RESP-encoded reply"""
+        name = command[0].upper()
+        args = command[1:]
+        null = b"_\r\n" if connection["proto"] == 3 else b"$-1\r\n"
+
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"HELLO":
+            connection["proto"] = int(args[0]) if args else 2
+            return self._hello(connection["proto"])
+        if name in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"FLUSHDB":
+            self.data.clear()
+            self.zsets.clear()
+            return b"+OK\r\n"
+        if name == b"GET":
+            value = self._live(args[0])
+            return null if value is None else _bulk(value)
+        if name == b"SET":
+            return self._set(args, null)
+        if name == b"DEL":
+            removed = [key for key in args if self._live(key) is not None]
+            for key in removed:
+                del self.data[key]
+            return _int(len(removed))
+        if name == b"EXISTS":
+            return _int(sum(1 for key in args if self._live(key) is not None))
+        if name == b"EXPIRE":
+            value = self._live(args[0])
+            if value is None:
+                return _int(0)
+            self.data[args[0]] = (value, time.time() + int(args[1]))
+            return _int(1)
+        if name == b"TTL":
+            if self._live(args[0]) is None:
+                return _int(-2)
+            expires = self.data[args[0]][1]
+            return _int(-1 if expires is None else int(expires - time.time()))
+        if name == b"DBSIZE":
+            return _int(sum(1 for key in list(self.data) if self._live(key) is not None))
+        if name == b"SCAN":
+            return self._scan(args)
+        if name == b"ZADD":
+            return self._zadd(args)
+        if name == b"ZREM":
+            zset = self.zsets.get(args[0], {})
+            return _int(sum(1 for member in args[1:] if zset.pop(member, None) is not None))
+        if name == b"ZCARD":
+            return _int(len(self.zsets.get(args[0], {})))
+        if name == b"ZREMRANGEBYSCORE":
+            zset = self.zsets.get(args[0], {})
+            low, high = float(args[1]), float(args[2])
+            removed = [member for member, score in zset.items() if low <= score <= high]
+            for member in removed:
+                del zset[member]
+            return _int(len(removed))
+        return b"-ERR unknown command '" + name + b"'\r\n"
+
+    @staticmethod
+    def _hello(proto: int) -> bytes:
+        fields = [b"server", b"redis", b"version", b"7.0.0", b"proto"]
+        if proto == 3:
+            return b"%3\r\n" + b"".join(_bulk(f) for f in fields) + _int(3)
+        return b"*6\r\n" + b"".join(_bulk(f) for f in fields) + _int(2)
+
+    def _set(self, args: List[bytes], null: bytes) -> bytes:
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires = None
+        i = 0
+        while i < len(options):
+            if options[i] == b"EX":
+                expires = time.time() + int(args[2 + i + 1])
+                i += 1
+            elif options[i] == b"PX":
+                expires = time.time() + int(args[2 + i + 1]) / 1000
+                i += 1
+            i += 1
+        exists = self._live(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return null
+        self.data[key] = (value, expires)
+        return b"+OK\r\n"
+
+    def _zadd(self, args: List[bytes]) -> bytes:
+        # ZADD key [NX|XX] score member [score member ...]
+        zset = self.zsets.setdefault(args[0], {})
+        rest = args[1:]
+        flags = set()
+        while rest and rest[0].upper() in (b"NX", b"XX", b"GT", b"LT", b"CH"):
+            flags.add(rest[0].upper())
+            rest = rest[1:]
+        added = 0
+        for i in range(0, len(rest), 2):
+            score, member = float(rest[i]), rest[i + 1]
+            exists = member in zset
+            if (b"NX" in flags and exists) or (b"XX" in flags and not exists):
+                continue
+            added += not exists
+            zset[member] = score
+        return _int(added)
+
+    def _scan(self, args: List[bytes]) -> bytes:
+        # Whole keyspace in one page; cursor 0 ends the iteration
+        pattern = b"*"
+        for i in range(1, len(args) - 1):
+            if args[i].upper() == b"MATCH":
+                pattern = args[i + 1]
+        keys = [
+            key for key in list(self.data)
+            if self._live(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern.decode())
+        ]
+        return b"*2\r\n" + _bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(_bulk(key) for key in keys)
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _int(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+async def _main(args):
+    server = FakeRedisServer()
+    port = await server.start(args.host, args.port)
+    print(f"Fake Redis listening on redis://{args.host}:{port}/0", flush=True)
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Redis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
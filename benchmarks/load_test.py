@@ -0,0 +1,105 @@
+"""
+Load test: Flask server vs async (ASGI) server
+
+Starts the mock Anthropic API, then each server in turn pointed at it, and
+drives concurrent /api/chat requests (one session per request). Reports
+throughput and latency percentiles at each concurrency level.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 10 50 200 --latency 0.8
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+from loadgen import run_load, wait_until_up
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+HOST = "127.0.0.1"
+
+SERVERS = {
+    "flask": [sys.executable, os.path.join(REPO_DIR, "api_server_enhanced.py")],
+    "asgi": [sys.executable, "-m", "hypercorn", "api_server_async:app", "--bind", f"{HOST}:{{port}}"],
+}
+
+
+def start_process(command, env, cwd):
+    return subprocess.Popen(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def benchmark_server(name, port, env, workdir, concurrency_levels, per_level):
+    command = [part.format(port=port) for part in SERVERS[name]]
+    process = start_process(command, {**env, "PORT": str(port)}, workdir)
+    try:
+        await wait_until_up(HOST, port)
+        results = []
+        for concurrency in concurrency_levels:
+            total = max(per_level, concurrency)
+            requests = [
+                ("POST", "/api/chat", {"message": "What services do you offer?",
+                                       "session_id": f"load-{name}-{concurrency}-{i}"})
+                for i in range(total)
+            ]
+            summary = await run_load(HOST, port, requests, concurrency)
+            summary["server"] = name
+            results.append(summary)
+            print(f"  {name:5s} c={concurrency:<4d} {summary['throughput_rps']:8.1f} req/s  "
+                  f"p50 {summary['p50_ms']:8.1f} ms  p99 {summary['p99_ms']:8.1f} ms  "
+                  f"{summary['statuses']}", flush=True)
+        return results
+    finally:
+        stop_process(process)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="chatbot-load-")
+    mock = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"),
+         "--port", str(args.mock_port), "--latency", str(args.latency)],
+        os.environ.copy(), workdir
+    )
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "mock-key",
+        "ANTHROPIC_BASE_URL": f"http://{HOST}:{args.mock_port}",
+        "PYTHONPATH": REPO_DIR,
+        # Every session asks the same question; measure model calls, not cache hits
+        "FAQ_CACHE_SIZE": "0",
+        "COALESCE_FIRST_TURNS": "off",
+        # All requests come from one address; measure the servers, not admission control
+        "RATE_LIMIT_IP_PER_MINUTE": "0",
+        "MAX_IN_FLIGHT": "0",
+    }
+
+    try:
+        await asyncio.sleep(0.5)
+        print(f"Mock model latency: {args.latency}s, {args.requests} requests per level\n")
+        for offset, name in enumerate(args.servers):
+            await benchmark_server(name, args.port + offset, env, workdir,
+                                   args.concurrency, args.requests)
+    finally:
+        stop_process(mock)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Flask and ASGI servers under concurrent load")
+    parser.add_argument("--servers", nargs="+", default=["flask", "asgi"], choices=sorted(SERVERS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[10, 50, 200])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.8, help="mock model latency (seconds)")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--mock-port", type=int, default=8787)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,162 @@
+"""
+Minimal asyncio HTTP load generator used by the benchmark scripts
+(no third-party client needed)
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+async def http_request(
+    host: str,
+    port: int,
+    method: str,
+    path: str,
+    payload: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 60.0
+) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Send one HTTP/1.1 request on a fresh connection
+
+    Returns:
+        (status, headers, body) - chunked bodies are decoded
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+
+    async def _send():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            lines = [
+                f"{method} {path} HTTP/1.1",
+                f"Host: {host}:{port}",
+                "Connection: close",
+                f"Content-Length: {len(body)}",
+            ]
+            if payload is not None:
+                lines.append("Content-Type: application/json")
+            for name, value in (headers or {}).items():
+                lines.append(f"{name}: {value}")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        return raw
+
+    raw = await asyncio.wait_for(_send(), timeout)
+    head, _, content = raw.partition(b"\r\n\r\n")
+    head_lines = head.decode("latin-1").split("\r\n")
+    status = int(head_lines[0].split(" ")[1])
+    response_headers = {}
+    for line in head_lines[1:]:
+        name, _, value = line.partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+
+    if response_headers.get("transfer-encoding", "").lower() == "chunked":
+        content = _dechunk(content)
+    return status, response_headers, content
+
+
+def _dechunk(data: bytes) -> bytes:
+    """Decode a chunked transfer-encoded body"""
+    out = bytearray()
+    while data:
+        size_line, _, data = data.partition(b"\r\n")
+        size = int(size_line.split(b";")[0] or b"0", 16)
+        if size == 0:
+            break
+        out += data[:size]
+        data = data[size + 2:]
+    return bytes(out)
+
+
+async def wait_until_up(host: str, port: int, path: str = "/health", timeout: float = 30.0) -> float:
+    """Poll until the server answers; returns seconds waited"""
+    start = time.perf_counter()
+    while True:
+        try:
+            status, _, _ = await http_request(host, port, "GET", path, timeout=2.0)
+            if status == 200:
+                return time.perf_counter() - start
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            pass
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"server on port {port} did not come up")
+        await asyncio.sleep(0.02)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list (0 if empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+async def run_load(
+    host: str,
+    port: int,
+    requests: List[Tuple[str, str, Optional[Dict[str, Any]]]],
+    concurrency: int,
+    timeout: float = 60.0,
+    rate: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Drive a list of (method, path, payload) requests at a fixed concurrency
+
+    With rate (requests/second), requests start on that schedule whether or
+    not earlier ones have finished (open loop), up to concurrency at once.
+
+    Returns:
+        Summary with throughput, latency percentiles (ms) of successful
+        requests, status counts and how fast 429/503s came back
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, item in enumerate(requests):
+        queue.put_nowait((index, item))
+
+    latencies: List[float] = []
+    rejected: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker():
+        while True:
+            try:
+                index, (method, path, payload) = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if rate:
+                await asyncio.sleep(max(0.0, begin + index / rate - time.perf_counter()))
+            start = time.perf_counter()
+            try:
+                status, _, _ = await http_request(host, port, method, path, payload, timeout=timeout)
+                key = str(status)
+            except Exception as e:
+                key = type(e).__name__
+            elapsed = (time.perf_counter() - start) * 1000
+            statuses[key] = statuses.get(key, 0) + 1
+            if key == "200":
+                latencies.append(elapsed)
+            elif key in ("429", "503"):
+                rejected.append(elapsed)
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - begin
+
+    return {
+        "requests": len(requests),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        "statuses": statuses,
+        "rejected_p50_ms": round(percentile(rejected, 50), 1),
+    }
@@ -0,0 +1,279 @@
+"""
+Local mock of the Anthropic Messages API
+
+Deterministic stand-in for the model so load tests and benchmarks don't
+spend tokens. Speaks enough of POST /v1/messages for the SDK: plain JSON
+responses, SSE streaming, tool_use turns, max_tokens truncation and 400s
+for requests missing required fields. The same request always gets the
+same reply and token counts.
+
+Point the SDK at it with ANTHROPIC_BASE_URL=http://127.0.0.1:<port>
+
+Usage:
+    python benchmarks/mock_anthropic.py --port 8787 --latency 0.8
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Phrases that make the mock call capture_lead (when the tool is offered)
+LEAD_TRIGGERS = ("contact me", "call me", "email me", "schedule", "quote")
+
+REQUIRED_FIELDS = ("model", "max_tokens", "messages")
+
+_ids = itertools.count(1)
+
+
+def _estimate_tokens(value: Any) -> int:
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(json.dumps(value, default=str)) // 4)
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> Tuple[str, bool]:
+    """Text of the last user message, and whether it carries tool results"""
+    if not messages:
+        return "", False
+    content = messages[-1].get("content", "")
+    if isinstance(content, str):
+        return content, False
+    texts = [block.get("text", "") for block in content if block.get("type") == "text"]
+    has_tool_result = any(block.get("type") == "tool_result" for block in content)
+    return " ".join(texts), has_tool_result
+
+
+def build_response(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Deterministic Messages API response for a request body"""
+    messages = body.get("messages", [])
+    text, has_tool_result = _last_user_text(messages)
+    tool_names = {tool.get("name") for tool in body.get("tools") or []}
+    tools_allowed = (body.get("tool_choice") or {}).get("type") != "none"
+
+    if (
+        not has_tool_result
+        and tools_allowed
+        and "capture_lead" in tool_names
+        and any(trigger in text.lower() for trigger in LEAD_TRIGGERS)
+    ):
+        content = [
+            {"type": "text", "text": "Let me take down your details."},
+            {
+                "type": "tool_use",
+                "id": f"toolu_mock_{next(_ids)}",
+                "name": "capture_lead",
+                "input": {
+                    "name": "Mock Customer",
+                    "email": "customer@example.com",
+                    "service_interest": "HVAC Services",
+                    "message": text[:200],
+                    "urgency": "normal"
+                }
+            }
+        ]
+        stop_reason = "tool_use"
+    elif has_tool_result:
+        content = [{"type": "text", "text": "Thanks! Our team will reach out to you shortly."}]
+        stop_reason = "end_turn"
+    else:
+        content = [{
+            "type": "text",
+            "text": (
+                "Thanks for reaching out to Vital Mechanical Service. "
+                f"You asked: {text[:120]} - we've served the Puget Sound area since 2004 "
+                "and would be glad to help with HVAC, plumbing, refrigeration and controls."
+            )
+        }]
+        stop_reason = "end_turn"
+
+    # Cut text replies off at max_tokens, like the real API
+    max_tokens = body.get("max_tokens")
+    if stop_reason == "end_turn" and max_tokens and _estimate_tokens(content) > max_tokens:
+        content = [{"type": "text", "text": content[0]["text"][:max_tokens * 4]}]
+        stop_reason = "max_tokens"
+
+    input_tokens = _estimate_tokens([body.get("system"), body.get("tools"), messages])
+    return {
+        "id": f"msg_mock_{next(_ids)}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "mock"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": _estimate_tokens(content),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+    }
+
+
+def stream_events(message: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Break a response into the SSE events the streaming API sends"""
+    start = {**message, "content": [], "stop_reason": None,
+             "usage": {**message["usage"], "output_tokens": 0}}
+    events = [("message_start", {"type": "message_start", "message": start})]
+
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "text":
+            events.append(("content_block_start", {
+                "type": "content_block_start", "index": index,
+                "content_block": {"type": "text", "text": ""}
+            }))
+            words = block["text"].split(" ")
+            for position, word in enumerate(words):
+                chunk = word if position == len(words) - 1 else word + " "
+                events.append(("content_block_delta", {
+                    "type": "content_block_delta", "index": index,
+                    "delta": {"type": "text_delta", "text": chunk}
+                }))
+        else:
+            events.append(("content_block_start", {
+                "type": "content_block_start", "index": index,
+                "content_block": {**block, "input": {}}
+            }))
+            events.append(("content_block_delta", {
+                "type": "content_block_delta", "index": index,
+                "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}
+            }))
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": index}))
+
+    events.append(("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+        "usage": {"output_tokens": message["usage"]["output_tokens"]}
+    }))
+    events.append(("message_stop", {"type": "message_stop"}))
+    return events
+
+
+class MockAnthropicServer:
+    """
+    Minimal asyncio HTTP/1.1 server for the Messages API
+
+    Args:
+        latency: Seconds to wait before answering (time to first token when streaming)
+        token_delay: Seconds between streamed events
+        capacity: Requests generated at once (0 = unlimited); the rest queue,
+            like a saturated upstream
+    """
+
+    def __init__(self, latency: float = 0.5, token_delay: float = 0.0, capacity: int = 0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.capacity = asyncio.Semaphore(capacity) if capacity > 0 else None
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening; returns the bound port"""
+        self._server = await asyncio.start_server(self._handle, host, port, backlog=4096)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                raw = await reader.readexactly(length) if length else b""
+
+                if method == "POST" and path.split("?")[0] == "/v1/messages":
+                    self.requests += 1
+                    body = json.loads(raw or b"{}")
+                    missing = [field for field in REQUIRED_FIELDS if field not in body]
+                    if missing:
+                        self._write(writer, 400, json.dumps({"type": "error", "error": {
+                            "type": "invalid_request_error", "message": f"{missing[0]}: Field required"
+                        }}).encode())
+                    else:
+                        await self._messages(body, writer)
+                else:
+                    self._write(writer, 404, b'{"type":"error","error":{"type":"not_found_error","message":"not found"}}')
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _messages(self, body: Dict[str, Any], writer: asyncio.StreamWriter):
+        message = build_response(body)
+        if self.capacity is not None:
+            async with self.capacity:
+                await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+
+        if not body.get("stream"):
+            self._write(writer, 200, json.dumps(message).encode())
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        for event, data in stream_events(message):
+            frame = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+            writer.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            await writer.drain()
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        writer.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, status: int, payload: bytes):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}.get(status, "OK")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+
+
+async def _main(args):
+    server = MockAnthropicServer(latency=args.latency, token_delay=args.token_delay, capacity=args.capacity)
+    port = await server.start(args.host, args.port)
+    print(f"Mock Anthropic API listening on http://{args.host}:{port} "
+          f"(latency {args.latency}s)", flush=True)
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed events")
+    parser.add_argument("--capacity", type=int, default=0, help="requests served at once (0 = unlimited)")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
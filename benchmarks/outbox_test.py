@@ -0,0 +1,138 @@
+"""
+Outbox delivery test against the stub CRM
+
+Captures leads through the chatbot's capture_lead tool with a slow,
+unreliable CRM configured, and measures how long the tool takes to
+acknowledge (the CRM push is only queued). Then runs the delivery worker
+(`python outbox.py`), kills it mid-run, and starts it again to drain the
+queue. Every lead must reach the CRM at least once; repeats are reported.
+Exits non-zero if any lead was never delivered.
+
+Usage:
+    python benchmarks/outbox_test.py --leads 200 --latency 0.3 --fail-rate 0.3 --drop-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, "..")
+
+
+def capture_leads(count: int, threads: int):
+    """Capture leads through the tool on several threads; returns (lead ids, ack latencies in ms)"""
+    from chatbot_enhanced import EnhancedVitalMechanicalChatbot
+
+    chatbot = EnhancedVitalMechanicalChatbot()
+    lead_ids, latencies = [], []
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        for n in range(offset, count, threads):
+            start = time.perf_counter()
+            result = chatbot._execute_tool("capture_lead", {
+                "name": f"Test Lead {n}",
+                "phone": f"555-{n:04d}",
+                "service_interest": "HVAC Services",
+                "message": "Outbox test",
+                "urgency": "normal"
+            })
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                lead_ids.append(result["lead_id"])
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return lead_ids, latencies
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="chatbot-outbox-")
+    crm_url = f"http://127.0.0.1:{args.crm_port}"
+    env = {
+        **os.environ,
+        "DATA_DIR": os.path.join(workdir, "data"),
+        "GHL_WEBHOOK_URL": crm_url + "/hooks/test",
+        "ANTHROPIC_API_KEY": "mock-key",
+        "OUTBOX_BACKOFF_SECONDS": "0.2",
+        "OUTBOX_TIMEOUT_SECONDS": "2",
+        "OUTBOX_POLL_SECONDS": "0.2",
+        "PYTHONPATH": REPO_DIR,
+    }
+    crm = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stub_crm.py"), "--port", str(args.crm_port),
+         "--latency", str(args.latency), "--fail-rate", str(args.fail_rate), "--drop-rate", str(args.drop_rate)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL  # A killed worker leaves broken pipes
+    )
+    try:
+        time.sleep(0.5)
+
+        # Capture with no workers in this process - the queue is drained below
+        os.environ.update({**env, "OUTBOX_WORKERS": "0"})
+        sys.path.insert(0, REPO_DIR)
+        lead_ids, latencies = capture_leads(args.leads, args.threads)
+        latencies.sort()
+        print(f"CRM: {args.latency}s per call, {args.fail_rate:.0%} rejected, {args.drop_rate:.0%} responses lost")
+        print(f"capture_lead ack: p50 {statistics.median(latencies):.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms "
+              f"(an inline push would add at least {args.latency * 1000:.0f} ms, plus retries)")
+
+        # Run the delivery worker, kill it mid-run, then drain with a fresh one
+        worker = [sys.executable, os.path.join(REPO_DIR, "outbox.py"), "--workers", str(args.workers)]
+        first = subprocess.Popen(worker, env=env, cwd=workdir, stdout=subprocess.DEVNULL)
+        time.sleep(args.kill_after)
+        first.send_signal(signal.SIGKILL)
+        first.wait()
+        print(f"Worker killed after {args.kill_after}s; restarting to drain")
+
+        start = time.perf_counter()
+        drained = subprocess.run(worker + ["--drain"], env=env, cwd=workdir,
+                                 capture_output=True, text=True, timeout=args.timeout)
+        elapsed = time.perf_counter() - start
+        stats = json.loads(drained.stdout[drained.stdout.index("{"):])
+
+        with urllib.request.urlopen(crm_url + "/received") as response:
+            received = json.loads(response.read())["received"]
+    finally:
+        crm.terminate()
+        crm.wait()
+
+    expected = {f"lead-{lead_id}" for lead_id in lead_ids}
+    missing = expected - set(received)
+    repeats = sum(count - 1 for key, count in received.items() if key in expected)
+    print(f"Drained in {elapsed:.1f}s: {stats['events']}")
+    print(f"Leads: {len(expected)}, delivered: {len(expected) - len(missing)}, "
+          f"missing: {len(missing)}, repeat deliveries: {repeats}")
+
+    if missing or stats["events"]["dead"]:
+        print("FAIL: some leads never reached the CRM")
+        return 1
+    print("OK: every lead delivered at least once")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="At-least-once delivery of captured leads to a stub CRM")
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8, help="threads capturing leads")
+    parser.add_argument("--workers", type=int, default=4, help="delivery threads")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub CRM latency (seconds)")
+    parser.add_argument("--fail-rate", type=float, default=0.3)
+    parser.add_argument("--drop-rate", type=float, default=0.05)
+    parser.add_argument("--kill-after", type=float, default=2.0, help="seconds before killing the first worker")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--crm-port", type=int, default=8790)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Overload test: admission control keeps admitted requests fast
+
+Starts the mock Anthropic API with limited capacity (requests beyond it
+queue, like a saturated upstream), then the server with admission control
+on and then off, and sends new chats at a fixed rate well above what the
+upstream can serve.
+
+With admission on, the excess is turned away quickly with 429/503 and the
+requests that are admitted finish within the in-flight queue's bound. With
+it off, every request is accepted and latency grows with the backlog.
+Exits non-zero if admitted p99 latency exceeds the bound.
+
+Usage:
+    python benchmarks/overload_test.py --rate 64 --requests 640 --capacity 16 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from loadgen import run_load, wait_until_up
+from load_test import SERVERS, HOST, BENCH_DIR, REPO_DIR, start_process, stop_process
+
+
+async def run_overload(name, port, env, workdir, args, admission):
+    limits = {
+        "MAX_IN_FLIGHT": str(args.capacity if admission else 0),
+        "ADMISSION_QUEUE": str(args.capacity),
+        "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+    }
+    command = [part.format(port=port) for part in SERVERS[name]]
+    process = start_process(command, {**env, **limits, "PORT": str(port)}, workdir)
+    try:
+        await wait_until_up(HOST, port)
+        requests = [
+            ("POST", "/api/chat", {"message": "Do you service rooftop units?",
+                                   "session_id": f"overload-{admission}-{i}"})
+            for i in range(args.requests)
+        ]
+        return await run_load(HOST, port, requests, args.clients, timeout=120.0, rate=args.rate)
+    finally:
+        stop_process(process)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="chatbot-overload-")
+    mock = start_process(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_anthropic.py"), "--port", str(args.mock_port),
+         "--latency", str(args.latency), "--capacity", str(args.capacity)],
+        os.environ.copy(), workdir
+    )
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "mock-key",
+        "ANTHROPIC_BASE_URL": f"http://{HOST}:{args.mock_port}",
+        "PYTHONPATH": REPO_DIR,
+        # One test client and distinct questions per session: exercise the
+        # in-flight cap, not the per-IP limit, FAQ cache or coalescing
+        "RATE_LIMIT_IP_PER_MINUTE": "0",
+        "FAQ_CACHE_SIZE": "0",
+        "COALESCE_FIRST_TURNS": "off",
+    }
+
+    # Worst case for an admitted request: a full wait in the queue, then its own call
+    bound_ms = (args.queue_timeout + args.latency) * 1000 * 1.5
+
+    await asyncio.sleep(0.5)
+    print(f"Upstream: {args.capacity} at a time, {args.latency}s each "
+          f"(~{args.capacity / args.latency:.0f} req/s); offered {args.rate:.0f} req/s, "
+          f"{args.requests} requests, server: {args.server}\n")
+    failed = False
+    try:
+        for admission in (True, False):
+            summary = await run_overload(args.server, args.port, env, workdir, args, admission)
+            label = "admission on" if admission else "admission off"
+            print(f"{label:14s} {summary['throughput_rps']:7.1f} ok/s  p50 {summary['p50_ms']:8.1f} ms  "
+                  f"p99 {summary['p99_ms']:8.1f} ms  rejected in {summary['rejected_p50_ms']:6.1f} ms (p50)  "
+                  f"{summary['statuses']}", flush=True)
+            if admission and summary["p99_ms"] > bound_ms:
+                failed = True
+                print(f"FAIL: admitted p99 {summary['p99_ms']} ms exceeds bound {bound_ms:.0f} ms")
+    finally:
+        stop_process(mock)
+
+    if not failed:
+        print(f"\nOK: admitted p99 within {bound_ms:.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offer more load than the upstream can serve")
+    parser.add_argument("--server", default="flask", choices=sorted(SERVERS))
+    parser.add_argument("--rate", type=float, default=64, help="new requests per second")
+    parser.add_argument("--requests", type=int, default=640)
+    parser.add_argument("--clients", type=int, default=1000, help="most requests outstanding at once")
+    parser.add_argument("--capacity", type=int, default=16, help="upstream requests served at once (and MAX_IN_FLIGHT)")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock model latency (seconds)")
+    parser.add_argument("--queue-timeout", type=float, default=2.0, help="ADMISSION_QUEUE_TIMEOUT")
+    parser.add_argument("--port", type=int, default=5160)
+    parser.add_argument("--mock-port", type=int, default=8789)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,153 @@
+"""
+Replay captured request traces against a server
+
+Reads the trace log the servers write with TRACE_SAMPLE_RATE set (the
+current file and its rotated ones, see traces.py) and sends each turn to
+the same endpoint, at its original offset from the first trace divided by
+--speed. Turns of one session go in order, so a turn whose slot has come
+waits for the session's previous reply, like a visitor reading it. Session
+ids get a prefix, so replayed conversations never touch live ones.
+
+Reports what the server sustained - throughput, latency percentiles,
+statuses, and how far sends fell behind the recorded schedule - next to
+the latencies the traces recorded.
+
+Usage:
+    python benchmarks/replay_traces.py data/traces/traces.jsonl --url http://127.0.0.1:5000
+    python benchmarks/replay_traces.py data/traces/traces.jsonl --speed 10    # 10x the recorded rate
+    python benchmarks/replay_traces.py data/traces/traces.jsonl --speed 0     # as fast as possible
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+from loadgen import http_request, percentile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from traces import trace_files
+
+
+def load_traces(path: str, limit: int = 0) -> List[Dict[str, Any]]:
+    """Trace records from the log and its rotated files, oldest first"""
+    records = []
+    for name in trace_files(path):
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if "ts" in record and "message" in record:
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+    }
+
+
+async def replay(records: List[Dict[str, Any]], host: str, port: int, args) -> Dict[str, Any]:
+    """Re-send records on their (scaled) schedule, one ordered task per session"""
+    sessions: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for record in records:
+        sessions.setdefault(record["session_id"], []).append(record)
+
+    first = records[0]["ts"]
+    connections = asyncio.Semaphore(args.max_connections)
+    latencies: List[float] = []
+    lags: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def run_session(session_id: str, turns: List[Dict[str, Any]]):
+        for record in turns:
+            due = begin + ((record["ts"] - first) / args.speed if args.speed > 0 else 0.0)
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            async with connections:
+                start = time.perf_counter()
+                lags.append((start - due) * 1000)
+                try:
+                    status, _, _ = await http_request(
+                        host, port, "POST", record.get("endpoint", "/api/chat"),
+                        {"message": record["message"], "session_id": args.session_prefix + session_id},
+                        timeout=args.timeout
+                    )
+                    key = str(status)
+                except Exception as e:
+                    key = type(e).__name__
+                elapsed = (time.perf_counter() - start) * 1000
+            statuses[key] = statuses.get(key, 0) + 1
+            if key == "200":
+                latencies.append(elapsed)
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(run_session(session_id, turns) for session_id, turns in sessions.items()))
+    wall = time.perf_counter() - begin
+
+    return {
+        "turns": len(records),
+        "sessions": len(sessions),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": summarize(latencies),
+        "schedule_lag_ms": summarize(lags),
+        "statuses": statuses,
+    }
+
+
+def main(args) -> int:
+    records = load_traces(args.trace_file, args.limit)
+    if not records:
+        print(f"No traces found at {args.trace_file}")
+        return 1
+
+    target = urlsplit(args.url)
+    span = records[-1]["ts"] - records[0]["ts"]
+    recorded = [record["duration_ms"] for record in records if record.get("status") == 200 and not record.get("error")]
+    pacing = f"{args.speed}x recorded pace" if args.speed > 0 else "as fast as possible"
+
+    print("=" * 60)
+    print(f"Replaying {len(records)} turns over {span:.0f}s of traffic against {args.url} ({pacing})")
+    print("=" * 60)
+    results = asyncio.run(replay(records, target.hostname, target.port or 80, args))
+
+    print(f"Sessions:        {results['sessions']}")
+    print(f"Wall time:       {results['wall_seconds']}s "
+          f"(the traces span {span / args.speed if args.speed > 0 else 0:.1f}s at this pace)")
+    print(f"Throughput:      {results['throughput_rps']} req/s "
+          f"(offered {len(records) / span * args.speed if span and args.speed > 0 else 0:.1f})")
+    print(f"Latency ms:      {results['latency_ms']}")
+    print(f"Recorded ms:     {summarize(recorded)}")
+    print(f"Send lag ms:     {results['schedule_lag_ms']} (how late turns went out)")
+    print(f"Statuses:        {results['statuses']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay sampled request traces against a server")
+    parser.add_argument("trace_file", nargs="?", default=os.path.join("data", "traces", "traces.jsonl"),
+                        help="current trace log; its rotated files are read too")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to replay against")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="pacing multiplier (1 = as recorded, 0 = as fast as possible)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N turns")
+    parser.add_argument("--max-connections", type=int, default=500, help="requests open at once")
+    parser.add_argument("--session-prefix", default="replay-", help="prefix for replayed session ids")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="also write the results as JSON")
+    sys.exit(main(parser.parse_args()))
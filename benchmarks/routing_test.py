@@ -0,0 +1,89 @@
+"""
+Model routing check
+
+Classifies messages whose tier is known - company-fact questions and small
+talk that may go to the fast model, and problems, service needs and sales
+leads that must stay on the main model (they are the turns that call
+capture_lead) - and reports every one routed to the wrong tier, plus the
+tier each example_questions.py entry gets. Exits non-zero on a misroute.
+
+Usage:
+    python benchmarks/routing_test.py
+    python benchmarks/routing_test.py --examples    # also list the example questions
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from example_questions import EXAMPLE_QUESTIONS
+from model_router import classify
+
+FAST = [
+    "What are your hours?",
+    "Where are you located?",
+    "What's your phone number?",
+    "What area do you service?",
+    "What services do you offer?",
+    "Do you offer refrigeration services?",
+    "Do you service commercial refrigeration?",
+    "How long have you been in business?",
+    "Who are some of your clients?",
+    "Thanks, that's helpful",
+    "Hello",
+]
+
+SMART = [
+    "Our rooftop HVAC unit is making a loud grinding noise",
+    "I manage a 40,000 sq ft office and want a maintenance contract for our HVAC",
+    "Our restroom plumbing is clogged",
+    "Our refrigeration walk-in isn't holding temperature",
+    "My water heater keeps tripping the breaker",
+    "We need our boiler replaced before winter",
+    "The drain in our kitchen is backed up",
+    "Can you help with a tenant improvement project?",
+    "Do you have a maintenance contract program?",
+    "Can someone come look at our HVAC controls?",
+    "Please call me at 206-555-0100",
+    "How much does a chiller replacement cost?",
+]
+
+
+def main(args) -> int:
+    cases = [(message, "fast") for message in FAST] + [(message, "smart") for message in SMART]
+    started = time.perf_counter()
+    routes = [classify(message) for message, _ in cases]
+    elapsed_us = (time.perf_counter() - started) / len(cases) * 1e6
+
+    misrouted = [
+        (message, expected, route) for (message, expected), route in zip(cases, routes)
+        if route.tier != expected
+    ]
+
+    print("=" * 60)
+    print(f"Model routing: {len(cases)} cases, {elapsed_us:.0f} us per message")
+    print("=" * 60)
+    for message, expected, route in misrouted:
+        print(f"  expected {expected:5s} got {route.tier:5s} ({route.reason}): {message}")
+
+    if args.examples:
+        print()
+        for group, questions in EXAMPLE_QUESTIONS.items():
+            for question in questions:
+                route = classify(question)
+                print(f"  {group:20s} {route.tier:5s} {route.reason:16s} {question}")
+
+    if misrouted:
+        print(f"\nFAIL: {len(misrouted)} misrouted")
+        return 1
+    print("\nOK: every case routed to its tier")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check model routing decisions")
+    parser.add_argument("--examples", action="store_true", help="list the tier of every example question")
+    sys.exit(main(parser.parse_args()))
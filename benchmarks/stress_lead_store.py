@@ -0,0 +1,68 @@
+"""
+Concurrency stress test for the lead store
+
+Many threads capture leads at once through the chatbot's capture path;
+afterwards every lead must be present exactly once with a unique id.
+Exits non-zero if any write was lost.
+
+Usage:
+    python benchmarks/stress_lead_store.py [threads] [leads_per_thread]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lead_store import LeadStore
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    expected = threads * per_thread
+
+    path = os.path.join(tempfile.mkdtemp(prefix="lead-stress-"), "leads.db")
+    store = LeadStore(path)
+    ids = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def writer(worker: int):
+        barrier.wait()
+        for n in range(per_thread):
+            ids[worker].append(store.add({
+                "name": f"worker-{worker}",
+                "service_interest": "HVAC Services",
+                "message": f"lead {n}",
+                "urgency": "normal",
+                "timestamp": f"2026-01-01T00:00:00.{worker:03d}{n:03d}",
+                "status": "new"
+            }))
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    all_ids = [lead_id for worker_ids in ids for lead_id in worker_ids]
+    stored = store.all()
+    stored_messages = {(lead["name"], lead["message"]) for lead in stored}
+
+    print(f"Threads: {threads}, leads per thread: {per_thread}")
+    print(f"Wrote {expected} leads in {elapsed:.2f}s ({expected / elapsed:.0f} leads/s)")
+    print(f"Stored: {len(stored)}, unique ids returned: {len(set(all_ids))}, "
+          f"unique records: {len(stored_messages)}")
+
+    ok = len(stored) == expected and len(set(all_ids)) == expected and len(stored_messages) == expected
+    print("PASS - no lost or duplicated writes" if ok else "FAIL - lost or duplicated writes")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Local stub of a CRM inbound webhook (stands in for GHL_WEBHOOK_URL)
+
+Accepts JSON POSTs on any path and records them by Idempotency-Key. Can
+be made slow and unreliable: --fail-rate rejects a share of requests with
+503 before recording them, --drop-rate records a request but still answers
+500 (a lost response, so the sender retries and the event arrives twice).
+
+GET /received returns how many times each key arrived.
+
+Usage:
+    python benchmarks/stub_crm.py --port 8790 --latency 0.3 --fail-rate 0.3 --drop-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubCRM(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    drop_rate = 0.0
+    received: Counter = Counter()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            return self._reply(503, {"error": "unavailable"})
+        json.loads(body)
+        key = self.headers.get("Idempotency-Key", "")
+        with self.lock:
+            self.received[key] += 1
+        if random.random() < self.drop_rate:
+            return self._reply(500, {"error": "response lost"})
+        self._reply(200, {"ok": True})
+
+    def do_GET(self):
+        if self.path != "/received":
+            return self._reply(404, {"error": "not found"})
+        with self.lock:
+            self._reply(200, {"received": dict(self.received)})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of a CRM webhook")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests rejected with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share recorded but answered with 500")
+    args = parser.parse_args()
+
+    StubCRM.latency = args.latency
+    StubCRM.fail_rate = args.fail_rate
+    StubCRM.drop_rate = args.drop_rate
+    server = ThreadingHTTPServer((args.host, args.port), StubCRM)
+    print(f"Stub CRM on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,54 +4,40 @@ A customer service chatbot that embodies the company's core values and mission
 """
 
 import os
-from anthropic import Anthropic
+from functools import lru_cache
+from typing import Optional, Dict, Any, List
 from chatbot_config import COMPANY_INFO, CHATBOT_SYSTEM_PROMPT, CONTACT_INFO
+from llm_client import get_client
+from resilience import CircuitOpen, fallback_answer
+from history_window import compact_history
+from model_router import classify
 
 
-class VitalMechanicalChatbot:
+@lru_cache(maxsize=None)
+def build_system_prompt() -> str:
     """
-    Chatbot for Vital Mechanical Service customer inquiries
+    Build comprehensive system prompt with company information
+    Built once per process and shared by every chatbot instance
     """
-
-    def __init__(self, api_key: str = None):
-        """
-        Initialize the chatbot with Anthropic API
-
-        Args:
-            api_key: Anthropic API key (if None, reads from ANTHROPIC_API_KEY env var)
-        """
-        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY must be provided or set in environment")
-
-        self.client = Anthropic(api_key=self.api_key)
-        self.conversation_history = []
-
-        # Build enhanced system prompt with company info
-        self.system_prompt = self._build_system_prompt()
-
-    def _build_system_prompt(self) -> str:
-        """Build comprehensive system prompt with company information"""
-
-        # Format core values
-        values_text = "\n".join([
-            f"- {v['name']}: {v['description']}"
-            for v in COMPANY_INFO['core_values']
-        ])
-
-        # Format services
-        services_text = "\n".join([
-            f"- {s['category']}: {s['description']}"
-            for s in COMPANY_INFO['services']
-        ])
-
-        # Format mission commitments
-        commitments_text = "\n".join([
-            f"- {c}" for c in COMPANY_INFO['mission']['commitments']
-        ])
-
-        # Build complete system prompt
-        enhanced_prompt = f"""{CHATBOT_SYSTEM_PROMPT}
+    # Format core values
+    values_text = "\n".join([
+        f"- {v['name']}: {v['description']}"
+        for v in COMPANY_INFO['core_values']
+    ])
+
+    # Format services
+    services_text = "\n".join([
+        f"- {s['category']}: {s['description']}"
+        for s in COMPANY_INFO['services']
+    ])
+
+    # Format mission commitments
+    commitments_text = "\n".join([
+        f"- {c}" for c in COMPANY_INFO['mission']['commitments']
+    ])
+
+    # Build complete system prompt
+    enhanced_prompt = f"""{CHATBOT_SYSTEM_PROMPT}
 
 COMPANY DETAILS:
 
@@ -84,37 +70,76 @@ Contact Information:
 
 When customers ask about scheduling service, pricing, or need immediate assistance, guide them to contact us via our website or provide the contact information above.
 """
-        return enhanced_prompt
+    return enhanced_prompt
+
+
+class VitalMechanicalChatbot:
+    """
+    Chatbot for Vital Mechanical Service customer inquiries
+    """
+
+    def __init__(self, api_key: str = None):
+        """
+        Initialize the chatbot with Anthropic API
 
-    def chat(self, user_message: str) -> str:
+        Args:
+            api_key: Anthropic API key (if None, reads from ANTHROPIC_API_KEY env var)
+        """
+        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY must be provided or set in environment")
+
+        # Shared, pooled client - sessions reuse warm connections
+        self.client = get_client(self.api_key)
+        self.conversation_history = []
+
+        # Build enhanced system prompt with company info
+        self.system_prompt = self._build_system_prompt()
+
+    def _build_system_prompt(self) -> str:
+        """Build comprehensive system prompt with company information"""
+        return build_system_prompt()
+
+    def chat(self, user_message: str, conversation_history: Optional[List[Dict[str, Any]]] = None) -> str:
         """
         Send a message and get a response
 
         Args:
             user_message: The customer's message
+            conversation_history: History list to use and update (defaults to
+                this instance's own history; the API server passes per-session state)
 
         Returns:
             The chatbot's response
         """
+        history = self.conversation_history if conversation_history is None else conversation_history
+
+        # Keep the history sent with each request under budget
+        compact_history(self.client, history)
+
         # Add user message to history
-        self.conversation_history.append({
+        history.append({
             "role": "user",
             "content": user_message
         })
 
-        # Get response from Claude
-        response = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            system=self.system_prompt,
-            messages=self.conversation_history
-        )
-
-        # Extract assistant's response
-        assistant_message = response.content[0].text
+        # Get response from Claude (simple turns go to the faster model)
+        try:
+            response = self.client.messages.create(
+                model=classify(user_message, history[:-1]).model,
+                max_tokens=1024,
+                system=self.system_prompt,
+                messages=history
+            )
+
+            # Extract assistant's response
+            assistant_message = response.content[0].text
+        except CircuitOpen:
+            # The API has been failing - answer from the FAQ cache or with contact details
+            assistant_message = fallback_answer(user_message)
 
         # Add to conversation history
-        self.conversation_history.append({
+        history.append({
             "role": "assistant",
             "content": assistant_message
         })
@@ -4,64 +4,91 @@ This version can be extended with booking, quoting, and other features
 """
 
 import os
-from anthropic import Anthropic
+from functools import lru_cache
 from chatbot_config import COMPANY_INFO, CHATBOT_SYSTEM_PROMPT, CONTACT_INFO
+from llm_client import get_client, get_async_client
+from tool_registry import registry
+from chatbot_tools import feature_flags
+from knowledge_index import get_knowledge_index
+from faq_cache import get_faq_cache, is_personal, minhash
+from model_router import SMART_MODEL, ModelRouter, classify
+from history_window import HISTORY_TOKEN_BUDGET, SUMMARY_MODEL, compact_history, acompact_history, history_tokens
+from single_flight import COALESCING, Flight, SingleFlight, AsyncSingleFlight
+from resilience import CircuitOpen, fallback_answer
+from admission import Rejected
+from token_budget import (
+    MAX_TOKENS_FIRST, MAX_TOKENS_FOLLOWUP, TurnBudget,
+    estimate_request_tokens, fit_turn, get_token_ledger, plan_max_tokens, prefix_tokens
+)
+from metrics import span, observe_stage, observe_tool, count_tokens
 from typing import Optional, Dict, Any, List
+import asyncio
 import json
-
-
-class EnhancedVitalMechanicalChatbot:
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+# Prompt caching breakpoint. The cached prefix is tools -> system -> messages,
+# so a breakpoint on the system block covers the tool definitions too, and a
+# second one on the newest message caches the conversation so far. Retrieved
+# knowledge is only sent with the current turn, so a third breakpoint marks
+# the end of the (unchanging) earlier turns.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Upper bound on model calls that may return tool_use in one turn; the call
+# after the last round must answer in text so chained tool use terminates
+MAX_TOOL_ROUNDS = 3
+
+# Servers load the SDK and the first turn's artifacts (preload()) in the
+# background once they're up, instead of on the first chat request
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "on").lower() != "off"
+
+def model_stage(round_number: int) -> str:
+    """Metrics stage for a model call: the first of a turn, or one after tools ran"""
+    return "model_first" if round_number == 0 else "model_followup"
+
+
+# Tool calls from one assistant turn run concurrently on this pool
+_tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TOOL_WORKERS", 8)),
+    thread_name_prefix="tool"
+)
+
+# Token counters reported for every turn
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+@lru_cache(maxsize=None)
+def build_system_prompt() -> str:
     """
-    Enhanced chatbot with extensible tool/function calling
-    Can integrate with booking systems, quote generators, etc.
+    Build comprehensive system prompt with company information
+    Built once per process and shared by every chatbot instance
     """
-
-    def __init__(self, api_key: str = None):
-        """
-        Initialize the enhanced chatbot
-
-        Args:
-            api_key: Anthropic API key
-        """
-        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY must be provided or set in environment")
-
-        self.client = Anthropic(api_key=self.api_key)
-        self.conversation_history = []
-        self.system_prompt = self._build_system_prompt()
-
-        # Tool definitions (we'll expand these)
-        self.tools = self._define_tools()
-
-        # Feature flags (turn features on/off easily)
-        self.features = {
-            "booking_enabled": False,  # Set to True when booking integration ready
-            "quotes_enabled": False,   # Set to True when quote system ready
-            "lead_capture_enabled": True,  # Always capture leads
-        }
-
-    def _build_system_prompt(self) -> str:
-        """Build comprehensive system prompt with company information"""
-        # Format core values
-        values_text = "\n".join([
-            f"- {v['name']}: {v['description']}"
-            for v in COMPANY_INFO['core_values']
-        ])
-
-        # Format services
-        services_text = "\n".join([
-            f"- {s['category']}: {s['description']}"
-            for s in COMPANY_INFO['services']
-        ])
-
-        # Format mission commitments
-        commitments_text = "\n".join([
-            f"- {c}" for c in COMPANY_INFO['mission']['commitments']
-        ])
-
-        # Build complete system prompt
-        enhanced_prompt = f"""{CHATBOT_SYSTEM_PROMPT}
+    # Format core values
+    values_text = "\n".join([
+        f"- {v['name']}: {v['description']}"
+        for v in COMPANY_INFO['core_values']
+    ])
+
+    # Format services
+    services_text = "\n".join([
+        f"- {s['category']}: {s['description']}"
+        for s in COMPANY_INFO['services']
+    ])
+
+    # Format mission commitments
+    commitments_text = "\n".join([
+        f"- {c}" for c in COMPANY_INFO['mission']['commitments']
+    ])
+
+    # Build complete system prompt
+    enhanced_prompt = f"""{CHATBOT_SYSTEM_PROMPT}
 
 COMPANY DETAILS:
 
@@ -93,298 +120,988 @@ Contact Information:
 - Email: {CONTACT_INFO['email']}
 
 IMPORTANT: When customers express interest in scheduling service or getting a quote, you can help them directly using the available tools. Always offer to help schedule or get a quote when appropriate.
+
+Customer messages may start with a <knowledge> block of excerpts from our knowledge base that match the question. Use them for accurate details, but don't mention the block itself.
 """
-        return enhanced_prompt
-
-    def _define_tools(self) -> List[Dict[str, Any]]:
-        """
-        Define tools/functions the chatbot can use
-        These are Claude's function calling capabilities
-        """
-        tools = [
-            {
-                "name": "capture_lead",
-                "description": "Capture customer contact information when they express interest in service. Use this when a customer wants to be contacted, schedule service, or get a quote.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "name": {
-                            "type": "string",
-                            "description": "Customer's name"
-                        },
-                        "email": {
-                            "type": "string",
-                            "description": "Customer's email address"
-                        },
-                        "phone": {
-                            "type": "string",
-                            "description": "Customer's phone number"
-                        },
-                        "service_interest": {
-                            "type": "string",
-                            "description": "What service they're interested in (HVAC, plumbing, etc.)"
-                        },
-                        "message": {
-                            "type": "string",
-                            "description": "Additional details about their needs"
-                        },
-                        "urgency": {
-                            "type": "string",
-                            "enum": ["emergency", "urgent", "normal", "flexible"],
-                            "description": "How urgent is their need"
-                        }
-                    },
-                    "required": ["name", "service_interest", "message"]
-                }
-            }
-        ]
-
-        # Add booking tool if enabled
-        if self.features.get("booking_enabled"):
-            tools.append({
-                "name": "schedule_service",
-                "description": "Schedule a service appointment for the customer",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "customer_name": {"type": "string"},
-                        "customer_email": {"type": "string"},
-                        "customer_phone": {"type": "string"},
-                        "service_type": {
-                            "type": "string",
-                            "enum": ["HVAC Repair", "HVAC Maintenance", "Plumbing", "Refrigeration", "Controls", "Emergency Service"]
-                        },
-                        "preferred_date": {
-                            "type": "string",
-                            "description": "Preferred date in YYYY-MM-DD format"
-                        },
-                        "preferred_time": {
-                            "type": "string",
-                            "description": "Preferred time (morning, afternoon, evening)"
-                        },
-                        "description": {"type": "string"}
-                    },
-                    "required": ["customer_name", "service_type", "description"]
-                }
-            })
+    return enhanced_prompt
 
-        # Add quote tool if enabled
-        if self.features.get("quotes_enabled"):
-            tools.append({
-                "name": "request_quote",
-                "description": "Generate a quote request for the customer",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "customer_name": {"type": "string"},
-                        "customer_email": {"type": "string"},
-                        "customer_phone": {"type": "string"},
-                        "service_type": {"type": "string"},
-                        "building_type": {
-                            "type": "string",
-                            "enum": ["office", "retail", "healthcare", "education", "industrial", "other"]
-                        },
-                        "building_size": {"type": "string"},
-                        "project_description": {"type": "string"}
-                    },
-                    "required": ["customer_name", "service_type", "project_description"]
-                }
-            })
 
-        return tools
+@lru_cache(maxsize=None)
+def build_system_blocks() -> List[Dict[str, Any]]:
+    """System prompt as a cacheable content block - shared, do not mutate"""
+    return [{
+        "type": "text",
+        "text": build_system_prompt(),
+        "cache_control": CACHE_CONTROL
+    }]
+
+
+def preload():
+    """
+    Load what the first turn would otherwise wait for: the Anthropic SDK,
+    the knowledge index (numpy; built on the spot if there's no current one), the FAQ cache's MinHash coefficients, and
+    the system prompt and tool schemas with their token estimate
+    Everything here is cached per process, so later calls are free
+    """
+    import anthropic  # noqa: F401 - most of the cold start; clients import it lazily
+
+    get_knowledge_index()
+    minhash("")
+    prefix_tokens(build_system_blocks(), registry.definitions(feature_flags.enabled))
+
+
+def with_cache_breakpoint(messages: List[Dict[str, Any]], index: int = -1) -> List[Dict[str, Any]]:
+    """
+    Copy of messages with a cache breakpoint on the last content block of
+    messages[index] (the newest message by default)
+    The stored history is left untouched
+    """
+    if not messages:
+        return messages
+
+    index = index % len(messages)
+    last = messages[index]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+    else:
+        blocks = list(content)
+        block = blocks[-1]
+        if not isinstance(block, dict):
+            block = block.model_dump(exclude_none=True)
+        blocks[-1] = {**block, "cache_control": CACHE_CONTROL}
+
+    return messages[:index] + [{"role": last["role"], "content": blocks}] + messages[index + 1:]
+
+
+def serialize_content(content: List[Any]) -> List[Dict[str, Any]]:
+    """Convert SDK content blocks to plain dicts for storing in history"""
+    return [
+        block if isinstance(block, dict) else block.model_dump(exclude_none=True)
+        for block in content
+    ]
+
+
+def new_usage() -> Dict[str, int]:
+    """Empty token usage counters"""
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+def add_usage(totals: Dict[str, int], usage: Any):
+    """Add a response's usage (may be None or have missing cache fields) into totals"""
+    if usage is None:
+        return
+    for field in USAGE_FIELDS:
+        totals[field] += getattr(usage, field, None) or 0
+
+
+def shareable(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A turn's result if other sessions may reuse it (completed, no tools ran)"""
+    return result if result is not None and not result["actions"] else None
+
+
+def response_text(response: Any) -> str:
+    """The text blocks of a model response, joined"""
+    return "".join(block.text for block in response.content if block.type == "text")
+
 
-    def chat(self, user_message: str) -> Dict[str, Any]:
+def tool_use_events(tool_uses: List[Any]) -> List[Dict[str, Any]]:
+    """Stream events announcing a round's tool calls"""
+    return [{"event": "tool_use", "data": {"tool": block.name, "input": block.input}} for block in tool_uses]
+
+
+def tool_result_events(tool_uses: List[Any], tool_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Stream events with a round's tool results"""
+    return [
+        {"event": "tool_result", "data": {"tool": block.name, "result": tool_result}}
+        for block, tool_result in zip(tool_uses, tool_results)
+    ]
+
+
+class _Turn:
+    """
+    One model turn in progress - the state its rounds share, whichever of
+    chat / chat_stream / achat / achat_stream is running it
+    """
+
+    def __init__(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        route: Any,
+        budget: Optional[TurnBudget],
+        flight: Optional[Flight],
+        flights: Any
+    ):
+        self.user_message = user_message
+        self.history = history
+        self.route = route
+        self.budget = budget
+        self.flight = flight
+        self.flights = flights
+        self.started = time.perf_counter()
+        # Before fit_turn can trim history, which would make any turn look like the first
+        self.opening = not history
+        self.context = ""
+        self.turn_start = 0
+        self.estimated = 0
+        self.result: Dict[str, Any] = {}
+
+
+class EnhancedVitalMechanicalChatbot:
+    """
+    Enhanced chatbot with extensible tool/function calling
+    Can integrate with booking systems, quote generators, etc.
+    """
+
+    def __init__(self, api_key: str = None):
+        """
+        Initialize the enhanced chatbot
+
+        Args:
+            api_key: Anthropic API key
+        """
+        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY must be provided or set in environment")
+
+        # Shared, pooled client - sessions reuse warm connections
+        self.client = get_client(self.api_key)
+        self.conversation_history = []
+        self.system_prompt = self._build_system_prompt()
+        self.system_blocks = build_system_blocks()
+
+        # Estimated tokens of history sent per request; older turns beyond it are summarized
+        self.history_budget = HISTORY_TOKEN_BUDGET
+
+        # Per-session and per-tenant token usage, and the budgets turns are sized against
+        self.ledger = get_token_ledger()
+
+        # Sends simple turns to a faster model; keeps routing stats
+        self.router = ModelRouter()
+
+        # Running token usage across all turns (including prompt cache hits)
+        self.usage_totals = {
+            **new_usage(),
+            "turns": 0,
+            "cached_turns": 0,
+            "coalesced_turns": 0,
+            "degraded_turns": 0,
+            "compactions": 0
+        }
+        self._usage_lock = threading.Lock()
+
+        # Identical opening questions in flight at the same time share one model call
+        self.flights = SingleFlight()
+        self.aflights = AsyncSingleFlight()
+
+        # Feature flags are process-wide (chatbot_tools.py), so toggling one
+        # applies to every chatbot and session at once
+        self.feature_flags = feature_flags
+
+    def _build_system_prompt(self) -> str:
+        """Build comprehensive system prompt with company information"""
+        return build_system_prompt()
+
+    @property
+    def features(self) -> Dict[str, bool]:
+        """Current feature flags"""
+        return self.feature_flags.as_dict()
+
+    @property
+    def tools(self) -> List[Dict[str, Any]]:
+        """Tool definitions for the current feature flags (built once per flag set)"""
+        return registry.definitions(self.feature_flags.enabled)
+
+    def chat(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Dict[str, Any]:
         """
         Send a message and get a response
         Now returns structured data including any tool calls
 
         Args:
             user_message: The customer's message
+            conversation_history: History list to use and update (defaults to
+                this instance's own history; the API server passes per-session state)
+            budget: This turn's token allowance from the ledger (None = only
+                the context window limits the turn)
 
         Returns:
             Dict with response and any actions taken
         """
-        # Add user message to history
-        self.conversation_history.append({
+        history = self.conversation_history if conversation_history is None else conversation_history
+
+        cached = self._cached_reply(user_message, history)
+        if cached is not None:
+            return cached
+
+        key = self._flight_key(user_message, history)
+        if key is None:
+            return self._chat_turn(user_message, history, budget=budget)
+
+        flight, leader = self.flights.join(key)
+        if not leader:
+            shared = self._shared_reply(user_message, history, self.flights.wait(flight))
+            return shared if shared is not None else self._chat_turn(user_message, history, budget=budget)
+
+        result = None
+        try:
+            result = self._chat_turn(user_message, history, flight, budget)
+            return result
+        finally:
+            self.flights.land(flight, shareable(result))
+
+    def _chat_turn(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        flight: Optional[Flight] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Dict[str, Any]:
+        """Run one turn of chat() against the model (flight: set when leading a coalesced call)"""
+        self._compact_history(history, budget)
+        turn = self._start_turn(user_message, history, budget, flight, self.flights)
+
+        # Agent loop: each tool_use turn runs all requested tools at once and
+        # sends every result back in one message, so N tool calls cost one
+        # follow-up completion. Bounded by MAX_TOOL_ROUNDS.
+        try:
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                params = self._round_params(turn, round_number)
+                with span(model_stage(round_number)):
+                    response = self.client.messages.create(**params)
+                tool_uses = self._end_round(turn, round_number, response)
+                if not tool_uses:
+                    break
+                self._end_tools(turn, tool_uses, self._run_tools(tool_uses))
+        except CircuitOpen:
+            # The API has been failing - answer without it
+            return self._degraded_reply(user_message, history, turn.result)
+
+        return self._finish_turn(turn, response_text(response))
+
+    def _start_turn(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        budget: Optional[TurnBudget],
+        flight: Optional[Flight],
+        flights: Any
+    ) -> _Turn:
+        """
+        Begin a turn once history is compacted: route it, add the user message
+        to history and make sure the first call fits
+
+        Args:
+            flights: The SingleFlight / AsyncSingleFlight that flight belongs to
+
+        Raises:
+            BudgetExceeded, PromptTooLarge: see _fit_turn()
+        """
+        turn = _Turn(user_message, history, self.router.route(user_message, history), budget, flight, flights)
+        history.append({
             "role": "user",
             "content": user_message
         })
+        turn.context = self._knowledge_context(user_message)
+        turn.turn_start = self._fit_turn(history, turn.context, turn.route.model, budget)
+        turn.result = {
+            "response": "",
+            "actions": [],
+            "needs_user_info": False,
+            "usage": new_usage(),
+            "history_tokens": history_tokens(history),
+            "model": turn.route.model
+        }
+        return turn
 
-        # Get response from Claude with tool support
-        response = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2048,
-            system=self.system_prompt,
-            tools=self.tools,
-            messages=self.conversation_history
+    def _round_params(self, turn: _Turn, round_number: int) -> Dict[str, Any]:
+        """Request params for one model call of a turn (see _sized_params())"""
+        params, turn.estimated = self._sized_params(
+            turn.history, round_number, turn.budget,
+            turn_start=turn.turn_start, context=turn.context, model=turn.route.model
         )
+        return params
 
-        # Process response
-        result = {
-            "response": "",
+    def _end_round(self, turn: _Turn, round_number: int, message: Any) -> List[Any]:
+        """
+        Account for one model call's response and, if it asked for tools,
+        add it to history
+
+        Returns:
+            The tool_use blocks to run, or [] if this was the turn's answer
+        """
+        add_usage(turn.result["usage"], message.usage)
+        if round_number == 0:
+            self.ledger.observe_estimate(turn.estimated, turn.result["usage"])
+
+        tool_uses = [block for block in message.content if block.type == "tool_use"]
+        if message.stop_reason != "tool_use" or not tool_uses:
+            return []
+        if turn.flight:
+            turn.flights.land(turn.flight)  # Tool results are per session - not shared
+
+        turn.history.append({
+            "role": "assistant",
+            "content": serialize_content(message.content)
+        })
+        return tool_uses
+
+    def _end_tools(self, turn: _Turn, tool_uses: List[Any], tool_results: List[Dict[str, Any]]):
+        """Add a round's tool results to history (and the turn's actions)"""
+        turn.history.append(self._tool_results_message(tool_uses, tool_results, turn.result["actions"]))
+        # Only the text after the tools ran is kept as the reply
+        turn.result["response"] = ""
+
+    def _finish_turn(self, turn: _Turn, response: str) -> Dict[str, Any]:
+        """Store the turn's reply in history and record the turn; returns its result"""
+        turn.result["response"] = response
+        turn.history.append({
+            "role": "assistant",
+            "content": response
+        })
+        self._record_turn(turn.route, turn.started, turn.result["usage"], turn.budget)
+        self._remember_reply(turn)
+        return turn.result
+
+    def _relay(self, turn: _Turn, text: str) -> Dict[str, Any]:
+        """Take a chunk of streamed reply: add it to the response, pass it to followers; returns its event"""
+        turn.result["response"] += text
+        if turn.flight:
+            turn.flight.publish(text)
+        return {"event": "text", "data": {"text": text}}
+
+    def _compact_history(self, history: List[Dict[str, Any]], budget: Optional[TurnBudget] = None):
+        """Keep history under HISTORY_TOKEN_BUDGET, summarizing the oldest turns"""
+        usage = new_usage()
+        with span("history"):
+            compacted = compact_history(self.client, history, self.history_budget, usage)
+        if compacted:
+            self._record_summary(usage, budget)
+
+    async def _acompact_history(self, client: Any, history: List[Dict[str, Any]], budget: Optional[TurnBudget] = None):
+        """Async version of _compact_history()"""
+        usage = new_usage()
+        with span("history"):
+            compacted = await acompact_history(client, history, self.history_budget, usage)
+        if compacted:
+            self._record_summary(usage, budget)
+
+    def _record_summary(self, usage: Dict[str, int], budget: Optional[TurnBudget]):
+        """Count a compaction and its summary call's tokens (totals, the turn's budget, metrics)"""
+        with self._usage_lock:
+            for field in USAGE_FIELDS:
+                self.usage_totals[field] += usage[field]
+            self.usage_totals["compactions"] += 1
+        if budget is not None:
+            budget.charge(usage, turns=0)
+        count_tokens(SUMMARY_MODEL, usage)
+
+    def _cached_reply(self, user_message: str, history: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Answer an opening question from the FAQ cache
+
+        Returns:
+            The result (with "cached": True) after adding the exchange to
+            history, or None if this isn't a first turn or nothing matched
+        """
+        cache = get_faq_cache()
+        if history or cache is None:
+            return None
+
+        answer = cache.get(user_message, self._cache_namespace())
+        if answer is None:
+            return None
+
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": answer})
+        with self._usage_lock:
+            self.usage_totals["cached_turns"] += 1
+
+        return {
+            "response": answer,
             "actions": [],
-            "needs_user_info": False
+            "needs_user_info": False,
+            "usage": new_usage(),
+            "history_tokens": history_tokens(history),
+            "cached": True
         }
 
-        # Handle tool calls
-        if response.stop_reason == "tool_use":
-            for content_block in response.content:
-                if content_block.type == "tool_use":
-                    # Execute the tool
-                    tool_result = self._execute_tool(
-                        content_block.name,
-                        content_block.input
-                    )
-
-                    result["actions"].append({
-                        "tool": content_block.name,
-                        "input": content_block.input,
-                        "result": tool_result
-                    })
-
-                    # Add tool use and result to conversation
-                    self.conversation_history.append({
-                        "role": "assistant",
-                        "content": response.content
-                    })
-
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": [{
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": json.dumps(tool_result)
-                        }]
-                    })
-
-                    # Get final response after tool use
-                    final_response = self.client.messages.create(
-                        model="claude-sonnet-4-20250514",
-                        max_tokens=1024,
-                        system=self.system_prompt,
-                        tools=self.tools,
-                        messages=self.conversation_history
-                    )
-
-                    result["response"] = final_response.content[0].text
-
-                    self.conversation_history.append({
-                        "role": "assistant",
-                        "content": final_response.content[0].text
-                    })
-
-        else:
-            # Regular text response
-            result["response"] = response.content[0].text
-
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": response.content[0].text
-            })
+    def _flight_key(self, user_message: str, history: List[Dict[str, Any]]) -> Optional[tuple]:
+        """
+        Key grouping identical opening questions, or None if this turn isn't coalesced
+        Messages with contact details are personal (and call capture_lead), so they never are
+        """
+        if history or not COALESCING:
+            return None
+        if classify(user_message).reason == "contact_details":
+            return None
+        return (self._cache_namespace(), " ".join(user_message.split()))
+
+    def _shared_reply(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        shared: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Answer from another session's identical in-flight turn
+
+        Returns:
+            The result (with "coalesced": True) after adding the exchange to
+            history, or None if the leader's answer can't be shared
+        """
+        if shared is None:
+            return None
 
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": shared["response"]})
+        with self._usage_lock:
+            self.usage_totals["coalesced_turns"] += 1
+
+        return {
+            "response": shared["response"],
+            "actions": [],
+            "needs_user_info": False,
+            "usage": new_usage(),
+            "history_tokens": history_tokens(history),
+            "model": shared["model"],
+            "coalesced": True
+        }
+
+    def _degraded_reply(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Finish a turn the API couldn't take (circuit breaker open) with
+        fallback_answer(); not recorded in the FAQ cache
+
+        Returns:
+            The result with the fallback response and "degraded": True
+        """
+        result["response"] = fallback_answer(user_message, self._cache_namespace())
+        result["degraded"] = True
+        history.append({
+            "role": "assistant",
+            "content": result["response"]
+        })
+        with self._usage_lock:
+            self.usage_totals["degraded_turns"] += 1
         return result
 
-    def _execute_tool(self, tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+    def _remember_reply(self, turn: _Turn):
         """
-        Execute a tool/function call
-        This is where we integrate with real systems
+        Cache the answer to an opening question if it was plain text (no tools
+        ran) and the question wasn't personal - an answer to "I'm John from
+        Acme" is addressed to John
+        """
+        cache = get_faq_cache()
+        if (
+            cache is not None
+            and turn.opening
+            and len(turn.history) - turn.turn_start == 2
+            and not turn.result["actions"]
+            and not is_personal(turn.user_message)
+        ):
+            cache.put(turn.user_message, turn.result["response"], self._cache_namespace())
+
+    def _cache_namespace(self) -> str:
+        """FAQ cache namespace - answers can differ with the enabled features"""
+        return ",".join(sorted(self.feature_flags.enabled))
+
+    def _knowledge_context(self, user_message: str) -> str:
+        """Knowledge base sections relevant to this message ("" if none or retrieval is off)"""
+        index = get_knowledge_index()
+        if not index:
+            return ""
+        with span("retrieval"):
+            return index.context_for(user_message)
+
+    def _fit_turn(
+        self,
+        history: List[Dict[str, Any]],
+        context: str,
+        model: str,
+        budget: Optional[TurnBudget]
+    ) -> int:
+        """
+        Pre-flight check of a turn's first call, with its user message just
+        appended to history: drops the oldest turns if the call wouldn't fit
+
+        Returns:
+            Index of the turn's user message in history
+
+        Raises:
+            BudgetExceeded, PromptTooLarge: the message is taken back out of history
+        """
+        params = self._request_params(history, 0, turn_start=len(history) - 1, context=context, model=model)
+        try:
+            fit_turn(history, params, budget, self.ledger)
+        except Rejected:
+            history.pop()
+            raise
+        return len(history) - 1
+
+    def _sized_params(
+        self,
+        history: List[Dict[str, Any]],
+        round_number: int,
+        budget: Optional[TurnBudget],
+        **kwargs
+    ) -> tuple:
+        """
+        Request params for one model call of a turn, with max_tokens sized
+        from the estimated prompt: MAX_TOKENS_FIRST for the first call and
+        MAX_TOKENS_FOLLOWUP after tools ran, capped by the room left in the
+        context window and (first call only) by the turn's allowance
+
+        Returns:
+            (params, estimated input tokens)
+        """
+        params = self._request_params(history, 0, allow_tools=round_number < MAX_TOOL_ROUNDS, **kwargs)
+        estimated = estimate_request_tokens(params)
+        default = MAX_TOKENS_FIRST if round_number == 0 else MAX_TOKENS_FOLLOWUP
+        allowance = budget.allowance if budget is not None and round_number == 0 else None
+        params["max_tokens"] = plan_max_tokens(estimated, default, allowance)
+        if params["max_tokens"] < default:
+            self.ledger.observe("capped_calls")
+        return params, estimated
+
+    def _request_params(
+        self,
+        history: List[Dict[str, Any]],
+        max_tokens: int,
+        allow_tools: bool = True,
+        turn_start: Optional[int] = None,
+        context: str = "",
+        model: str = SMART_MODEL
+    ) -> Dict[str, Any]:
+        """
+        Build keyword arguments for messages.create / messages.stream
 
         Args:
-            tool_name: Name of the tool to execute
-            tool_input: Input parameters for the tool
+            history: Conversation so far (ending with a user message)
+            max_tokens: Completion limit for this call
+            allow_tools: False forces a plain text answer (ends a tool-use chain)
+            turn_start: Index in history of this turn's user message
+            context: Retrieved knowledge to prepend to that message (not stored in history)
+            model: Model chosen by the router for this turn
+        """
+        messages = history
+        if turn_start is not None:
+            if context:
+                messages = list(history)
+                messages[turn_start] = {
+                    "role": "user",
+                    "content": f"{context}\n\n{history[turn_start]['content']}"
+                }
+            # Earlier turns are stored without injected knowledge, so the prefix
+            # ending before this turn is identical next turn - cache it too
+            if turn_start > 0:
+                messages = with_cache_breakpoint(messages, turn_start - 1)
+
+        params = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": self.system_blocks,
+            "tools": self.tools,
+            "messages": with_cache_breakpoint(messages)
+        }
+        if not allow_tools:
+            params["tool_choice"] = {"type": "none"}
+        return params
+
+    def chat_stream(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Send a message and stream the response as it is generated
+
+        Yields event dicts of the form {"event": name, "data": {...}}:
+        - text: {"text": delta} for each chunk of the reply
+        - tool_use: {"tool", "input"} when Claude calls a tool
+        - tool_result: {"tool", "result"} once the tool has run
+        - reset: {} when text already sent (from an identical in-flight
+          question) is being replaced - discard it
+        - done: {"response", "actions", "usage"} after the reply is complete
+
+        Args:
+            user_message: The customer's message
+            conversation_history: History list to use and update (defaults to
+                this instance's own history; the API server passes per-session state)
+            budget: This turn's token allowance from the ledger (None = only
+                the context window limits the turn)
+        """
+        history = self.conversation_history if conversation_history is None else conversation_history
+
+        cached = self._cached_reply(user_message, history)
+        if cached is not None:
+            yield {"event": "text", "data": {"text": cached["response"]}}
+            yield {"event": "done", "data": cached}
+            return
+
+        key = self._flight_key(user_message, history)
+        if key is None:
+            yield from self._chat_stream_turn(user_message, history, budget=budget)
+            return
+
+        flight, leader = self.flights.join(key)
+        if not leader:
+            relayed = False
+            for text in self.flights.follow(flight):
+                relayed = True
+                yield {"event": "text", "data": {"text": text}}
+            shared = self._shared_reply(user_message, history, self.flights.outcome(flight))
+            if shared is not None:
+                yield {"event": "done", "data": shared}
+                return
+            if relayed:
+                # The leader's text can't be used after all - clear it before our own turn
+                yield {"event": "reset", "data": {}}
+            yield from self._chat_stream_turn(user_message, history, budget=budget)
+            return
+
+        result = None
+        try:
+            for event in self._chat_stream_turn(user_message, history, flight, budget):
+                if event["event"] == "done":
+                    result = event["data"]
+                yield event
+        finally:
+            self.flights.land(flight, shareable(result))
+
+    def _chat_stream_turn(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        flight: Optional[Flight] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Run one turn of chat_stream() against the model (flight: set when leading a coalesced call)"""
+        self._compact_history(history, budget)
+        turn = self._start_turn(user_message, history, budget, flight, self.flights)
+
+        try:
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                params = self._round_params(turn, round_number)
+                with span(model_stage(round_number)), self.client.messages.stream(**params) as stream:
+                    for text in stream.text_stream:
+                        yield self._relay(turn, text)
+                    message = stream.get_final_message()
+
+                tool_uses = self._end_round(turn, round_number, message)
+                if not tool_uses:
+                    break
+                yield from tool_use_events(tool_uses)
+                tool_results = self._run_tools(tool_uses)
+                yield from tool_result_events(tool_uses, tool_results)
+                self._end_tools(turn, tool_uses, tool_results)
+        except CircuitOpen:
+            # The API has been failing - answer without it
+            result = self._degraded_reply(user_message, history, turn.result)
+            yield {"event": "text", "data": {"text": result["response"]}}
+            yield {"event": "done", "data": result}
+            return
+
+        yield {"event": "done", "data": self._finish_turn(turn, turn.result["response"])}
+
+    async def achat(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Dict[str, Any]:
+        """
+        Async version of chat() for the ASGI server
+        Model calls don't block the event loop; tools run in a worker thread
+
+        Args:
+            user_message: The customer's message
+            conversation_history: History list to use and update
+            budget: This turn's token allowance from the ledger
 
         Returns:
-            Result of the tool execution
+            Dict with response and any actions taken
         """
-        if tool_name == "capture_lead":
-            return self._capture_lead(tool_input)
-        elif tool_name == "schedule_service":
-            return self._schedule_service(tool_input)
-        elif tool_name == "request_quote":
-            return self._request_quote(tool_input)
-        else:
-            return {"success": False, "error": f"Unknown tool: {tool_name}"}
+        history = self.conversation_history if conversation_history is None else conversation_history
+
+        cached = self._cached_reply(user_message, history)
+        if cached is not None:
+            return cached
+
+        key = self._flight_key(user_message, history)
+        if key is None:
+            return await self._achat_turn(user_message, history, budget=budget)
+
+        flight, leader = self.aflights.join(key)
+        if not leader:
+            shared = self._shared_reply(user_message, history, await self.aflights.wait(flight))
+            return shared if shared is not None else await self._achat_turn(user_message, history, budget=budget)
 
-    def _capture_lead(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        result = None
+        try:
+            result = await self._achat_turn(user_message, history, flight, budget)
+            return result
+        finally:
+            self.aflights.land(flight, shareable(result))
+
+    async def _achat_turn(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        flight: Optional[Flight] = None,
+        budget: Optional[TurnBudget] = None
+    ) -> Dict[str, Any]:
+        """Async version of _chat_turn()"""
+        client = get_async_client(self.api_key)
+        await self._acompact_history(client, history, budget)
+        turn = self._start_turn(user_message, history, budget, flight, self.aflights)
+
+        try:
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                params = self._round_params(turn, round_number)
+                with span(model_stage(round_number)):
+                    response = await client.messages.create(**params)
+                tool_uses = self._end_round(turn, round_number, response)
+                if not tool_uses:
+                    break
+                self._end_tools(turn, tool_uses, await self._arun_tools(tool_uses))
+        except CircuitOpen:
+            # The API has been failing - answer without it
+            return self._degraded_reply(user_message, history, turn.result)
+
+        return self._finish_turn(turn, response_text(response))
+
+    async def achat_stream(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        budget: Optional[TurnBudget] = None
+    ):
         """
-        Capture lead information
-        For now, saves to a file. Later: integrate with CRM, email, database, etc.
+        Async version of chat_stream() - yields the same events
+
+        Args:
+            user_message: The customer's message
+            conversation_history: History list to use and update
+            budget: This turn's token allowance from the ledger
         """
+        history = self.conversation_history if conversation_history is None else conversation_history
+
+        cached = self._cached_reply(user_message, history)
+        if cached is not None:
+            yield {"event": "text", "data": {"text": cached["response"]}}
+            yield {"event": "done", "data": cached}
+            return
+
+        key = self._flight_key(user_message, history)
+        if key is None:
+            async for event in self._achat_stream_turn(user_message, history, budget=budget):
+                yield event
+            return
+
+        flight, leader = self.aflights.join(key)
+        if not leader:
+            relayed = False
+            async for text in self.aflights.follow(flight):
+                relayed = True
+                yield {"event": "text", "data": {"text": text}}
+            shared = self._shared_reply(user_message, history, self.aflights.outcome(flight))
+            if shared is not None:
+                yield {"event": "done", "data": shared}
+                return
+            if relayed:
+                yield {"event": "reset", "data": {}}
+            async for event in self._achat_stream_turn(user_message, history, budget=budget):
+                yield event
+            return
+
+        result = None
         try:
-            # For now, append to a JSON file
-            lead_file = "leads.json"
-
-            import datetime
-            lead_data = {
-                **data,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "status": "new"
-            }
-
-            # Read existing leads
-            leads = []
-            if os.path.exists(lead_file):
-                with open(lead_file, 'r') as f:
-                    leads = json.load(f)
-
-            # Add new lead
-            leads.append(lead_data)
-
-            # Save back
-            with open(lead_file, 'w') as f:
-                json.dump(leads, f, indent=2)
-
-            return {
-                "success": True,
-                "message": "Lead captured successfully. We'll contact you soon!",
-                "lead_id": len(leads)
-            }
+            async for event in self._achat_stream_turn(user_message, history, flight, budget):
+                if event["event"] == "done":
+                    result = event["data"]
+                yield event
+        finally:
+            self.aflights.land(flight, shareable(result))
+
+    async def _achat_stream_turn(
+        self,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        flight: Optional[Flight] = None,
+        budget: Optional[TurnBudget] = None
+    ):
+        """Async version of _chat_stream_turn()"""
+        client = get_async_client(self.api_key)
+        await self._acompact_history(client, history, budget)
+        turn = self._start_turn(user_message, history, budget, flight, self.aflights)
 
+        try:
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                params = self._round_params(turn, round_number)
+                with span(model_stage(round_number)):
+                    async with client.messages.stream(**params) as stream:
+                        async for text in stream.text_stream:
+                            yield self._relay(turn, text)
+                        message = await stream.get_final_message()
+
+                tool_uses = self._end_round(turn, round_number, message)
+                if not tool_uses:
+                    break
+                for event in tool_use_events(tool_uses):
+                    yield event
+                tool_results = await self._arun_tools(tool_uses)
+                for event in tool_result_events(tool_uses, tool_results):
+                    yield event
+                self._end_tools(turn, tool_uses, tool_results)
+        except CircuitOpen:
+            # The API has been failing - answer without it
+            result = self._degraded_reply(user_message, history, turn.result)
+            yield {"event": "text", "data": {"text": result["response"]}}
+            yield {"event": "done", "data": result}
+            return
+
+        yield {"event": "done", "data": self._finish_turn(turn, turn.result["response"])}
+
+    def _record_usage(self, usage: Dict[str, int]):
+        """Add one turn's token usage to the running totals"""
+        with self._usage_lock:
+            for field in USAGE_FIELDS:
+                self.usage_totals[field] += usage[field]
+            self.usage_totals["turns"] += 1
+
+    def _record_turn(self, route: Any, started: float, usage: Dict[str, int], budget: Optional[TurnBudget] = None):
+        """Record a finished model turn: usage totals, the session's ledger, routing latency and metrics"""
+        elapsed = time.perf_counter() - started
+        self._record_usage(usage)
+        if budget is not None:
+            budget.charge(usage)
+        self.router.record(route, elapsed * 1000)
+        observe_stage("turn", elapsed)
+        count_tokens(route.model, usage)
+
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """Running token usage, with the share of input served from the prompt cache"""
+        with self._usage_lock:
+            stats = dict(self.usage_totals)
+
+        total_input = (
+            stats["input_tokens"]
+            + stats["cache_creation_input_tokens"]
+            + stats["cache_read_input_tokens"]
+        )
+        stats["cache_hit_ratio"] = round(stats["cache_read_input_tokens"] / total_input, 4) if total_input else 0.0
+        # Stays flat on long conversations while history windowing is on
+        stats["avg_input_tokens_per_turn"] = round(total_input / stats["turns"], 1) if stats["turns"] else 0.0
+        return stats
+
+    def _run_tools(self, tool_uses: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Execute the tool_use blocks of one assistant turn concurrently
+
+        Returns:
+            Tool results in the same order as tool_uses
+        """
+        with span("tools"):
+            if len(tool_uses) == 1:
+                return [self._execute_tool_safely(tool_uses[0].name, tool_uses[0].input)]
+
+            futures = [
+                _tool_executor.submit(self._execute_tool_safely, block.name, block.input)
+                for block in tool_uses
+            ]
+            return [future.result() for future in futures]
+
+    async def _arun_tools(self, tool_uses: List[Any]) -> List[Dict[str, Any]]:
+        """Async version of _run_tools - tools may block, so each runs in a worker thread"""
+        with span("tools"):
+            return list(await asyncio.gather(*(
+                asyncio.to_thread(self._execute_tool_safely, block.name, block.input)
+                for block in tool_uses
+            )))
+
+    def _execute_tool_safely(self, tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a tool, turning an unexpected exception into an error result for Claude"""
+        started = time.perf_counter()
+        try:
+            result = self._execute_tool(tool_name, tool_input)
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e)
-            }
+            result = {"success": False, "error": str(e)}
+        observe_tool(tool_name, time.perf_counter() - started, result.get("success", True))
+        return result
 
-    def _schedule_service(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _tool_results_message(
+        tool_uses: List[Any],
+        tool_results: List[Dict[str, Any]],
+        actions: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
         """
-        Schedule a service appointment
-        PLACEHOLDER - integrate with actual booking system later
+        Build the single user message answering every tool_use in a turn
+        Also records each call in actions
         """
-        # TODO: Integrate with calendar API, booking system, etc.
-        return {
-            "success": True,
-            "message": "Service request received. We'll confirm your appointment within 24 hours.",
-            "appointment_id": "TEMP-" + str(hash(str(data)))[:8]
-        }
+        content = []
+        for block, tool_result in zip(tool_uses, tool_results):
+            actions.append({
+                "tool": block.name,
+                "input": block.input,
+                "result": tool_result
+            })
+            content.append({
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": json.dumps(tool_result),
+                "is_error": not tool_result.get("success", True)
+            })
+
+        return {"role": "user", "content": content}
 
-    def _request_quote(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _execute_tool(self, tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Generate a quote request
-        PLACEHOLDER - integrate with quote system later
+        Execute a tool/function call
+        Dispatched through the tool registry (tools are defined in chatbot_tools.py)
+
+        Args:
+            tool_name: Name of the tool to execute
+            tool_input: Input parameters for the tool (validated against its schema)
+
+        Returns:
+            Result of the tool execution
         """
-        # TODO: Integrate with quote generation system
-        return {
-            "success": True,
-            "message": "Quote request received. We'll provide a detailed quote within 48 hours.",
-            "quote_id": "QUOTE-" + str(hash(str(data)))[:8]
-        }
+        return registry.execute(tool_name, tool_input, self.feature_flags.enabled)
 
     def reset_conversation(self):
         """Clear conversation history"""
         self.conversation_history = []
 
-    def enable_feature(self, feature_name: str):
-        """Enable a feature (booking, quotes, etc.)"""
-        if feature_name in self.features:
-            self.features[feature_name] = True
-            self.tools = self._define_tools()  # Rebuild tools
-
-    def disable_feature(self, feature_name: str):
-        """Disable a feature"""
-        if feature_name in self.features:
-            self.features[feature_name] = False
-            self.tools = self._define_tools()  # Rebuild tools
+    def enable_feature(self, feature_name: str) -> bool:
+        """
+        Enable a feature (booking, quotes, etc.) for every session
+
+        Returns:
+            False if there is no such feature
+        """
+        return self.feature_flags.set(feature_name, True)
+
+    def disable_feature(self, feature_name: str) -> bool:
+        """
+        Disable a feature for every session
+
+        Returns:
+            False if there is no such feature
+        """
+        return self.feature_flags.set(feature_name, False)
 
 
 def main():
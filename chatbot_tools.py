@@ -0,0 +1,184 @@
+"""
+Tools the enhanced chatbot can call
+Each tool registers itself with the registry in tool_registry.py; to add
+one, write a handler here with an @tool decorator (and a feature flag if
+it should be switchable)
+"""
+
+import datetime
+import uuid
+from typing import Dict, Any
+
+from lead_store import get_lead_store
+from metrics import span
+from outbox import get_outbox, crm_event
+from tool_registry import FeatureFlags, tool
+
+# Feature flags (turn features on/off easily) - shared by every chatbot in the process
+DEFAULT_FEATURES = {
+    "booking_enabled": False,  # Set to True when booking integration ready
+    "quotes_enabled": False,   # Set to True when quote system ready
+    "lead_capture_enabled": True,  # Always capture leads
+}
+
+feature_flags = FeatureFlags(DEFAULT_FEATURES)
+
+
+@tool(
+    name="capture_lead",
+    description="Capture customer contact information when they express interest in service. Use this when a customer wants to be contacted, schedule service, or get a quote.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "name": {
+                "type": "string",
+                "description": "Customer's name"
+            },
+            "email": {
+                "type": "string",
+                "description": "Customer's email address"
+            },
+            "phone": {
+                "type": "string",
+                "description": "Customer's phone number"
+            },
+            "service_interest": {
+                "type": "string",
+                "description": "What service they're interested in (HVAC, plumbing, etc.)"
+            },
+            "message": {
+                "type": "string",
+                "description": "Additional details about their needs"
+            },
+            "urgency": {
+                "type": "string",
+                "enum": ["emergency", "urgent", "normal", "flexible"],
+                "description": "How urgent is their need"
+            }
+        },
+        "required": ["name", "service_interest", "message"]
+    },
+    feature="lead_capture_enabled"
+)
+def capture_lead(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Capture lead information
+    Appends to the shared lead store; the CRM push (if configured) is queued
+    in the same transaction and delivered in the background
+    """
+    try:
+        lead_data = {
+            **data,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "status": "new"
+        }
+
+        outbox = get_outbox()
+
+        def queue_crm_push(conn, lead_id):
+            outbox.enqueue_in(
+                conn, "crm", crm_event("lead_captured", {**lead_data, "lead_id": lead_id}), f"lead-{lead_id}"
+            )
+
+        # Single append - safe under concurrent sessions
+        with span("lead_store_write"):
+            lead_id = get_lead_store().add(lead_data, after_insert=queue_crm_push)
+
+        return {
+            "success": True,
+            "message": "Lead captured successfully. We'll contact you soon!",
+            "lead_id": lead_id
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+@tool(
+    name="schedule_service",
+    description="Schedule a service appointment for the customer",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "customer_name": {"type": "string"},
+            "customer_email": {"type": "string"},
+            "customer_phone": {"type": "string"},
+            "service_type": {
+                "type": "string",
+                "enum": ["HVAC Repair", "HVAC Maintenance", "Plumbing", "Refrigeration", "Controls", "Emergency Service"]
+            },
+            "preferred_date": {
+                "type": "string",
+                "description": "Preferred date in YYYY-MM-DD format"
+            },
+            "preferred_time": {
+                "type": "string",
+                "description": "Preferred time (morning, afternoon, evening)"
+            },
+            "description": {"type": "string"}
+        },
+        "required": ["customer_name", "service_type", "description"]
+    },
+    feature="booking_enabled"
+)
+def schedule_service(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Schedule a service appointment
+    PLACEHOLDER - integrate with actual booking system later
+    """
+    # TODO: Integrate with calendar API, booking system, etc.
+    # Until then the coordinator gets the request through the CRM
+    appointment_id = "TEMP-" + str(hash(str(data)))[:8]
+    get_outbox().enqueue(
+        "crm",
+        crm_event("service_requested", {**data, "appointment_id": appointment_id}),
+        f"service-{uuid.uuid4().hex}"
+    )
+    return {
+        "success": True,
+        "message": "Service request received. We'll confirm your appointment within 24 hours.",
+        "appointment_id": appointment_id
+    }
+
+
+@tool(
+    name="request_quote",
+    description="Generate a quote request for the customer",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "customer_name": {"type": "string"},
+            "customer_email": {"type": "string"},
+            "customer_phone": {"type": "string"},
+            "service_type": {"type": "string"},
+            "building_type": {
+                "type": "string",
+                "enum": ["office", "retail", "healthcare", "education", "industrial", "other"]
+            },
+            "building_size": {"type": "string"},
+            "project_description": {"type": "string"}
+        },
+        "required": ["customer_name", "service_type", "project_description"]
+    },
+    feature="quotes_enabled"
+)
+def request_quote(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generate a quote request
+    PLACEHOLDER - integrate with quote system later
+    """
+    # TODO: Integrate with quote generation system
+    quote_id = "QUOTE-" + str(hash(str(data)))[:8]
+    get_outbox().enqueue(
+        "crm",
+        crm_event("quote_requested", {**data, "quote_id": quote_id}),
+        f"quote-{uuid.uuid4().hex}"
+    )
+    return {
+        "success": True,
+        "message": "Quote request received. We'll provide a detailed quote within 48 hours.",
+        "quote_id": quote_id
+    }
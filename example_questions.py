@@ -60,6 +60,33 @@ EXAMPLE_QUESTIONS = {
     ]
 }
 
+# Multi-turn conversations, each sent in order on one session
+CONVERSATION_SCRIPTS = {
+    "lead_capture": [
+        "Hi there",
+        "Our rooftop unit stopped cooling this morning",
+        "It's a three-story office building in Bellevue",
+        "Yes please, have someone contact me - I'm Dana at 425-555-0142",
+        "Thanks, how soon will I hear back?",
+    ],
+    "maintenance_quote": [
+        "Do you have a maintenance contract program?",
+        "What's included in a preventative maintenance visit?",
+        "We have six RTUs and a boiler, how often should they be serviced?",
+        "Can I get a quote for quarterly maintenance?",
+    ],
+    "troubleshooting": [
+        "My HVAC system isn't cooling properly, what should I do?",
+        "The thermostat shows the right setpoint",
+        "The outdoor unit is running but the air is warm",
+        "Could it be the refrigerant?",
+        "Do you work on Trane equipment?",
+        "Our building controls aren't working right either",
+        "How quickly can you respond to a service request?",
+        "OK, please schedule a technician",
+    ],
+}
+
 
 def print_all_questions():
     """Print all example questions by category"""
@@ -70,7 +97,17 @@ def print_all_questions():
             print(f"{i}. {question}")
 
 
+def print_all_scripts():
+    """Print the multi-turn conversation scripts"""
+    for name, turns in CONVERSATION_SCRIPTS.items():
+        print(f"\n{name.upper().replace('_', ' ')} (conversation)")
+        print("=" * 50)
+        for i, message in enumerate(turns, 1):
+            print(f"{i}. {message}")
+
+
 if __name__ == "__main__":
     print("VITAL MECHANICAL CHATBOT - EXAMPLE TEST QUESTIONS")
     print("=" * 60)
     print_all_questions()
+    print_all_scripts()
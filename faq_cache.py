@@ -0,0 +1,403 @@
+"""
+FAQ answer cache
+Serves repeat first-turn questions ("What services do you offer?") without a
+model call. Questions are matched on normalized text, then on near-duplicates
+via MinHash over character shingles with LSH banding.
+
+Near-duplicates are only looked for among short, generic questions:
+character shingles can't tell "Jane" from "John" or "do you" from "do you
+not", so a question with a negation or a proper noun needs an exact match.
+Questions that introduce the visitor or their company, or carry contact
+details, are personal - never looked up (and the chatbot doesn't store them).
+
+Entries expire after a TTL, the least recently used are evicted past the size
+limit, and the whole cache is dropped when the company config or knowledge
+file changes on disk.
+
+numpy is imported on the first lookup or store, not with the module, so
+creating the cache at server start stays cheap.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Tuple, Callable
+
+if TYPE_CHECKING:
+    import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cached answers kept (0 disables the cache)
+CACHE_SIZE = int(os.environ.get("FAQ_CACHE_SIZE", 500))
+CACHE_TTL = float(os.environ.get("FAQ_CACHE_TTL_SECONDS", 24 * 3600))
+# Estimated Jaccard similarity of shingle sets needed to reuse an answer
+SIMILARITY = float(os.environ.get("FAQ_CACHE_SIMILARITY", 0.8))
+
+# Answers depend on these - any change invalidates the cache
+WATCHED_FILES = (
+    os.path.join(BASE_DIR, "chatbot_config.py"),
+    os.path.join(BASE_DIR, "vital_mechanical_knowledge.txt"),
+)
+# Seconds between checks of the watched files
+WATCH_INTERVAL = 2.0
+
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+
+# Words that don't change what is being asked
+FILLER_WORDS = frozenset("""
+a an the please thanks thank hi hello hey um so just can could would you your
+do does did is are was i me my we us our tell know like to of about s
+vital mechanical
+""".split())
+
+# Longer questions (in content words) only get exact matches
+NEAR_MATCH_WORDS = 10
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z']*")
+_LOWER_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_PHONE_RE = re.compile(r"\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}")
+# "I'm Jane", "my name is john smith" - unless the next word is in NOT_NAMES
+_INTRODUCTION_RE = re.compile(r"\b(?:my name is|my name's|name is|this is|i am|i'm|im)\s+([a-z]+)")
+# "I'm from ...", "we are with ..."
+_AFFILIATION_RE = re.compile(r"\b(?:i'm|i am|we're|we are|i work|calling|writing)\s+(?:from|with|at)\b")
+
+# Words the regexes above need (checked first - most questions have none)
+INTRODUCTION_WORDS = frozenset("name this am i'm im from with at".split())
+NEGATIONS = frozenset("not no never nor without cannot dont doesnt didnt isnt arent wont cant".split())
+COMPANY_WORDS = frozenset("""
+inc llc ltd corp corporation company co group partners properties associates enterprises holdings
+""".split())
+
+# Words after "I'm" / "this is" that aren't a name
+NOT_NAMES = frozenset("""
+a an the not just so very also here there still now new looking interested wondering
+trying curious hoping calling writing reaching asking having getting going planning
+thinking from with at in on for about sure glad happy ready able unable urgent
+important regarding
+""".split())
+
+
+def normalize(question: str) -> str:
+    """Lowercase content words of a question, punctuation and filler removed"""
+    words = [w for w in _WORD_RE.findall(question.lower()) if w not in FILLER_WORDS]
+    # Light plural strip so "boilers" matches "boiler"
+    return " ".join(
+        w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+        for w in words
+    )
+
+
+def is_personal(question: str) -> bool:
+    """Whether a question introduces the visitor or their company, or carries contact details"""
+    if "@" in question and _EMAIL_RE.search(question):
+        return True
+    if _PHONE_RE.search(question):
+        return True
+    lowered = question.lower().replace("\u2019", "'")
+    words = set(_LOWER_TOKEN_RE.findall(lowered))
+    if words & COMPANY_WORDS:
+        return True
+    if not words & INTRODUCTION_WORDS:
+        return False
+    if _AFFILIATION_RE.search(lowered):
+        return True
+    return any(match.group(1) not in NOT_NAMES for match in _INTRODUCTION_RE.finditer(lowered))
+
+
+def has_negation(question: str) -> bool:
+    """Whether a question has a negation ("not", "don't", "without"...)"""
+    lowered = question.lower()
+    return "n't" in lowered or "n\u2019t" in lowered or not NEGATIONS.isdisjoint(_WORD_RE.findall(lowered))
+
+
+def has_proper_noun(question: str) -> bool:
+    """
+    Whether a question names something: a capitalized word that doesn't
+    start a sentence (short acronyms like HVAC and filler words aside)
+    """
+    for match in _TOKEN_RE.finditer(question):
+        word = match.group()
+        if not word[0].isupper() or word.lower() in FILLER_WORDS or word.split("'")[0] == "I":
+            continue
+        if word.isupper() and len(word) <= 5:
+            continue
+        before = question[:match.start()].rstrip()
+        if before and before[-1] not in ".!?":
+            return True
+    return False
+
+
+def near_matchable(question: str, text: str) -> bool:
+    """Whether a question (and its normalized text) may match near-duplicates: short, no negation, no proper noun"""
+    return (
+        len(text.split()) <= NEAR_MATCH_WORDS
+        and not has_negation(question)
+        and not has_proper_noun(question)
+    )
+
+
+@lru_cache(maxsize=None)
+def _permutations() -> Tuple["np.ndarray", "np.ndarray"]:
+    """MinHash hash coefficients (a, b), drawn once per process"""
+    import numpy as np
+
+    # Fixed seed: signatures must agree across workers and restarts
+    rng = np.random.default_rng(20040101)
+    return (
+        rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64),
+        rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64),
+    )
+
+
+def minhash(text: str) -> "np.ndarray":
+    """MinHash signature of a normalized question's character shingles"""
+    import numpy as np
+
+    perm_a, perm_b = _permutations()
+    padded = f" {text} "
+    shingles = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    hashes %= _PRIME
+    return ((perm_a[:, None] * hashes[None, :] + perm_b[:, None]) % _PRIME).min(axis=1)
+
+
+class FAQCache:
+    """
+    Thread-safe near-duplicate question -> answer cache
+
+    Each entry's signature is split into BANDS bands; questions sharing any
+    band are candidates, and a candidate is a hit if the share of equal
+    signature values (estimated Jaccard similarity) reaches `similarity`.
+    Questions that aren't near_matchable() get no signature: they are
+    neither candidates nor matched against them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        similarity: float = SIMILARITY,
+        watched_files: Tuple[str, ...] = WATCHED_FILES,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum cached answers (least recently used are evicted)
+            ttl: Seconds an answer stays valid
+            similarity: Minimum estimated Jaccard similarity for a near-duplicate hit
+            watched_files: Files whose modification invalidates every entry
+            clock: Time source (monotonic seconds)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.watched_files = watched_files
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # key -> (signature or None, answer, expires_at); key is (namespace, normalized question)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, str, float]]" = OrderedDict()
+        self._bands: Dict[Tuple[str, int, bytes], set] = {}
+
+        self._fingerprint = self._source_fingerprint()
+        self._next_check = clock() + WATCH_INTERVAL
+
+        self._metrics = {
+            "hits": 0,
+            "near_hits": 0,
+            "misses": 0,
+            "personal": 0,
+            "stores": 0,
+            "expired": 0,
+            "evicted": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, question: str, namespace: str = "") -> Optional[str]:
+        """
+        Cached answer for a question or, if it is near_matchable(), a
+        near-duplicate of it. Personal questions always miss
+
+        Args:
+            question: The customer's message
+            namespace: Separates answers given under different settings (e.g. feature flags)
+
+        Returns:
+            The answer, or None on a miss
+        """
+        text = normalize(question)
+        if not text:
+            return None
+        if is_personal(question):
+            with self._lock:
+                self._metrics["personal"] += 1
+            return None
+
+        with self._lock:
+            now = self._clock()
+            self._check_sources(now)
+
+            key = (namespace, text)
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self._metrics["hits"] += 1
+                return entry[1]
+            if not near_matchable(question, text):
+                self._metrics["misses"] += 1
+                return None
+
+            signature = minhash(text)
+            best_key, best_score = None, self.similarity
+            for candidate in self._candidates(namespace, signature):
+                candidate_entry = self._live_entry(candidate, now)
+                if candidate_entry is None:
+                    continue
+                score = float((candidate_entry[0] == signature).mean())
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is None:
+                self._metrics["misses"] += 1
+                return None
+
+            self._metrics["hits"] += 1
+            self._metrics["near_hits"] += 1
+            return self._entries[best_key][1]
+
+    def put(self, question: str, answer: str, namespace: str = ""):
+        """Cache the answer to a question"""
+        text = normalize(question)
+        if not text or not answer or self.max_entries <= 0:
+            return
+
+        signature = minhash(text) if near_matchable(question, text) else None
+        with self._lock:
+            now = self._clock()
+            self._check_sources(now)
+
+            key = (namespace, text)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, answer, now + self.ttl)
+            if signature is not None:
+                for band_key in self._band_keys(namespace, signature):
+                    self._bands.setdefault(band_key, set()).add(key)
+            self._metrics["stores"] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._metrics["evicted"] += 1
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache metrics: hits (exact and near-duplicate), misses, evictions, size"""
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "hit_rate": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity": self.similarity,
+            }
+
+    def _live_entry(self, key: Tuple[str, str], now: float) -> Optional[Tuple["np.ndarray", str, float]]:
+        """Entry for key if present and unexpired (marks it recently used). Caller must hold the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            self._remove(key)
+            self._metrics["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _candidates(self, namespace: str, signature: "np.ndarray") -> set:
+        """Keys sharing at least one LSH band with signature. Caller must hold the lock"""
+        candidates = set()
+        for band_key in self._band_keys(namespace, signature):
+            candidates |= self._bands.get(band_key, set())
+        return candidates
+
+    @staticmethod
+    def _band_keys(namespace: str, signature: "np.ndarray") -> List[Tuple[str, int, bytes]]:
+        return [
+            (namespace, band, signature[band * ROWS:(band + 1) * ROWS].tobytes())
+            for band in range(BANDS)
+        ]
+
+    def _remove(self, key: Tuple[str, str]):
+        """Drop an entry and its band postings. Caller must hold the lock"""
+        signature = self._entries.pop(key)[0]
+        if signature is None:
+            return
+        for band_key in self._band_keys(key[0], signature):
+            keys = self._bands.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band_key]
+
+    def _source_fingerprint(self) -> Tuple[Tuple[int, int], ...]:
+        """Modification time and size of each watched file"""
+        fingerprint = []
+        for path in self.watched_files:
+            try:
+                st = os.stat(path)
+                fingerprint.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                fingerprint.append((0, 0))
+        return tuple(fingerprint)
+
+    def _check_sources(self, now: float):
+        """Clear the cache if a watched file changed. Caller must hold the lock"""
+        if now < self._next_check:
+            return
+        self._next_check = now + WATCH_INTERVAL
+
+        fingerprint = self._source_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self._bands.clear()
+            self._metrics["invalidations"] += 1
+
+
+_cache: Optional[FAQCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_faq_cache() -> Optional[FAQCache]:
+    """Get the process-wide FAQ cache, or None if caching is disabled"""
+    global _cache
+    if CACHE_SIZE <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FAQCache()
+    return _cache
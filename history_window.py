@@ -0,0 +1,179 @@
+"""
+Conversation history windowing
+Keeps the history sent with each request under a token budget. When a
+conversation outgrows it, the oldest turns are folded into a short summary
+written by a cheaper model (or simply dropped). Cuts are always made at the
+start of a customer turn, so tool_use/tool_result pairs stay together.
+"""
+
+import json
+import os
+from typing import Optional, Dict, Any, List
+
+# Estimated tokens of history sent per request (0 disables windowing)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 6000))
+# "summarize" folds dropped turns into a summary; "trim" just drops them
+HISTORY_COMPACTION = os.environ.get("HISTORY_COMPACTION", "summarize")
+SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", "claude-3-5-haiku-20241022")
+SUMMARY_MAX_TOKENS = 400
+
+# Compaction brings history down to this share of the budget, so it happens
+# once every several turns rather than every turn (each compaction changes
+# the cached prompt prefix)
+COMPACT_TARGET_RATIO = 0.5
+
+SUMMARY_TAG = "conversation_summary"
+
+SUMMARY_SYSTEM_PROMPT = """You summarize the start of a customer service chat for Vital Mechanical Service (commercial HVAC, plumbing and controls).
+Write a brief factual summary, under 150 words, that lets the assistant continue the conversation: the customer's name, company, contact details, building and equipment, the problem or service they asked about, urgency, and anything already promised or recorded (e.g. a lead captured). Leave out greetings and general company information."""
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Rough token count of one message (~4 characters per token)"""
+    content = message["content"]
+    text = content if isinstance(content, str) else json.dumps(content, default=str)
+    return len(text) // 4 + 4
+
+
+def history_tokens(history: List[Dict[str, Any]]) -> int:
+    """Rough token count of a whole history"""
+    return sum(estimate_tokens(message) for message in history)
+
+
+def is_turn_start(message: Dict[str, Any]) -> bool:
+    """True for a customer's message (tool results are user messages too, but lists)"""
+    return message["role"] == "user" and isinstance(message["content"], str)
+
+
+def plan_compaction(history: List[Dict[str, Any]], budget: int = HISTORY_TOKEN_BUDGET) -> int:
+    """
+    Decide how much of a history to compact
+
+    Args:
+        history: Conversation so far (before the new user message)
+        budget: Token budget for the history
+
+    Returns:
+        Number of leading messages to compact away - always a turn boundary,
+        and never the latest turn (0 if the history fits)
+    """
+    if budget <= 0 or not history:
+        return 0
+
+    sizes = [estimate_tokens(message) for message in history]
+    remaining = sum(sizes)
+    if remaining <= budget:
+        return 0
+
+    target = budget * COMPACT_TARGET_RATIO
+    cut = 0
+    for i, message in enumerate(history):
+        # remaining is the size of history[i:]
+        if i > 0 and is_turn_start(message):
+            cut = i
+            if remaining <= target:
+                break
+        remaining -= sizes[i]
+    return cut
+
+
+def compacted(history: List[Dict[str, Any]], cut: int, summary: str = "") -> List[Dict[str, Any]]:
+    """History with its first `cut` messages replaced by a summary (if any)"""
+    kept = list(history[cut:])
+    if summary:
+        kept[0] = {
+            "role": "user",
+            "content": f"<{SUMMARY_TAG}>\n{summary}\n</{SUMMARY_TAG}>\n\n{kept[0]['content']}"
+        }
+    return kept
+
+
+def transcript(messages: List[Dict[str, Any]]) -> str:
+    """Plain-text rendering of messages for the summarizer"""
+    lines = []
+    for message in messages:
+        content = message["content"]
+        speaker = "Customer" if message["role"] == "user" else "Assistant"
+        if isinstance(content, str):
+            lines.append(f"{speaker}: {content}")
+            continue
+        for block in content:
+            if block.get("type") == "text":
+                lines.append(f"{speaker}: {block['text']}")
+            elif block.get("type") == "tool_use":
+                lines.append(f"[Assistant called {block['name']}: {json.dumps(block['input'])}]")
+            elif block.get("type") == "tool_result":
+                lines.append(f"[Tool result: {block['content']}]")
+    return "\n".join(lines)
+
+
+def _summary_params(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": SUMMARY_MAX_TOKENS,
+        "system": SUMMARY_SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": transcript(messages)}]
+    }
+
+
+def _summary_text(response: Any, usage: Optional[Dict[str, int]]) -> str:
+    """The summary's text, adding the call's token usage to usage (if given)"""
+    if usage is not None and response.usage is not None:
+        for field in usage:
+            usage[field] += getattr(response.usage, field, None) or 0
+    return "".join(block.text for block in response.content if block.type == "text").strip()
+
+
+def compact_history(
+    client: Any,
+    history: List[Dict[str, Any]],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    usage: Optional[Dict[str, int]] = None
+) -> bool:
+    """
+    Bring a history back under budget, in place
+
+    Args:
+        client: Anthropic client used for the summary
+        history: Conversation so far (before the new user message)
+        budget: Token budget for the history
+        usage: Token counters (e.g. input_tokens) the summary call's usage is added to
+
+    Returns:
+        True if the history was compacted
+    """
+    cut = plan_compaction(history, budget)
+    if not cut:
+        return False
+
+    summary = ""
+    if HISTORY_COMPACTION == "summarize":
+        try:
+            summary = _summary_text(client.messages.create(**_summary_params(history[:cut])), usage)
+        except Exception:
+            pass  # Trimming without a summary still keeps the request in budget
+
+    history[:] = compacted(history, cut, summary)
+    return True
+
+
+async def acompact_history(
+    client: Any,
+    history: List[Dict[str, Any]],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    usage: Optional[Dict[str, int]] = None
+) -> bool:
+    """Async version of compact_history() - client is an AsyncAnthropic"""
+    cut = plan_compaction(history, budget)
+    if not cut:
+        return False
+
+    summary = ""
+    if HISTORY_COMPACTION == "summarize":
+        try:
+            summary = _summary_text(await client.messages.create(**_summary_params(history[:cut])), usage)
+        except Exception:
+            pass
+
+    history[:] = compacted(history, cut, summary)
+    return True
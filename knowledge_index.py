@@ -0,0 +1,302 @@
+"""
+Knowledge base retrieval
+BM25 index over the sections of vital_mechanical_knowledge.txt, so each turn
+only carries the few sections relevant to the customer's question.
+
+Build the on-disk index (also rebuilt automatically when the text changes):
+    python knowledge_index.py build
+
+Try a query:
+    python knowledge_index.py query "do you service mitsubishi vrf systems?"
+
+numpy is imported by the methods that use it, so importing this module
+doesn't add it to the server's cold start.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+from typing import TYPE_CHECKING, Optional, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KNOWLEDGE_FILE = os.path.join(BASE_DIR, "vital_mechanical_knowledge.txt")
+INDEX_FILE = os.environ.get("KNOWLEDGE_INDEX_FILE", os.path.join(BASE_DIR, "knowledge_index.npz"))
+
+# Sections injected per turn (0 disables retrieval)
+TOP_K = int(os.environ.get("KNOWLEDGE_TOP_K", 3))
+# Sections scoring below this, or below this share of the best section's
+# score, are not worth their tokens
+MIN_SCORE = float(os.environ.get("KNOWLEDGE_MIN_SCORE", 2.0))
+MIN_SCORE_RATIO = 0.5
+
+# Terms are hashed into a fixed number of buckets - no vocabulary to store
+HASH_BUCKETS = 1 << 16
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+STOPWORDS = frozenset("""
+a about an and are as at be by can do does for from how i if in is it its me
+my of on or our so that the their them there this to us we what when where
+which who why will with you your
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with a light plural strip"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def term_bucket(token: str) -> int:
+    """Stable hash bucket for a token (crc32 - Python's hash() is salted per process)"""
+    return zlib.crc32(token.encode()) % HASH_BUCKETS
+
+
+def split_sections(text: str) -> List[Dict[str, str]]:
+    """
+    Split the knowledge file into retrievable chunks
+    Each ### subsection is its own chunk (titled with its ## parent); a ##
+    section's text before its first ### is a chunk of its own.
+    """
+    chunks = []
+    section = subsection = None
+    lines: List[str] = []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if section and body:
+            title = f"{section} / {subsection}" if subsection else section
+            chunks.append({"title": title, "text": body})
+
+    for line in text.splitlines():
+        if line.startswith("### "):
+            flush()
+            subsection, lines = line[4:].strip(), []
+        elif line.startswith("## "):
+            flush()
+            section, subsection, lines = line[3:].strip(), None, []
+        elif not line.startswith("# "):
+            lines.append(line)
+    flush()
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    BM25 over hashed terms, stored as term-major postings
+
+    For term bucket t, postings_doc[term_ptr[t]:term_ptr[t+1]] are the chunks
+    containing it and postings_weight the precomputed BM25 weight (idf and
+    length normalisation included), so a query is a handful of array slices
+    and one np.add.at.
+    """
+
+    def __init__(
+        self,
+        chunks: List[Dict[str, str]],
+        term_ptr: "np.ndarray",
+        postings_doc: "np.ndarray",
+        postings_weight: "np.ndarray",
+        source_hash: str
+    ):
+        self.chunks = chunks
+        self.term_ptr = term_ptr
+        self.postings_doc = postings_doc
+        self.postings_weight = postings_weight
+        self.source_hash = source_hash
+
+    @classmethod
+    def build(cls, text: str) -> "KnowledgeIndex":
+        """Build the index from the knowledge file's text"""
+        import numpy as np
+
+        chunks = split_sections(text)
+        doc_terms = []
+        for chunk in chunks:
+            counts: Dict[int, int] = {}
+            # Headings count twice - they say what the section is about
+            for token in tokenize(f"{chunk['title']}\n{chunk['title']}\n{chunk['text']}"):
+                bucket = term_bucket(token)
+                counts[bucket] = counts.get(bucket, 0) + 1
+            doc_terms.append(counts)
+
+        doc_len = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+        avg_len = float(doc_len.mean()) if len(doc_len) else 1.0
+        n_docs = len(chunks)
+
+        doc_freq: Dict[int, int] = {}
+        for counts in doc_terms:
+            for bucket in counts:
+                doc_freq[bucket] = doc_freq.get(bucket, 0) + 1
+
+        postings: Dict[int, List[Tuple[int, float]]] = {}
+        for doc, counts in enumerate(doc_terms):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[doc] / avg_len)
+            for bucket, tf in counts.items():
+                idf = np.log(1 + (n_docs - doc_freq[bucket] + 0.5) / (doc_freq[bucket] + 0.5))
+                weight = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                postings.setdefault(bucket, []).append((doc, float(weight)))
+
+        term_ptr = np.zeros(HASH_BUCKETS + 1, dtype=np.int32)
+        for bucket, entries in postings.items():
+            term_ptr[bucket + 1] = len(entries)
+        term_ptr = np.cumsum(term_ptr, dtype=np.int32)
+
+        postings_doc = np.empty(term_ptr[-1], dtype=np.int16)
+        postings_weight = np.empty(term_ptr[-1], dtype=np.float32)
+        for bucket, entries in postings.items():
+            start = term_ptr[bucket]
+            for offset, (doc, weight) in enumerate(entries):
+                postings_doc[start + offset] = doc
+                postings_weight[start + offset] = weight
+
+        return cls(chunks, term_ptr, postings_doc, postings_weight, _hash_text(text))
+
+    def search(self, query: str, top_k: int = TOP_K, min_score: float = MIN_SCORE) -> List[Tuple[float, Dict[str, str]]]:
+        """
+        Best matching chunks for a query
+
+        Returns:
+            Up to top_k (score, chunk) pairs, best first, each scoring at least
+            min_score and MIN_SCORE_RATIO of the best score
+        """
+        import numpy as np
+
+        buckets = {term_bucket(token) for token in tokenize(query)}
+        if not buckets or top_k <= 0:
+            return []
+
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for bucket in buckets:
+            start, end = self.term_ptr[bucket], self.term_ptr[bucket + 1]
+            if start != end:
+                np.add.at(scores, self.postings_doc[start:end], self.postings_weight[start:end])
+
+        best = np.argsort(-scores)[:top_k]
+        cutoff = max(min_score, float(scores[best[0]]) * MIN_SCORE_RATIO)
+        return [(float(scores[i]), self.chunks[i]) for i in best if scores[i] >= cutoff]
+
+    def context_for(self, query: str, top_k: int = TOP_K) -> str:
+        """Relevant knowledge formatted for the prompt ("" if nothing relevant)"""
+        results = self.search(query, top_k)
+        if not results:
+            return ""
+        sections = "\n\n".join(f"[{chunk['title']}]\n{chunk['text']}" for _, chunk in results)
+        return f"<knowledge>\n{sections}\n</knowledge>"
+
+    def save(self, path: str = INDEX_FILE):
+        """Write the index as a compressed .npz file"""
+        import numpy as np
+
+        np.savez_compressed(
+            path,
+            version=np.array(INDEX_VERSION),
+            source_hash=np.array(self.source_hash),
+            chunks=np.array(json.dumps(self.chunks)),
+            term_ptr=self.term_ptr,
+            postings_doc=self.postings_doc,
+            postings_weight=self.postings_weight,
+        )
+
+    @classmethod
+    def load(cls, path: str = INDEX_FILE) -> "KnowledgeIndex":
+        """Read an index written by save()"""
+        import numpy as np
+
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError("knowledge index version mismatch")
+            return cls(
+                json.loads(str(data["chunks"])),
+                data["term_ptr"],
+                data["postings_doc"],
+                data["postings_weight"],
+                str(data["source_hash"]),
+            )
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def build_index(knowledge_file: str = KNOWLEDGE_FILE, index_file: str = INDEX_FILE) -> KnowledgeIndex:
+    """Build the index from the knowledge file and save it"""
+    with open(knowledge_file, "r", encoding="utf-8") as f:
+        index = KnowledgeIndex.build(f.read())
+    index.save(index_file)
+    return index
+
+
+def load_index(knowledge_file: str = KNOWLEDGE_FILE, index_file: str = INDEX_FILE) -> KnowledgeIndex:
+    """
+    Load the prebuilt index, rebuilding it if it is missing or the knowledge
+    file has changed since it was built
+    """
+    with open(knowledge_file, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    if os.path.exists(index_file):
+        try:
+            index = KnowledgeIndex.load(index_file)
+            if index.source_hash == _hash_text(text):
+                return index
+        except (ValueError, KeyError, OSError):
+            pass
+
+    index = KnowledgeIndex.build(text)
+    try:
+        index.save(index_file)
+    except OSError:
+        pass  # Read-only deploy - keep the in-memory index
+    return index
+
+
+_index: Optional[KnowledgeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> Optional[KnowledgeIndex]:
+    """Get the process-wide index, or None if retrieval is disabled"""
+    global _index
+    if TOP_K <= 0:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_index()
+    return _index
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+
+    if command == "build":
+        index = build_index()
+        size = os.path.getsize(INDEX_FILE)
+        print(f"Indexed {len(index.chunks)} sections -> {INDEX_FILE} ({size / 1024:.1f} KB)")
+    elif command == "query":
+        index = load_index()
+        for score, chunk in index.search(" ".join(sys.argv[2:])):
+            print(f"{score:6.2f}  {chunk['title']}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Lead storage
+Append-only SQLite (WAL mode) store shared by the chatbot and the API servers
+"""
+
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Mapping, Callable
+
+# Directory for storing data (leads, etc.) - one path for writers and readers
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+LEADS_DB = os.path.join(DATA_DIR, "leads.db")
+
+# Old JSON array files; imported once into an empty store.
+# Leads used to be written to the working directory, the API read DATA_DIR.
+LEGACY_LEAD_FILES = [os.path.join(DATA_DIR, "leads.json"), "leads.json"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    urgency TEXT,
+    service_interest TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_timestamp ON leads (timestamp);
+CREATE INDEX IF NOT EXISTS idx_leads_urgency ON leads (urgency);
+CREATE INDEX IF NOT EXISTS idx_leads_service ON leads (service_interest COLLATE NOCASE);
+
+-- Aggregates kept up to date in the same transaction as each insert,
+-- so /api/stats never has to scan the leads table
+CREATE TABLE IF NOT EXISTS lead_counts (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (dimension, key)
+);
+CREATE TABLE IF NOT EXISTS lead_buckets (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket)
+);
+"""
+
+# Timestamp prefix length for each time bucket ("2026-01-31T14" / "2026-01-31")
+BUCKET_PREFIX = {"hour": 13, "day": 10}
+
+RECENT_LEADS = 5
+
+# Columns for CSV export, in order (other keys are left out)
+EXPORT_FIELDS = [
+    "id", "timestamp", "status", "name", "email", "phone",
+    "service_interest", "urgency", "message",
+]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Query-string filters accepted by /api/leads and /api/leads/export
+FILTER_PARAMS = ("since", "until", "urgency", "service")
+
+
+class LeadStore:
+    """
+    Append-only lead store
+
+    Each lead is one INSERT - no read-modify-write of the whole file - and ids
+    come from SQLite's AUTOINCREMENT, so concurrent writers never collide or
+    lose records. WAL mode lets readers run alongside the writer, and
+    synchronous=NORMAL batches fsyncs to WAL checkpoints instead of every commit.
+    """
+
+    def __init__(self, path: str = LEADS_DB, synchronous: str = None):
+        """
+        Open (and create if needed) the lead store
+
+        Args:
+            path: SQLite database file
+            synchronous: SQLite synchronous level - NORMAL (default, fsync batched
+                at checkpoints) or FULL (fsync every lead)
+        """
+        self.path = path
+        self.synchronous = (synchronous or os.environ.get("LEADS_SYNC", "NORMAL")).upper()
+        if self.synchronous not in ("NORMAL", "FULL"):
+            raise ValueError("synchronous must be NORMAL or FULL")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        conn = self._connection()
+        with self._write_lock:
+            conn.executescript(SCHEMA)
+            self._import_legacy(conn)
+            self._backfill_aggregates(conn)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (sqlite3 connections aren't shareable across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    def add(
+        self,
+        lead: Dict[str, Any],
+        after_insert: Optional[Callable[[sqlite3.Connection, int], Any]] = None
+    ) -> int:
+        """
+        Append a lead
+
+        Args:
+            lead: Lead record (must include "timestamp")
+            after_insert: Called with (connection, lead id) inside the insert's
+                transaction - e.g. to queue outbox events that commit with the lead
+
+        Returns:
+            The new lead's id
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO leads (timestamp, urgency, service_interest, data) VALUES (?, ?, ?, ?)",
+                    (
+                        lead["timestamp"],
+                        lead.get("urgency"),
+                        lead.get("service_interest"),
+                        json.dumps(lead)
+                    )
+                )
+                self._count_lead(conn, lead)
+                if after_insert is not None:
+                    after_insert(conn, cursor.lastrowid)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return cursor.lastrowid
+
+    def stats(self, recent: int = RECENT_LEADS, hours: int = 24, days: int = 30) -> Dict[str, Any]:
+        """
+        Lead statistics from the maintained aggregates (no table scan)
+
+        Args:
+            recent: Number of most recent leads to include
+            hours: Number of hourly buckets to include (most recent first)
+            days: Number of daily buckets to include (most recent first)
+        """
+        conn = self._connection()
+
+        by_dimension: Dict[str, Dict[str, int]] = {"total": {}, "urgency": {}, "service": {}}
+        for row in conn.execute("SELECT dimension, key, count FROM lead_counts"):
+            by_dimension.setdefault(row["dimension"], {})[row["key"]] = row["count"]
+
+        def buckets(granularity: str, limit: int) -> Dict[str, int]:
+            rows = conn.execute(
+                "SELECT bucket, count FROM lead_buckets WHERE granularity = ? "
+                "ORDER BY bucket DESC LIMIT ?",
+                (granularity, limit)
+            )
+            return {row["bucket"]: row["count"] for row in rows}
+
+        recent_rows = conn.execute(
+            "SELECT id, data FROM leads ORDER BY id DESC LIMIT ?", (recent,)
+        )
+
+        return {
+            "total_leads": by_dimension["total"].get("all", 0),
+            "leads_by_urgency": by_dimension["urgency"],
+            "leads_by_service": by_dimension["service"],
+            "leads_by_hour": buckets("hour", hours),
+            "leads_by_day": buckets("day", days),
+            "recent_activity": [self._row_to_lead(row) for row in recent_rows]
+        }
+
+    @staticmethod
+    def _count_lead(conn: sqlite3.Connection, lead: Dict[str, Any], amount: int = 1):
+        """Add a lead to the aggregate counters. Caller must be in a transaction"""
+        conn.executemany(
+            "INSERT INTO lead_counts (dimension, key, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (dimension, key) DO UPDATE SET count = count + excluded.count",
+            [
+                ("total", "all", amount),
+                ("urgency", lead.get("urgency") or "normal", amount),
+                ("service", lead.get("service_interest") or "Unknown", amount),
+            ]
+        )
+        timestamp = lead.get("timestamp") or ""
+        conn.executemany(
+            "INSERT INTO lead_buckets (granularity, bucket, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + excluded.count",
+            [
+                (granularity, timestamp[:length], amount)
+                for granularity, length in BUCKET_PREFIX.items()
+                if len(timestamp) >= length
+            ]
+        )
+
+    def query(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        urgency: Optional[str] = None,
+        service: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        One page of leads, oldest first, using the indexes for filtering
+
+        Args:
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            cursor: next_cursor from the previous page (leads after this id)
+            since: Only leads with timestamp >= since (ISO format)
+            until: Only leads with timestamp < until (ISO format)
+            urgency: Exact urgency (emergency, urgent, normal, flexible)
+            service: Service interest (case-insensitive)
+
+        Returns:
+            (leads, next_cursor) - next_cursor is None on the last page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = self._filters(cursor, since, until, urgency, service)
+
+        rows = self._connection().execute(
+            f"SELECT id, data FROM leads {where} ORDER BY id LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        leads = [self._row_to_lead(row) for row in rows[:limit]]
+        next_cursor = leads[-1]["id"] if len(rows) > limit else None
+        return leads, next_cursor
+
+    def iter_leads(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        urgency: Optional[str] = None,
+        service: Optional[str] = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream matching leads from a cursor, oldest first, without loading them all"""
+        where, params = self._filters(None, since, until, urgency, service)
+        cursor = self._connection().execute(
+            f"SELECT id, data FROM leads {where} ORDER BY id", params
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._row_to_lead(row)
+        finally:
+            cursor.close()
+
+    def iter_csv(self, rows_per_chunk: int = 200, **filters) -> Iterator[str]:
+        """
+        Stream matching leads as CSV text chunks (header first)
+
+        Args:
+            rows_per_chunk: Rows written per yielded chunk
+            **filters: since, until, urgency, service (see query())
+        """
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+
+        rows = 0
+        for lead in self.iter_leads(**filters):
+            writer.writerow(lead)
+            rows += 1
+            if rows % rows_per_chunk == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+    def has_leads(self) -> bool:
+        """True if at least one lead is stored"""
+        return self._connection().execute("SELECT 1 FROM leads LIMIT 1").fetchone() is not None
+
+    @staticmethod
+    def _filters(
+        cursor: Optional[int],
+        since: Optional[str],
+        until: Optional[str],
+        urgency: Optional[str],
+        service: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """WHERE clause and parameters for the query filters"""
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append("id > ?")
+            params.append(int(cursor))
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if urgency:
+            clauses.append("urgency = ?")
+            params.append(urgency)
+        if service:
+            clauses.append("service_interest = ? COLLATE NOCASE")
+            params.append(service)
+
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Every lead, oldest first"""
+        rows = self._connection().execute("SELECT id, data FROM leads ORDER BY id")
+        return [self._row_to_lead(row) for row in rows]
+
+    def count(self) -> int:
+        """Number of stored leads"""
+        return self._connection().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row_to_lead(row: sqlite3.Row) -> Dict[str, Any]:
+        # The row id wins over any "id" that came in with the lead's data
+        return {**json.loads(row["data"]), "id": row["id"]}
+
+    def _backfill_aggregates(self, conn: sqlite3.Connection):
+        """Build the aggregates for leads stored before they existed (one-time)"""
+        # Checked inside the write transaction - workers starting together
+        # must not both count the same leads
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if (not conn.execute("SELECT 1 FROM lead_counts LIMIT 1").fetchone()
+                    and conn.execute("SELECT 1 FROM leads LIMIT 1").fetchone()):
+                for row in conn.execute("SELECT data FROM leads ORDER BY id").fetchall():
+                    self._count_lead(conn, json.loads(row["data"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Import leads from the old JSON files into an empty store"""
+        # The emptiness check and the inserts share one write transaction, so
+        # of several workers starting at once only the first imports
+        conn.execute("BEGIN IMMEDIATE")
+        imported = []
+        try:
+            if not conn.execute("SELECT 1 FROM leads LIMIT 1").fetchone():
+                for legacy_file in LEGACY_LEAD_FILES:
+                    try:
+                        with open(legacy_file, "r") as f:
+                            leads = json.load(f)
+                    except FileNotFoundError:
+                        continue  # None there, or another worker already moved it
+
+                    for lead in leads:
+                        conn.execute(
+                            "INSERT INTO leads (timestamp, urgency, service_interest, data) VALUES (?, ?, ?, ?)",
+                            (lead.get("timestamp", ""), lead.get("urgency"), lead.get("service_interest"), json.dumps(lead))
+                        )
+                        self._count_lead(conn, lead)
+                    imported.append(legacy_file)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        for legacy_file in imported:
+            try:
+                os.replace(legacy_file, legacy_file + ".imported")
+            except FileNotFoundError:
+                pass  # Moved by another worker
+
+
+def filters_from_args(args: Mapping[str, str]) -> Dict[str, str]:
+    """Pick the lead filters out of request query parameters"""
+    return {name: args[name] for name in FILTER_PARAMS if args.get(name)}
+
+
+_store: Optional[LeadStore] = None
+_store_lock = threading.Lock()
+
+
+def get_lead_store() -> LeadStore:
+    """Get the process-wide lead store, opening it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LeadStore()
+    return _store
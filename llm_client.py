@@ -0,0 +1,81 @@
+"""
+Shared Anthropic client
+One pooled, keep-alive HTTP client per worker process, reused by every chatbot
+
+Calls go through resilience.py (deadlines, budgeted retries, circuit
+breaker), so the SDK's own retries are turned off.
+
+The SDK is imported when the first client is created rather than with this
+module - it is most of the server's import time, and /health shouldn't
+wait for it on a cold start.
+"""
+
+import threading
+from typing import Dict
+
+from resilience import ResilientClient, AsyncResilientClient, get_resilience
+
+_clients: Dict[str, ResilientClient] = {}
+_async_clients: Dict[str, AsyncResilientClient] = {}
+_lock = threading.Lock()
+
+
+def get_client(api_key: str) -> ResilientClient:
+    """
+    Get the process-wide client for an API key, creating it on first use
+
+    Args:
+        api_key: Anthropic API key
+
+    Returns:
+        Shared Anthropic client (thread-safe, reuses TLS connections), with
+        messages.create/stream wrapped in the process-wide resilience policy
+    """
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            from anthropic import Anthropic
+
+            # The SDK client owns a keep-alive connection pool and is thread-safe
+            client = ResilientClient(Anthropic(api_key=api_key, max_retries=0), get_resilience())
+            _clients[api_key] = client
+        return client
+
+
+def get_async_client(api_key: str) -> AsyncResilientClient:
+    """
+    Get the process-wide async client for an API key, creating it on first use
+    Used by the ASGI server; must be used from a single event loop
+
+    Args:
+        api_key: Anthropic API key
+
+    Returns:
+        Shared AsyncAnthropic client
+    """
+    client = _async_clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _async_clients.get(api_key)
+        if client is None:
+            from anthropic import AsyncAnthropic
+
+            client = AsyncResilientClient(AsyncAnthropic(api_key=api_key, max_retries=0), get_resilience())
+            _async_clients[api_key] = client
+        return client
+
+
+def reset_clients():
+    """Close and forget all shared sync clients (e.g. after fork, or in tests)"""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        # Async clients can only be closed from their event loop; just drop them
+        _async_clients.clear()
@@ -0,0 +1,368 @@
+"""
+Latency and usage metrics in the Prometheus text format (served at /metrics)
+
+- Histograms of time spent in each stage of a chat turn (history
+  compaction, retrieval, the first model call, follow-up calls after tool
+  use, tool execution, lead store writes), per tool, and per HTTP route.
+- Token counters per model, from each response's usage.
+- Gauges read from the existing stats() methods when /metrics is scraped
+  (sessions, session memory, requests in flight, breaker state, outbox
+  backlog), so they cost nothing between scrapes.
+
+Set METRICS=off to turn it all off: span() then returns a shared no-op
+context manager and /metrics returns 404.
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable
+
+METRICS_ENABLED = os.environ.get("METRICS", "on").lower() not in ("off", "0", "false", "no")
+
+# Bucket upper bounds in seconds - from a cache lookup up to a long tool-using turn
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination; thread-safe"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Any, ...], List[Any]] = {}  # labels -> [bucket counts, count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: Any):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = [(labels, list(counts), count, total) for labels, (counts, count, total) in self._series.items()]
+        for labels, counts, count, total in sorted(snapshot, key=lambda item: item[0]):
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                running += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {running}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(round(total, 6))}"
+
+
+class Counter:
+    """Monotonic counter, one series per label combination; thread-safe"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[Any, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: Any):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class CallbackMetric:
+    """
+    Gauge (or counter) whose value is read when metrics are rendered
+    fn returns a number, a {label values tuple: number} dict, or None to skip
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], Any],
+        label_names: Tuple[str, ...] = (),
+        kind: str = "gauge"
+    ):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self) -> Iterable[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return  # A broken collector shouldn't take /metrics down
+        if value is None:
+            return
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in sorted(items):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(number)}"
+
+
+class StatsGauges:
+    """
+    Metrics for numeric fields of a stats() dict, read once per render
+    fields: stats key (dots for nested keys) -> (metric name, help text)
+    kind: "gauge", or "counter" for running totals
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stats_fn: Callable[[], Dict[str, Any]],
+        fields: Dict[str, Tuple[str, str]],
+        kind: str = "gauge"
+    ):
+        self.name = name
+        self.stats_fn = stats_fn
+        self.fields = fields
+        self.kind = kind
+
+    def families(self) -> Iterable[Tuple[str, str, str, List[str]]]:
+        try:
+            stats = self.stats_fn()
+        except Exception:
+            return
+        for field, (metric_name, help_text) in self.fields.items():
+            value: Any = stats
+            for key in field.split("."):
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                yield metric_name, help_text, self.kind, [f"{metric_name} {_number(value)}"]
+
+
+class MetricsRegistry:
+    """Metrics exposed on /metrics, in registration order"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, label_names))
+
+    def callback(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], Any],
+        label_names: Tuple[str, ...] = (),
+        kind: str = "gauge"
+    ) -> CallbackMetric:
+        """Register a metric read from fn at render time (replaces one of the same name)"""
+        metric = CallbackMetric(name, help_text, fn, label_names, kind)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def stats_gauges(
+        self,
+        name: str,
+        stats_fn: Callable[[], Dict[str, Any]],
+        fields: Dict[str, Tuple[str, str]],
+        kind: str = "gauge"
+    ) -> StatsGauges:
+        """Register metrics read from one stats() call per render (replaces a collector of the same name)"""
+        collector = StatsGauges(name, stats_fn, fields, kind)
+        with self._lock:
+            self._metrics[name] = collector
+        return collector
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            families = (
+                metric.families() if hasattr(metric, "families")
+                else [(metric.name, metric.help, metric.kind, list(metric.samples()))]
+            )
+            for name, help_text, kind, samples in families:
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "chatbot_stage_seconds",
+    "Time spent in each stage of a chat turn (turn = the whole turn)",
+    ("stage",)
+)
+TOOL_SECONDS = registry.histogram(
+    "chatbot_tool_seconds",
+    "Tool execution time by tool and outcome",
+    ("tool", "outcome")
+)
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Time to produce each HTTP response (for streams, until the stream starts)",
+    ("method", "route", "status")
+)
+TOKENS = registry.counter(
+    "chatbot_tokens_total",
+    "Tokens reported by the Anthropic API, by model and type",
+    ("model", "type")
+)
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.stage)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def span(stage: str):
+    """Context manager timing a stage of a chat turn into chatbot_stage_seconds"""
+    return _Span(stage) if METRICS_ENABLED else _NOOP
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage timed elsewhere"""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def observe_tool(tool: str, seconds: float, success: bool):
+    if METRICS_ENABLED:
+        TOOL_SECONDS.observe(seconds, tool, "success" if success else "error")
+
+
+def observe_request(method: str, route: Optional[str], status: int, started: Optional[float]):
+    """Record an HTTP request timed from started (perf_counter) - route is the URL rule, not the path"""
+    if METRICS_ENABLED and started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, method, route or "unmatched", status)
+
+
+def count_tokens(model: str, usage: Dict[str, int]):
+    """Add one turn's token usage to the per-model counters"""
+    if METRICS_ENABLED:
+        for field, value in usage.items():
+            if value:
+                TOKENS.inc(value, model, field.replace("_tokens", ""))
+
+
+def register_server_metrics(
+    session_store: Any,
+    admission: Any,
+    usage_stats: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+    outbox: Any = None
+):
+    """
+    Expose a server's session store, admission control, resilience policy,
+    chatbot usage totals and outbox as metrics read at scrape time
+    """
+    from resilience import get_resilience
+
+    registry.stats_gauges("sessions", session_store.stats, {
+        "active_sessions": ("chatbot_sessions_active", "Sessions currently stored"),
+        "memory_bytes": ("chatbot_session_memory_bytes", "Estimated memory held by in-memory sessions"),
+    })
+    registry.stats_gauges("admission", admission.stats, {
+        "in_flight.in_flight": ("chatbot_requests_in_flight", "Chat turns running"),
+        "in_flight.waiting": ("chatbot_requests_queued", "Chat requests waiting for an in-flight slot"),
+    })
+    registry.stats_gauges("admission_rejections", admission.stats, {
+        "in_flight.queue_full": ("chatbot_rejected_queue_full_total", "Requests rejected because the queue was full"),
+        "in_flight.queue_timeouts": ("chatbot_rejected_queue_timeout_total", "Requests that timed out waiting for a slot"),
+        "ip_rate_limit.rejected": ("chatbot_rate_limited_ip_total", "Requests over the per-IP rate limit"),
+        "session_rate_limit.rejected": ("chatbot_rate_limited_session_total", "Requests over the per-session rate limit"),
+    }, kind="counter")
+
+    resilience = get_resilience()
+    registry.callback(
+        "chatbot_upstream_breaker_state",
+        "Circuit breaker state for the Anthropic API (1 for the current state)",
+        lambda: {(state,): int(resilience.breaker.state == state) for state in ("closed", "half_open", "open")},
+        ("state",)
+    )
+    registry.stats_gauges("upstream", resilience.stats, {
+        "calls": ("chatbot_upstream_calls_total", "Anthropic API calls"),
+        "retries": ("chatbot_upstream_retries_total", "Anthropic API retries"),
+        "failures": ("chatbot_upstream_failures_total", "Failed Anthropic API attempts"),
+    }, kind="counter")
+
+    if usage_stats is not None:
+        turn_kinds = ("turns", "cached_turns", "coalesced_turns", "degraded_turns")
+
+        def turns():
+            stats = usage_stats()
+            if not stats:
+                return None
+            return {(kind.replace("_turns", "") if kind != "turns" else "model",): stats.get(kind, 0) for kind in turn_kinds}
+
+        registry.callback("chatbot_turns_total", "Chat turns by how they were answered", turns, ("answered_by",), "counter")
+
+    if outbox is not None:
+        registry.stats_gauges("outbox", outbox.stats, {
+            "events.pending": ("chatbot_outbox_pending", "Tool side effects waiting for delivery"),
+            "events.dead": ("chatbot_outbox_dead", "Tool side effects given up on"),
+            "oldest_pending_seconds": ("chatbot_outbox_oldest_pending_seconds", "Age of the oldest undelivered event"),
+        })
@@ -0,0 +1,216 @@
+"""
+Model routing
+Classifies each turn locally (keyword rules, no model call) and sends simple
+turns - thanks, greetings, questions about company facts - to a smaller,
+faster model. Anything that may lead to capture_lead, or looks complex,
+stays on the main model: a problem or a need ("our rooftop unit is making a
+grinding noise", "we need a maintenance contract") is lead territory even
+when it names one of our services.
+"""
+
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, NamedTuple, FrozenSet
+
+from chatbot_config import COMPANY_INFO
+
+SMART_MODEL = os.environ.get("ROUTER_SMART_MODEL", "claude-sonnet-4-20250514")
+FAST_MODEL = os.environ.get("ROUTER_FAST_MODEL", "claude-3-5-haiku-20241022")
+# "off" sends every turn to SMART_MODEL
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "on").lower() != "off"
+
+# Messages longer than this (in words) go to the main model
+COMPLEX_WORDS = 30
+
+# Turn latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_PHONE_RE = re.compile(r"\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}")
+
+# Phrases that suggest the customer wants service - capture_lead territory
+LEAD_PHRASES = (
+    "schedule", "appointment", "book", "quote", "estimate", "price", "pricing",
+    "cost", "call me", "contact me", "email me", "reach me", "my name", "my number",
+    "send someone", "come out", "technician", "emergenc", "urgent", "asap",
+    "broken", "not working", "isn't working", "aren't working", "working right",
+    "stopped working", "not cooling", "not heating", "no heat", "no cooling",
+    "leak", "problem", "issue", "repair", "replace", "install", "proposal", "bid",
+    "noise", "noisy", "grinding", "rattl", "squeal", "banging", "smell", "clog",
+    "backed up", "overflow", "drip", "flood", "frozen", "tripp", "not draining",
+    "contract", "maintenance", "service call", "inspection", "upgrade", "retrofit",
+    "we need", "i need", "we want", "i want", "need someone", "looking for someone",
+    "i manage", "we manage", "can you help", "help with", "can someone",
+    "come look", "take a look", "look at our", "look at my",
+)
+
+# "our rooftop unit is ...", "my water heater keeps ..." - something of theirs needs attention
+_PROBLEM_RE = re.compile(
+    r"\b(?:our|my)\s+(?:[\w'-]+\s+){0,4}?(?:is|are|isn't|aren't|keeps|won't|has been|have been|was|were)\b"
+)
+
+# Phrases that need reasoning rather than a stored fact
+COMPLEX_PHRASES = (
+    "why", "compare", "difference", "recommend", "should i", "should we",
+    "explain", "which is better", "troubleshoot", "what would", "how do i",
+)
+
+SMALLTALK_WORDS = frozenset("""
+hi hello hey there thanks thank you ok okay great cool awesome perfect got it
+bye goodbye good morning afternoon evening nice that's helpful sounds appreciate
+""".split())
+
+# Company facts the fast model answers from the system prompt
+FACT_WORDS = frozenset("""
+where located location based founded since history years long business old
+values value mission tagline philosophy clients customers website site phone
+email address area areas serve region puget sound seattle washington hours
+services offer provide different differentiators about who
+""".split())
+
+# A message that starts with one of these (or has a "?") is a question -
+# only questions are answered as company facts
+QUESTION_WORDS = frozenset("""
+what where when who how which do does did can could are is will would tell
+""".split())
+
+# Assistant questions that mean the customer's next message is lead details
+_LEAD_PROMPT_RE = re.compile(r"\b(your name|phone|email|contact|best time|address|company name)\b.*\?", re.I)
+
+
+class Route(NamedTuple):
+    """Where one turn goes and why"""
+    tier: str
+    model: str
+    reason: str
+
+
+@lru_cache(maxsize=None)
+def company_terms() -> FrozenSet[str]:
+    """Words naming the company's services, values and clients - in a question, they ask about us"""
+    names = (
+        [s["category"] for s in COMPANY_INFO["services"]]
+        + [v["name"] for v in COMPANY_INFO["core_values"]]
+        + COMPANY_INFO["notable_clients"]
+        + [COMPANY_INFO["name"]]
+    )
+    words = {word for name in names for word in _WORD_RE.findall(name.lower()) if len(word) > 3}
+    return frozenset(words | FACT_WORDS)
+
+
+def _is_question(text: str, words: List[str]) -> bool:
+    return "?" in text or (bool(words) and words[0] in QUESTION_WORDS)
+
+
+def _last_assistant_text(history: List[Dict[str, Any]]) -> str:
+    for message in reversed(history):
+        if message["role"] == "assistant":
+            content = message["content"]
+            if isinstance(content, str):
+                return content
+            return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return ""
+
+
+def classify(user_message: str, history: Optional[List[Dict[str, Any]]] = None) -> Route:
+    """
+    Route one turn
+
+    Args:
+        user_message: The customer's message
+        history: Conversation before this message
+
+    Returns:
+        Route with tier "fast" or "smart", the model and the rule that decided
+    """
+    text = user_message.lower()
+    words = _WORD_RE.findall(text)
+
+    if not MODEL_ROUTING:
+        return Route("smart", SMART_MODEL, "routing_off")
+    if _EMAIL_RE.search(user_message) or _PHONE_RE.search(user_message):
+        return Route("smart", SMART_MODEL, "contact_details")
+    if any(phrase in text for phrase in LEAD_PHRASES) or _PROBLEM_RE.search(text):
+        return Route("smart", SMART_MODEL, "lead_intent")
+    if history and _LEAD_PROMPT_RE.search(_last_assistant_text(history)[-300:]):
+        return Route("smart", SMART_MODEL, "lead_followup")
+    if len(words) > COMPLEX_WORDS or text.count("?") > 1 or any(phrase in text for phrase in COMPLEX_PHRASES):
+        return Route("smart", SMART_MODEL, "complex")
+    if words and all(word in SMALLTALK_WORDS for word in words):
+        return Route("fast", FAST_MODEL, "smalltalk")
+    if _is_question(text, words) and company_terms().intersection(words):
+        return Route("fast", FAST_MODEL, "company_fact")
+    return Route("smart", SMART_MODEL, "default")
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (Prometheus-style cumulative output)"""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(self.buckets_ms):
+            if ms <= bound:
+                break
+        else:
+            i = len(self.buckets_ms)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets_ms + ("+Inf",), self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum_ms, 1),
+            "avg_ms": round(self.sum_ms / self.count, 1) if self.count else 0.0,
+            "buckets_le_ms": cumulative,
+        }
+
+
+class ModelRouter:
+    """
+    Routes turns and records decisions and per-tier turn latency
+    One per chatbot; thread-safe
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decisions: Dict[str, Dict[str, int]] = {"fast": {}, "smart": {}}
+        self._latency = {"fast": LatencyHistogram(), "smart": LatencyHistogram()}
+
+    def route(self, user_message: str, history: Optional[List[Dict[str, Any]]] = None) -> Route:
+        """Classify a turn and count the decision"""
+        route = classify(user_message, history)
+        with self._lock:
+            reasons = self._decisions[route.tier]
+            reasons[route.reason] = reasons.get(route.reason, 0) + 1
+        return route
+
+    def record(self, route: Route, elapsed_ms: float):
+        """Record how long a routed turn took end to end"""
+        with self._lock:
+            self._latency[route.tier].observe(elapsed_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        """Decision counts by tier and reason, and per-tier latency histograms"""
+        with self._lock:
+            return {
+                "enabled": MODEL_ROUTING,
+                "models": {"fast": FAST_MODEL, "smart": SMART_MODEL},
+                "decisions": {
+                    tier: {"total": sum(reasons.values()), "by_reason": dict(reasons)}
+                    for tier, reasons in self._decisions.items()
+                },
+                "latency": {tier: histogram.snapshot() for tier, histogram in self._latency.items()},
+            }
@@ -0,0 +1,421 @@
+"""
+Durable outbox for tool side effects
+
+Tools that reach outside systems (the CRM webhook in GHL_INTEGRATION.md,
+booking and quote integrations) don't call them inline. They write an
+event to the outbox table - for a lead, in the same SQLite transaction as
+the lead itself - and return right away. Background workers deliver
+events with retries and exponential backoff until the destination accepts
+them, so delivery is at-least-once: an event may arrive twice (after a
+crash or a lost response), never zero times. Each delivery carries an
+Idempotency-Key header so the receiver can drop repeats.
+
+Workers run as threads in each server process (OUTBOX_WORKERS), or on
+their own with `python outbox.py` (set OUTBOX_WORKERS=0 for the servers).
+Claims take a lease, so several processes can share one outbox and an
+event held by a worker that died is picked up again once the lease expires.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Dict, Any, List, Callable
+
+from lead_store import LEADS_DB
+
+# The CRM's inbound webhook (GoHighLevel); events for it are only queued when set
+GHL_WEBHOOK_URL = os.environ.get("GHL_WEBHOOK_URL", "")
+
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_TIMEOUT = float(os.environ.get("OUTBOX_TIMEOUT_SECONDS", 10))
+# Idle workers check for due retries (and other processes' events) this often
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", 1))
+OUTBOX_RETENTION_DAYS = float(os.environ.get("OUTBOX_RETENTION_DAYS", 7))
+# First retry delay; doubles with each failed attempt
+BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_SECONDS", 2))
+BACKOFF_MAX = 3600.0
+# A claimed event is retried if not settled within this long (worker crashed)
+LEASE_SECONDS = OUTBOX_TIMEOUT * 3
+PRUNE_INTERVAL = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    destination TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    -- pending -> sending -> delivered, or dead after OUTBOX_MAX_ATTEMPTS
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+"""
+
+STATUSES = ("pending", "sending", "delivered", "dead")
+
+
+class PermanentError(Exception):
+    """A delivery the destination rejected outright - retrying won't help"""
+
+
+# A sender delivers one payload, raising on failure
+Sender = Callable[[Dict[str, Any], str], None]
+
+
+def webhook_sender(url: str, timeout: float = OUTBOX_TIMEOUT) -> Sender:
+    """
+    Sender that POSTs the payload as JSON
+
+    Timeouts, connection errors, 408, 429 and 5xx responses are retried;
+    other 4xx responses are permanent failures.
+    """
+    def send(payload: Dict[str, Any], idempotency_key: str):
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Idempotency-Key": idempotency_key},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise PermanentError(f"HTTP {e.code}") from e
+            raise
+
+    return send
+
+
+def crm_event(event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    CRM webhook payload: the fields documented in GHL_INTEGRATION.md, plus
+    the event type and whatever else the tool collected
+    """
+    return {
+        **data,
+        "event": event,
+        "timestamp": data.get("timestamp") or datetime.datetime.now().isoformat(),
+        "source": "website_chatbot"
+    }
+
+
+class Outbox:
+    """
+    Outbox table (in the lead database) and its delivery workers
+    """
+
+    def __init__(self, path: str = LEADS_DB, senders: Optional[Dict[str, Sender]] = None):
+        """
+        Open (and create if needed) the outbox
+
+        Args:
+            path: SQLite database file - the lead store's, so a lead and its
+                events commit together
+            senders: Destination name -> sender; events for other destinations
+                aren't queued
+        """
+        self.path = path
+        self.senders = dict(senders or {})
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {"enqueued": 0, "delivered": 0, "retries": 0, "dead": 0}
+
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (sqlite3 connections aren't shareable across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, metric: str, amount: int = 1):
+        with self._lock:
+            self._metrics[metric] += amount
+
+    def accepts(self, destination: str) -> bool:
+        """True if events for destination are delivered (it has a sender)"""
+        return destination in self.senders
+
+    def enqueue_in(
+        self,
+        conn: sqlite3.Connection,
+        destination: str,
+        payload: Dict[str, Any],
+        idempotency_key: str
+    ) -> bool:
+        """
+        Queue an event inside the caller's transaction on the same database
+
+        The event is durable once the caller commits; enqueuing the same key
+        twice keeps the first event.
+
+        Returns:
+            False if the destination isn't configured (nothing was queued)
+        """
+        if not self.accepts(destination):
+            return False
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO outbox (destination, idempotency_key, payload, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (destination, idempotency_key, json.dumps(payload), now, now)
+        )
+        if cursor.rowcount:
+            self._count("enqueued")
+        self.start()
+        self._wake.set()
+        return True
+
+    def enqueue(self, destination: str, payload: Dict[str, Any], idempotency_key: str) -> bool:
+        """
+        Queue an event in its own transaction (see enqueue_in)
+
+        Returns:
+            False if the destination isn't configured (nothing was queued)
+        """
+        if not self.accepts(destination):
+            return False
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.enqueue_in(conn, destination, payload, idempotency_key)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Lease the next due event (or one whose lease ran out), if any"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                # next_attempt_at doubles as the lease expiry while sending
+                conn.execute(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? "
+                    "WHERE id = ?",
+                    (now + LEASE_SECONDS, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _settle(self, row: sqlite3.Row, error: Optional[BaseException]):
+        """Mark a claimed event delivered, or schedule its retry"""
+        conn = self._connection()
+        attempts = row["attempts"] + 1
+        if error is None:
+            conn.execute(
+                "UPDATE outbox SET status = 'delivered', delivered_at = ?, last_error = NULL WHERE id = ?",
+                (time.time(), row["id"])
+            )
+            self._count("delivered")
+        elif isinstance(error, PermanentError) or attempts >= OUTBOX_MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE outbox SET status = 'dead', last_error = ? WHERE id = ?",
+                (str(error)[:500], row["id"])
+            )
+            self._count("dead")
+        else:
+            # Exponential backoff, jittered so retries from a burst spread out
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            conn.execute(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, str(error)[:500], row["id"])
+            )
+            self._count("retries")
+
+    def deliver_one(self) -> bool:
+        """
+        Deliver the next due event
+
+        Returns:
+            False if nothing was due
+        """
+        row = self._claim()
+        if row is None:
+            return False
+        sender = self.senders.get(row["destination"])
+        error = None
+        try:
+            if sender is None:
+                raise PermanentError(f"No sender for destination {row['destination']!r}")
+            sender(json.loads(row["payload"]), row["idempotency_key"])
+        except Exception as e:
+            error = e
+        self._settle(row, error)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                while self.deliver_one():
+                    if self._stop.is_set():
+                        return
+                self._prune()
+            except sqlite3.Error:
+                pass  # Database busy or locked - try again on the next poll
+            self._wake.wait(OUTBOX_POLL_SECONDS)
+
+    def start(self, workers: int = OUTBOX_WORKERS):
+        """Start the delivery threads for this process (no-op if running or workers is 0)"""
+        if workers <= 0 or not self.senders or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            # Threads don't survive a fork, so a forked worker process starts its own
+            if self._started_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._workers = [
+                threading.Thread(target=self._run, name=f"outbox-{n}", daemon=True)
+                for n in range(workers)
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._started_pid = os.getpid()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the delivery threads; an event being sent is retried after its lease"""
+        self._stop.set()
+        self._wake.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+        self._started_pid = None
+
+    def requeue_dead(self) -> int:
+        """Give dead events another round of attempts; returns how many"""
+        cursor = self._connection().execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'",
+            (time.time(),)
+        )
+        self._wake.set()
+        return cursor.rowcount
+
+    def pending(self) -> int:
+        """Events not yet delivered (or given up on)"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+
+    def _prune(self):
+        """Drop delivered events past the retention period (at most every PRUNE_INTERVAL)"""
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        self._connection().execute(
+            "DELETE FROM outbox WHERE status = 'delivered' AND delivered_at < ?",
+            (now - OUTBOX_RETENTION_DAYS * 86400,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Events by status, the oldest undelivered event's age and this process's counters"""
+        conn = self._connection()
+        by_status = dict.fromkeys(STATUSES, 0)
+        for row in conn.execute("SELECT status, COUNT(*) AS count FROM outbox GROUP BY status"):
+            by_status[row["status"]] = row["count"]
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {
+            "destinations": sorted(self.senders),
+            "workers": len(self._workers) if self._started_pid == os.getpid() else 0,
+            "events": by_status,
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            **metrics
+        }
+
+
+def default_senders() -> Dict[str, Sender]:
+    """Destinations configured in the environment"""
+    senders = {}
+    if GHL_WEBHOOK_URL:
+        senders["crm"] = webhook_sender(GHL_WEBHOOK_URL)
+    return senders
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """Get the process-wide outbox, opening it (and starting delivery) on first use"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(senders=default_senders())
+    _outbox.start()
+    return _outbox
+
+
+def main():
+    """Run outbox delivery on its own, outside the web servers"""
+    parser = argparse.ArgumentParser(description="Deliver queued tool side effects")
+    parser.add_argument("--workers", type=int, default=max(OUTBOX_WORKERS, 1))
+    parser.add_argument("--drain", action="store_true", help="exit once nothing is pending")
+    parser.add_argument("--requeue-dead", action="store_true", help="retry events that were given up on")
+    args = parser.parse_args()
+
+    outbox = Outbox(senders=default_senders())
+    if not outbox.senders:
+        print("No destinations configured (set GHL_WEBHOOK_URL)")
+        return
+    if args.requeue_dead:
+        print(f"Requeued {outbox.requeue_dead()} dead events")
+
+    outbox.start(args.workers)
+    try:
+        while not (args.drain and outbox.pending() == 0):
+            time.sleep(OUTBOX_POLL_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        outbox.stop()
+    print(json.dumps(outbox.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Timeouts, retries and a circuit breaker for Anthropic calls
+
+Every messages.create / messages.stream call made through the shared
+client (llm_client.py) gets:
+- a deadline: each attempt times out after LLM_TIMEOUT_SECONDS, and all
+  attempts together after LLM_DEADLINE_SECONDS
+- retries of transient failures (timeouts, connection errors, 429, 5xx,
+  529 overloaded) with jittered exponential backoff, honouring the API's
+  retry-after; retries are budgeted, so a failing upstream isn't hit with
+  extra traffic
+- a circuit breaker: after BREAKER_FAILURES consecutive failed calls (each
+  counted once, after its retries), calls fail fast with CircuitOpen for
+  BREAKER_COOLDOWN_SECONDS, then one trial call decides whether it closes
+  again
+
+While the breaker is open the chatbots answer with fallback_answer()
+instead of waiting on the API.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Callable, Tuple
+
+from chatbot_config import CONTACT_INFO
+from faq_cache import get_faq_cache
+
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT_SECONDS", 30))
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE_SECONDS", 60))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+# Retries allowed per call made, on average (plus a small reserve)
+RETRY_BUDGET_RATIO = float(os.environ.get("LLM_RETRY_BUDGET", 0.2))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN_SECONDS", 30))
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_RESERVE = 10
+
+# Statuses worth retrying: timeout, conflict, rate limited, server errors, overloaded
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504, 529)
+
+
+class CircuitOpen(Exception):
+    """The breaker is open - the API has been failing, so the call wasn't made"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Anthropic API unavailable, retrying in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed call is worth retrying (and counts against the breaker)"""
+    # Only reached after a call was made, so the SDK is already loaded
+    from anthropic import APIConnectionError
+
+    if isinstance(error, APIConnectionError):  # Includes timeouts
+        return True
+    return getattr(error, "status_code", None) in RETRY_STATUSES
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half open (one trial call) -> closed"""
+
+    def __init__(
+        self,
+        failures: int = BREAKER_FAILURES,
+        cooldown: float = BREAKER_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._metrics = {"opened": 0, "short_circuited": 0}
+
+    def before_call(self) -> bool:
+        """
+        Returns:
+            True if this call is the half-open trial call
+
+        Raises:
+            CircuitOpen: while open, or while another request is making the trial call
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            remaining = self._opened_at + self.cooldown - self._clock()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            self._metrics["short_circuited"] += 1
+            raise CircuitOpen(max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failures > 0:
+                if self.state != "open":
+                    self._metrics["opened"] += 1
+                self.state = "open"
+                self._opened_at = self._clock()
+            self._trial_in_progress = False
+
+    def release_trial(self):
+        """A trial call ended without telling us anything (a 400, or cancelled) - let another try"""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                **self._metrics
+            }
+            if self.state != "closed":
+                stats["retry_in_seconds"] = round(max(self._opened_at + self.cooldown - self._clock(), 0), 1)
+            return stats
+
+
+class RetryBudget:
+    """Each call earns `ratio` of a retry, up to a reserve; each retry spends one"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, reserve: int = RETRY_RESERVE):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.reserve, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class Resilience:
+    """Deadline, retry and breaker policy shared by every client in the process"""
+
+    def __init__(
+        self,
+        timeout: float = LLM_TIMEOUT,
+        deadline: float = LLM_DEADLINE,
+        max_retries: int = LLM_MAX_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget or RetryBudget()
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "retries": 0, "failures": 0, "budget_exhausted": 0}
+
+    def _count(self, metric: str):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _start(self) -> Tuple[float, bool]:
+        """Admit a call; returns its deadline and whether it's the breaker's trial call"""
+        trial = self.breaker.before_call()
+        self._count("calls")
+        self.budget.deposit()
+        return time.monotonic() + self.deadline, trial
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        return max(min(self.timeout, deadline - time.monotonic()), 0.001)
+
+    def _backoff(self, error: BaseException, attempt: int, deadline: float, trial: bool) -> Optional[float]:
+        """
+        Record a failed attempt and decide whether to retry. The breaker
+        counts failed calls, so it only hears of a failure once the call
+        gives up - except a half-open trial, which reopens it at once
+
+        Returns:
+            Seconds to sleep before the next attempt, or None to give up
+        """
+        if not is_transient(error):
+            if trial:
+                self.breaker.release_trial()
+            return None
+        self._count("failures")
+        delay = None if trial else self._retry_delay(error, attempt, deadline)
+        if delay is None:
+            self.breaker.record_failure()
+        return delay
+
+    def _retry_delay(self, error: BaseException, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before retrying a transient failure, or None if it can't be retried"""
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            return None
+        # Full jitter, but never sooner than the API asked
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        delay = max(delay, _retry_after(error) or 0)
+        if time.monotonic() + delay >= deadline:
+            return None
+        if not self.budget.withdraw():
+            self._count("budget_exhausted")
+            return None
+        self._count("retries")
+        return delay
+
+    def call(self, fn: Callable[[float], Any]) -> Any:
+        """
+        Run fn(timeout) with retries
+
+        Raises:
+            CircuitOpen: if the breaker is open
+            The last error, if every attempt failed
+        """
+        deadline, trial = self._start()
+        attempt = 0
+        while True:
+            try:
+                result = fn(self._attempt_timeout(deadline))
+            except Exception as error:
+                delay = self._backoff(error, attempt, deadline, trial)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (or interrupted) mid-attempt: no verdict on the API either way
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[float], Any]) -> Any:
+        """Async version of call() - fn(timeout) returns an awaitable"""
+        deadline, trial = self._start()
+        attempt = 0
+        while True:
+            try:
+                result = await fn(self._attempt_timeout(deadline))
+            except Exception as error:
+                delay = self._backoff(error, attempt, deadline, trial)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (or interrupted) mid-attempt: no verdict on the API either way
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _stream_failed(self, error: BaseException):
+        # Once text has been sent a stream can't be retried, but it still counts
+        if is_transient(error):
+            self.breaker.record_failure()
+            self._count("failures")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {**metrics, "breaker": self.breaker.stats()}
+
+
+class _Messages:
+    """client.messages with create/stream going through the policy"""
+
+    def __init__(self, messages: Any, policy: Resilience):
+        self._messages = messages
+        self._policy = policy
+
+    def create(self, **params) -> Any:
+        return self._policy.call(lambda timeout: self._messages.create(**params, timeout=timeout))
+
+    @contextmanager
+    def stream(self, **params):
+        """messages.stream(); connecting is retried, the stream itself is not"""
+        def connect(timeout):
+            manager = self._messages.stream(**params, timeout=timeout)
+            return manager, manager.__enter__()
+
+        manager, stream = self._policy.call(connect)
+        try:
+            yield stream
+        except Exception as error:
+            self._policy._stream_failed(error)
+            raise
+        finally:
+            manager.__exit__(None, None, None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._messages, name)
+
+
+class _AsyncMessages(_Messages):
+    async def create(self, **params) -> Any:
+        return await self._policy.acall(lambda timeout: self._messages.create(**params, timeout=timeout))
+
+    @asynccontextmanager
+    async def stream(self, **params):
+        async def connect(timeout):
+            manager = self._messages.stream(**params, timeout=timeout)
+            return manager, await manager.__aenter__()
+
+        manager, stream = await self._policy.acall(connect)
+        try:
+            yield stream
+        except Exception as error:
+            self._policy._stream_failed(error)
+            raise
+        finally:
+            await manager.__aexit__(None, None, None)
+
+
+class ResilientClient:
+    """Wraps an Anthropic client; everything but messages.create/stream passes straight through"""
+
+    messages_class = _Messages
+
+    def __init__(self, client: Any, policy: Resilience):
+        self._client = client
+        self.policy = policy
+        self.messages = self.messages_class(client.messages, policy)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class AsyncResilientClient(ResilientClient):
+    """ResilientClient for AsyncAnthropic"""
+
+    messages_class = _AsyncMessages
+
+
+_policy: Optional[Resilience] = None
+_policy_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    """The process-wide policy - one breaker for the one upstream"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = Resilience()
+    return _policy
+
+
+def fallback_answer(user_message: str, namespace: str = "") -> str:
+    """
+    Answer to give while the API is unavailable: a cached answer to the same
+    question if there is one, otherwise how to reach the team directly
+    """
+    cache = get_faq_cache()
+    answer = cache.get(user_message, namespace) if cache is not None else None
+    if answer is not None:
+        return answer
+    return (
+        "I'm sorry - I'm having trouble answering right now. Our team can help you directly: "
+        f"visit {CONTACT_INFO['website']} (Phone: {CONTACT_INFO['phone']}; "
+        f"Email: {CONTACT_INFO['email']}). We serve the {CONTACT_INFO['service_area']} area."
+    )
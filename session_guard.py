@@ -0,0 +1,184 @@
+"""
+Per-session request ordering and idempotent retries
+
+Turns for one session run one at a time (a double-submitted message waits
+for the first to finish instead of interleaving with it in the history);
+different sessions still run in parallel. Requests carrying an
+Idempotency-Key get the stored result when retried, without another model call.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, Callable
+
+# Seconds a request waits for an earlier turn of the same session
+SESSION_LOCK_TIMEOUT = float(os.environ.get("SESSION_LOCK_TIMEOUT", 120))
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 600))
+IDEMPOTENCY_MAX_ENTRIES = 10000
+
+
+class SessionBusy(Exception):
+    """Raised when an earlier turn of the session didn't finish within the lock timeout"""
+
+
+class SessionLocks:
+    """
+    One lock per active session, for threaded servers
+    Locks are reference counted and dropped once no request holds or waits
+    for them, so idle sessions cost nothing.
+    """
+
+    def __init__(self, timeout: float = SESSION_LOCK_TIMEOUT):
+        self.timeout = timeout
+        self._locks: Dict[str, list] = {}  # session_id -> [lock, holders + waiters]
+        self._guard = threading.Lock()
+        self._metrics = {"acquired": 0, "contended": 0, "timeouts": 0}
+
+    @contextmanager
+    def hold(self, session_id: str, on_wait: Optional[Callable[[], None]] = None) -> Iterator[None]:
+        """
+        Run the block as the session's only turn in progress
+
+        Args:
+            session_id: Session to lock
+            on_wait: Called before waiting if another turn holds the lock
+                (e.g. to give back an in-flight slot rather than sit on it)
+
+        Raises:
+            SessionBusy: if the session stayed locked for longer than the timeout
+        """
+        with self._guard:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+
+        lock = entry[0]
+        try:
+            if not lock.acquire(blocking=False):
+                self._count("contended")
+                if on_wait is not None:
+                    on_wait()
+                if not lock.acquire(timeout=self.timeout):
+                    self._count("timeouts")
+                    raise SessionBusy(session_id)
+            self._count("acquired")
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def _count(self, metric: str):
+        with self._guard:
+            self._metrics[metric] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Lock metrics: acquisitions, how many had to wait, timeouts, sessions in flight"""
+        with self._guard:
+            return {**self._metrics, "active_sessions": len(self._locks)}
+
+
+class AsyncSessionLocks:
+    """SessionLocks for an asyncio server (one event loop, no thread safety needed)"""
+
+    def __init__(self, timeout: float = SESSION_LOCK_TIMEOUT):
+        self.timeout = timeout
+        self._locks: Dict[str, list] = {}
+        self._metrics = {"acquired": 0, "contended": 0, "timeouts": 0}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str, on_wait: Optional[Callable[[], None]] = None) -> AsyncIterator[None]:
+        """Async version of SessionLocks.hold()"""
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+
+        lock = entry[0]
+        try:
+            if lock.locked():
+                self._metrics["contended"] += 1
+                if on_wait is not None:
+                    on_wait()
+            try:
+                await asyncio.wait_for(lock.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self._metrics["timeouts"] += 1
+                raise SessionBusy(session_id)
+            self._metrics["acquired"] += 1
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._metrics, "active_sessions": len(self._locks)}
+
+
+class IdempotencyCache:
+    """
+    Results of completed requests, by (session_id, idempotency key)
+    Thread-safe; entries expire after a TTL and the oldest are evicted past max_entries.
+    """
+
+    def __init__(
+        self,
+        ttl: float = IDEMPOTENCY_TTL,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (result, expires_at)
+        self._lock = threading.Lock()
+        self._metrics = {"replays": 0, "stores": 0}
+
+    def get(self, session_id: str, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Stored result for a retried request, or None"""
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get((session_id, key))
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[(session_id, key)]
+                return None
+            self._metrics["replays"] += 1
+            return entry[0]
+
+    def put(self, session_id: str, key: Optional[str], result: Dict[str, Any]):
+        """Remember a completed request's result"""
+        if not key:
+            return
+        with self._lock:
+            now = self._clock()
+            self._entries[(session_id, key)] = (result, now + self.ttl)
+            self._entries.move_to_end((session_id, key))
+            self._metrics["stores"] += 1
+            # Entries are in insertion order, so expired ones are at the front
+            while self._entries:
+                oldest_key, (_, expires_at) = next(iter(self._entries.items()))
+                if expires_at > now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[oldest_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "entries": len(self._entries), "ttl_seconds": self.ttl}
+
+
+def idempotency_key(headers: Any, data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The request's idempotency key: Idempotency-Key header, or "idempotency_key" in the body"""
+    key = headers.get("Idempotency-Key") or (data or {}).get("idempotency_key")
+    return str(key)[:200] if key else None
@@ -0,0 +1,564 @@
+"""
+Session storage for chatbot conversations
+
+Backends (chosen with SESSION_BACKEND):
+- memory: bounded in-process store with idle-TTL, LRU and memory-budget eviction
+- sqlite: shared database file - any worker on the host can serve any session
+- redis: Redis (or anything speaking its protocol) - any worker on any host
+
+All of them provide get_or_create(session_id) -> ChatSession, save(session)
+after each turn, reset, remove, len() and stats(). The external backends
+store each history as one compact JSON or msgpack blob.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory").lower()
+# "json" or "msgpack" (needs the msgpack package); either can be read back
+SESSION_SERIALIZER = os.environ.get("SESSION_SERIALIZER", "json").lower()
+SESSIONS_DB = os.path.join(os.environ.get("DATA_DIR", "data"), "sessions.db")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = "chatbot:session:"
+# Sorted set of live session ids scored by expiry time, so counting them
+# doesn't walk the keyspace (kept outside REDIS_KEY_PREFIX)
+REDIS_ACTIVE_KEY = "chatbot:active_sessions"
+
+# Seconds between sweeps of expired rows from the SQLite backend
+SWEEP_INTERVAL = 60.0
+
+
+def serialize_history(history: List[Dict[str, Any]], serializer: str = SESSION_SERIALIZER) -> bytes:
+    """Encode a conversation history as compact JSON or msgpack"""
+    if serializer == "msgpack":
+        import msgpack
+        return msgpack.packb(history, use_bin_type=True)
+    return json.dumps(history, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def deserialize_history(data: bytes) -> List[Dict[str, Any]]:
+    """Decode a history written by serialize_history (either format)"""
+    if not data:
+        return []
+    # A JSON history starts with "["; a msgpack array never does
+    if data[:1] == b"[":
+        return json.loads(data)
+    import msgpack
+    return msgpack.unpackb(data, raw=False)
+
+
+class ChatSession:
+    """
+    Lightweight per-session conversation state
+    Holds only the message history - the Anthropic client, system prompt
+    and tool definitions live on the shared chatbot instance.
+    """
+
+    __slots__ = ("session_id", "conversation_history", "created_at", "last_active", "size_bytes")
+
+    def __init__(self, session_id: str, now: float):
+        self.session_id = session_id
+        self.conversation_history: List[Dict[str, Any]] = []
+        self.created_at = now
+        self.last_active = now
+        self.size_bytes = 0
+
+    def reset(self):
+        """Clear conversation history"""
+        self.conversation_history = []
+        self.size_bytes = 0
+
+    def estimate_size(self) -> int:
+        """Approximate memory held by this session (serialized history length)"""
+        return len(json.dumps(self.conversation_history, default=str))
+
+
+class SessionStore:
+    """
+    Thread-safe session store with bounded size
+
+    Sessions are evicted when:
+    - they have been idle longer than idle_ttl seconds
+    - the store holds more than max_sessions (least recently used first)
+    - the total estimated history size exceeds memory_budget_bytes (LRU first)
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl: float = 1800,
+        memory_budget_bytes: int = 50 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the session store
+
+        Args:
+            max_sessions: Maximum number of live sessions
+            idle_ttl: Seconds of inactivity before a session expires
+            memory_budget_bytes: Upper bound on total estimated history size
+            clock: Time source (monotonic seconds)
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget_bytes = memory_budget_bytes
+        self._clock = clock
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_bytes = 0
+
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted_lru": 0,
+            "evicted_memory": 0,
+        }
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get an existing session, or None if missing or expired"""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_active = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: str) -> ChatSession:
+        """Get a session, creating it if needed"""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._metrics["hits"] += 1
+                session.last_active = now
+                self._sessions.move_to_end(session_id)
+                return session
+
+            self._metrics["misses"] += 1
+            session = ChatSession(session_id, now)
+            self._sessions[session_id] = session
+            self._enforce_limits(keep=session_id)
+            return session
+
+    # All state is in this process - no I/O, safe to call from an event loop
+    blocking = False
+
+    def save(self, session: ChatSession):
+        """Record a session's history after a turn (same as update())"""
+        self.update(session.session_id)
+
+    def update(self, session_id: str):
+        """
+        Re-measure a session after its history changed
+        Call this after each chat turn so the memory budget stays accurate
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+
+            new_size = session.estimate_size()
+            self._memory_bytes += new_size - session.size_bytes
+            session.size_bytes = new_size
+            session.last_active = self._clock()
+            self._sessions.move_to_end(session_id)
+            self._enforce_limits(keep=session_id)
+
+    def reset(self, session_id: str) -> bool:
+        """Clear a session's history. Returns False if the session doesn't exist"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            self._memory_bytes -= session.size_bytes
+            session.reset()
+            return True
+
+    def remove(self, session_id: str) -> bool:
+        """Drop a session entirely"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._memory_bytes -= session.size_bytes
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Store metrics: hit/miss counts, evictions, size and memory usage"""
+        with self._lock:
+            self._expire(self._clock())
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "backend": "memory",
+                "hit_rate": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+            }
+
+    def _expire(self, now: float):
+        """Drop idle sessions. Caller must hold the lock"""
+        # Sessions are ordered by last activity, so stop at the first live one
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_active < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._memory_bytes -= session.size_bytes
+            self._metrics["expired"] += 1
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        """Evict least recently used sessions over the size/memory limits. Caller must hold the lock"""
+        while len(self._sessions) > self.max_sessions:
+            if not self._evict_oldest(keep):
+                break
+            self._metrics["evicted_lru"] += 1
+
+        while self._memory_bytes > self.memory_budget_bytes:
+            if not self._evict_oldest(keep):
+                break
+            self._metrics["evicted_memory"] += 1
+
+    def _evict_oldest(self, keep: Optional[str]) -> bool:
+        """Remove the least recently used session other than `keep`"""
+        for session_id in self._sessions:
+            if session_id != keep:
+                session = self._sessions.pop(session_id)
+                self._memory_bytes -= session.size_bytes
+                return True
+        return False
+
+
+class SerializedSessionStore:
+    """
+    Base for backends that keep each session's history outside the process
+
+    get_or_create() loads a private copy of the history; save() writes it back.
+    Times are wall-clock (time.time) so every worker agrees on expiry.
+    """
+
+    # Calls do I/O - the async server runs them in a worker thread
+    blocking = True
+    backend = ""
+
+    def __init__(self, idle_ttl: float, serializer: str, clock: Callable[[], float]):
+        self.idle_ttl = idle_ttl
+        self.serializer = serializer
+        self._clock = clock
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "saves": 0,
+            "bytes_written": 0,
+        }
+
+    def _count(self, metric: str, amount: int = 1):
+        with self._metrics_lock:
+            self._metrics[metric] += amount
+
+    def _loaded(self, session_id: str, data: Optional[bytes], now: float) -> ChatSession:
+        """ChatSession for a stored history (or a new one if data is None)"""
+        session = ChatSession(session_id, now)
+        if data is None:
+            self._count("misses")
+        else:
+            self._count("hits")
+            session.conversation_history = deserialize_history(data)
+            session.size_bytes = len(data)
+        return session
+
+    def _encode(self, session: ChatSession) -> bytes:
+        data = serialize_history(session.conversation_history, self.serializer)
+        session.size_bytes = len(data)
+        with self._metrics_lock:
+            self._metrics["saves"] += 1
+            self._metrics["bytes_written"] += len(data)
+        return data
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Store metrics: hit/miss counts, saves and bytes written, live sessions"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["hits"] + metrics["misses"]
+        return {
+            **metrics,
+            "backend": self.backend,
+            "serializer": self.serializer,
+            "hit_rate": round(metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_bytes_per_save": round(metrics["bytes_written"] / metrics["saves"]) if metrics["saves"] else 0,
+            "active_sessions": len(self),
+            "idle_ttl_seconds": self.idle_ttl,
+        }
+
+
+class SQLiteSessionStore(SerializedSessionStore):
+    """
+    Sessions in a SQLite database (WAL mode) shared by all workers on a host
+    Expired rows are swept every SWEEP_INTERVAL seconds.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        history BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        last_active REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+    """
+
+    def __init__(
+        self,
+        path: str = SESSIONS_DB,
+        idle_ttl: float = 1800,
+        serializer: str = SESSION_SERIALIZER,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Open (and create if needed) the session database
+
+        Args:
+            path: SQLite database file
+            idle_ttl: Seconds of inactivity before a session expires
+            serializer: "json" or "msgpack"
+            clock: Time source (wall-clock seconds, shared across processes)
+        """
+        super().__init__(idle_ttl, serializer, clock)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (sqlite3 connections aren't shareable across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the last moments of a chat on power loss is acceptable
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get an existing session, or None if missing or expired"""
+        now = self._clock()
+        row = self._connection().execute(
+            "SELECT history, created_at, last_active FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None or now - row[2] >= self.idle_ttl:
+            return None
+        session = ChatSession(session_id, row[1])
+        session.conversation_history = deserialize_history(row[0])
+        session.size_bytes = len(row[0])
+        return session
+
+    def get_or_create(self, session_id: str) -> ChatSession:
+        """Load a session, or start a new one (stored on first save)"""
+        now = self._clock()
+        self._sweep(now)
+        row = self._connection().execute(
+            "SELECT history, last_active FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is not None and now - row[1] >= self.idle_ttl:
+            self._count("expired")
+            row = None
+        return self._loaded(session_id, None if row is None else row[0], now)
+
+    def save(self, session: ChatSession):
+        """Write a session's history after a turn"""
+        now = self._clock()
+        session.last_active = now
+        self._connection().execute(
+            "INSERT INTO sessions (session_id, history, created_at, last_active) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET history = excluded.history, last_active = excluded.last_active",
+            (session.session_id, self._encode(session), session.created_at, now)
+        )
+
+    def reset(self, session_id: str) -> bool:
+        """Clear a session's history. Returns False if the session doesn't exist"""
+        now = self._clock()
+        cursor = self._connection().execute(
+            "UPDATE sessions SET history = ?, last_active = ? WHERE session_id = ? AND last_active > ?",
+            (serialize_history([], self.serializer), now, session_id, now - self.idle_ttl)
+        )
+        return cursor.rowcount > 0
+
+    def remove(self, session_id: str) -> bool:
+        """Drop a session entirely"""
+        return self._connection().execute(
+            "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+        ).rowcount > 0
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_active > ?",
+            (self._clock() - self.idle_ttl,)
+        ).fetchone()[0]
+
+    def _sweep(self, now: float):
+        """Delete expired sessions, at most once per SWEEP_INTERVAL"""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        deleted = self._connection().execute(
+            "DELETE FROM sessions WHERE last_active <= ?", (now - self.idle_ttl,)
+        ).rowcount
+        if deleted > 0:
+            self._count("expired", deleted)
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisSessionStore(SerializedSessionStore):
+    """
+    Sessions in Redis, one key per session expiring after idle_ttl, and a
+    sorted set of session ids by expiry time for counting live sessions
+    Works with any client exposing redis-py's get/set/delete/pipeline and
+    zadd/zrem/zcard/zremrangebyscore.
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        client: Any = None,
+        url: str = REDIS_URL,
+        idle_ttl: float = 1800,
+        serializer: str = SESSION_SERIALIZER,
+        key_prefix: str = REDIS_KEY_PREFIX,
+        active_key: str = REDIS_ACTIVE_KEY,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Connect to the session store
+
+        Args:
+            client: Redis client to use (e.g. pointed at a local fake); built from url if None
+            url: Redis URL, used when no client is given
+            idle_ttl: Seconds of inactivity before a session expires
+            serializer: "json" or "msgpack"
+            key_prefix: Prefix for session keys
+            active_key: Sorted set of live session ids (not under key_prefix)
+            clock: Time source (wall-clock seconds)
+        """
+        super().__init__(idle_ttl, serializer, clock)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key_prefix = key_prefix
+        self.active_key = active_key
+
+    def _key(self, session_id: str) -> str:
+        return self.key_prefix + session_id
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get an existing session, or None if missing or expired"""
+        data = self.client.get(self._key(session_id))
+        if data is None:
+            return None
+        session = ChatSession(session_id, self._clock())
+        session.conversation_history = deserialize_history(data)
+        session.size_bytes = len(data)
+        return session
+
+    def get_or_create(self, session_id: str) -> ChatSession:
+        """Load a session, or start a new one (stored on first save)"""
+        return self._loaded(session_id, self.client.get(self._key(session_id)), self._clock())
+
+    def save(self, session: ChatSession):
+        """Write a session's history after a turn, restarting its idle TTL"""
+        session.last_active = self._clock()
+        ttl = max(1, int(self.idle_ttl))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._key(session.session_id), self._encode(session), ex=ttl)
+        pipe.zadd(self.active_key, {session.session_id: session.last_active + ttl})
+        pipe.execute()
+
+    def reset(self, session_id: str) -> bool:
+        """Clear a session's history. Returns False if the session doesn't exist"""
+        ttl = max(1, int(self.idle_ttl))
+        if not self.client.set(self._key(session_id), serialize_history([], self.serializer), ex=ttl, xx=True):
+            return False
+        self.client.zadd(self.active_key, {session_id: self._clock() + ttl})
+        return True
+
+    def remove(self, session_id: str) -> bool:
+        """Drop a session entirely"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self._key(session_id))
+        pipe.zrem(self.active_key, session_id)
+        return bool(pipe.execute()[0])
+
+    def __len__(self) -> int:
+        # Drop ids whose keys have expired, then count - no keyspace scan
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.active_key, "-inf", self._clock())
+        pipe.zcard(self.active_key)
+        return pipe.execute()[1]
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    """
+    Build the session store selected by SESSION_BACKEND
+
+    Args:
+        backend: "memory", "sqlite" or "redis"
+
+    Returns:
+        A session store (SessionStore, SQLiteSessionStore or RedisSessionStore)
+    """
+    idle_ttl = float(os.environ.get("SESSION_TTL_SECONDS", 1800))
+
+    if backend == "sqlite":
+        return SQLiteSessionStore(idle_ttl=idle_ttl)
+    if backend == "redis":
+        return RedisSessionStore(idle_ttl=idle_ttl)
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+    return SessionStore(
+        max_sessions=int(os.environ.get("SESSION_MAX", 1000)),
+        idle_ttl=idle_ttl,
+        memory_budget_bytes=int(float(os.environ.get("SESSION_MEMORY_BUDGET_MB", 50)) * 1024 * 1024)
+    )
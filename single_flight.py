@@ -0,0 +1,217 @@
+"""
+Single-flight coalescing of identical opening questions
+
+When many new sessions ask the same first question at once (a shared demo
+link, a busy page), the first request makes the model call and the others
+wait for it and reuse its answer - streaming requests receive its text as
+it arrives. Only plain-text answers are shared: if the model calls a tool,
+or the call fails, the waiting requests make their own calls.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, Hashable, Tuple
+
+COALESCING = os.environ.get("COALESCE_FIRST_TURNS", "on").lower() != "off"
+
+# Longest a request waits on another's model call before making its own
+COALESCE_WAIT = float(os.environ.get("COALESCE_WAIT_SECONDS", 120))
+
+
+class Flight:
+    """One in-flight model call: the text streamed so far, then its result"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.result: Optional[Dict[str, Any]] = None  # None if the answer can't be shared
+        self._changed = threading.Condition()
+
+    def publish(self, text: str):
+        """Pass a chunk of streamed text on to followers"""
+        with self._changed:
+            if not self.done:
+                self.chunks.append(text)
+                self._changed.notify_all()
+
+    def finish(self, result: Optional[Dict[str, Any]]) -> bool:
+        """Complete the flight; returns False if it already was"""
+        with self._changed:
+            if self.done:
+                return False
+            self.result = result
+            self.done = True
+            self._changed.notify_all()
+            return True
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the flight completes; False on timeout"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.done, timeout)
+
+    def follow(self, timeout: float) -> Iterator[str]:
+        """
+        Yield the flight's text as it is streamed
+        If the leader didn't stream (or timed out), nothing is yielded - check result
+        """
+        deadline = time.monotonic() + timeout
+        sent = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self.done or len(self.chunks) > sent,
+                    max(deadline - time.monotonic(), 0)
+                )
+                chunks = self.chunks[sent:]
+                finished = self.done
+            sent += len(chunks)
+            yield from chunks
+            if finished or not chunks:
+                return
+
+
+class AsyncFlight(Flight):
+    """Flight for an asyncio server (one event loop, no thread safety needed)"""
+
+    def __init__(self, key: Hashable):
+        super().__init__(key)
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Waiters hold the event they saw; replacing it wakes exactly those
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, text: str):
+        if not self.done:
+            self.chunks.append(text)
+            self._notify()
+
+    def finish(self, result: Optional[Dict[str, Any]]) -> bool:
+        if self.done:
+            return False
+        self.result = result
+        self.done = True
+        self._notify()
+        return True
+
+    async def wait(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.done:
+            try:
+                await asyncio.wait_for(self._changed.wait(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def follow(self, timeout: float) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        sent = 0
+        while True:
+            if not self.done and len(self.chunks) == sent:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    return
+            chunks = self.chunks[sent:]
+            sent += len(chunks)
+            for text in chunks:
+                yield text
+            if self.done and sent == len(self.chunks):
+                return
+
+
+class SingleFlight:
+    """
+    Groups identical concurrent requests behind one leader
+    Thread-safe; flights are removed as soon as the leader lands them.
+    """
+
+    flight_class = Flight
+
+    def __init__(self, wait_timeout: float = COALESCE_WAIT):
+        self.wait_timeout = wait_timeout
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"leaders": 0, "followers": 0, "shared": 0, "fallbacks": 0}
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """
+        Join the flight for key, starting one if none is in progress
+
+        Returns:
+            (flight, leader) - the leader makes the call and must land() the flight
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._metrics["followers"] += 1
+                return flight, False
+            flight = self._flights[key] = self.flight_class(key)
+            self._metrics["leaders"] += 1
+            return flight, True
+
+    def land(self, flight: Flight, result: Optional[Dict[str, Any]] = None):
+        """
+        End a flight (leader only); later requests start a new one
+        Landing early with no result sends followers off to make their own calls.
+        """
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.finish(result)
+
+    def wait(self, flight: Flight) -> Optional[Dict[str, Any]]:
+        """The leader's shareable result, or None if the follower must make its own call"""
+        flight.wait(self.wait_timeout)
+        return self.outcome(flight)
+
+    def follow(self, flight: Flight) -> Iterator[str]:
+        """
+        Stream the leader's text to a follower
+        Afterwards, outcome(flight) says whether the answer can be used.
+        """
+        streamed = False
+        for text in flight.follow(self.wait_timeout):
+            streamed = True
+            yield text
+        if flight.done and flight.result is not None and not streamed:
+            yield flight.result["response"]  # Leader wasn't streaming
+
+    def outcome(self, flight: Flight) -> Optional[Dict[str, Any]]:
+        """Count a follower as served or fallen back, and return the shared result"""
+        result = flight.result if flight.done else None
+        with self._lock:
+            self._metrics["shared" if result is not None else "fallbacks"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Leader/follower counts and the share of requests answered by another's call"""
+        with self._lock:
+            stats = {**self._metrics, "in_flight": len(self._flights)}
+        requests = stats["leaders"] + stats["followers"]
+        stats["coalesce_ratio"] = round(stats["shared"] / requests, 4) if requests else 0.0
+        return stats
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for an asyncio server"""
+
+    flight_class = AsyncFlight
+
+    async def wait(self, flight: AsyncFlight) -> Optional[Dict[str, Any]]:
+        await flight.wait(self.wait_timeout)
+        return self.outcome(flight)
+
+    async def follow(self, flight: AsyncFlight) -> AsyncIterator[str]:
+        streamed = False
+        async for text in flight.follow(self.wait_timeout):
+            streamed = True
+            yield text
+        if flight.done and flight.result is not None and not streamed:
+            yield flight.result["response"]
@@ -0,0 +1,334 @@
+"""
+Token budgets and pre-flight sizing of model calls
+
+- Each model call is estimated locally before it's sent (the same ~4
+  characters per token heuristic as history windowing, plus a margin -
+  no count_tokens round trip). max_tokens is then sized to what's left:
+  the default for the call, capped by the room in the context window and
+  by the turn's token allowance.
+- If the new message doesn't leave enough room, the oldest turns are
+  trimmed. If it still doesn't fit, or the session or tenant has used up
+  its budget, the turn is refused before any API call. That saves a round
+  trip that would end in a context-length error.
+- The ledger keeps running usage per session and per tenant, per UTC day.
+  Budgets are checked when a turn starts. A turn that starts is allowed to
+  finish, so a tool call is always followed by its reply. Like the rate
+  limits in admission.py, the ledger is per process.
+
+Every budget can be switched off with 0.
+"""
+
+import datetime
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+from admission import Rejected
+from history_window import estimate_tokens, is_turn_start
+
+# Context window of the models in use (input + output)
+CONTEXT_WINDOW_TOKENS = int(os.environ.get("CONTEXT_WINDOW_TOKENS", 200000))
+# Completion limits: the first call of a turn, and calls after tools ran
+MAX_TOKENS_FIRST = int(os.environ.get("MAX_TOKENS_FIRST", 2048))
+MAX_TOKENS_FOLLOWUP = int(os.environ.get("MAX_TOKENS_FOLLOWUP", 1024))
+# A call that can't be given this many output tokens isn't worth sending
+MIN_OUTPUT_TOKENS = int(os.environ.get("MIN_OUTPUT_TOKENS", 256))
+# Tokens (input + output, including prompt cache reads) per UTC day
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", 300000))
+TENANT_TOKEN_BUDGET = int(os.environ.get("TENANT_TOKEN_BUDGET", 0))
+LEDGER_MAX_SESSIONS = int(os.environ.get("LEDGER_MAX_SESSIONS", 50000))
+
+# Estimates are rough - size calls as if prompts were this much bigger
+ESTIMATE_MARGIN = 1.15
+
+DEFAULT_TENANT = "default"
+
+# Estimates of system prompt + tool definitions, which rarely change
+_prefix_estimates: Dict[tuple, tuple] = {}
+
+
+class BudgetExceeded(Rejected):
+    """A turn refused before any model call: over a token budget"""
+
+    status = 429
+
+
+class PromptTooLarge(Rejected):
+    """A turn refused before any model call: the message can't fit the context window"""
+
+    status = 413
+
+    def __init__(self, message: str):
+        super().__init__(message, None)
+
+
+def _seconds_to_midnight() -> float:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+def usage_total(usage: Dict[str, int]) -> int:
+    """Tokens a call or turn counts against budgets"""
+    return (
+        usage.get("input_tokens", 0)
+        + usage.get("cache_creation_input_tokens", 0)
+        + usage.get("cache_read_input_tokens", 0)
+        + usage.get("output_tokens", 0)
+    )
+
+
+def prefix_tokens(system: Any, tools: List[Dict[str, Any]]) -> int:
+    """Estimated tokens of a system prompt and tool definitions (memoized per pair of objects)"""
+    key = (id(system), id(tools))
+    cached = _prefix_estimates.get(key)
+    if cached is None or cached[0] is not system or cached[1] is not tools:
+        if len(_prefix_estimates) > 64:
+            _prefix_estimates.clear()
+        estimate = estimate_tokens({"content": system}) + estimate_tokens({"content": tools or []})
+        cached = _prefix_estimates[key] = (system, tools, estimate)
+    return cached[2]
+
+
+def estimate_request_tokens(params: Dict[str, Any]) -> int:
+    """Estimated input tokens of a messages.create call, with the safety margin"""
+    tokens = prefix_tokens(params.get("system"), params.get("tools"))
+    tokens += sum(estimate_tokens(message) for message in params["messages"])
+    return int(tokens * ESTIMATE_MARGIN)
+
+
+def plan_max_tokens(prompt_tokens: int, default: int, allowance: Optional[int] = None) -> int:
+    """
+    max_tokens for a call: the default, capped by the room left in the
+    context window and by the allowance (both net of the prompt). Never
+    below MIN_OUTPUT_TOKENS - callers refuse turns that can't afford that
+    before sending anything
+    """
+    room = CONTEXT_WINDOW_TOKENS - prompt_tokens
+    if allowance is not None:
+        room = min(room, allowance - prompt_tokens)
+    return max(MIN_OUTPUT_TOKENS, min(default, room))
+
+
+class TurnBudget:
+    """One turn's view of the ledger: what it may spend, and where to charge it"""
+
+    __slots__ = ("ledger", "session_id", "tenant", "allowance")
+
+    def __init__(self, ledger: "TokenLedger", session_id: str, tenant: str, allowance: Optional[int]):
+        self.ledger = ledger
+        self.session_id = session_id
+        self.tenant = tenant
+        self.allowance = allowance  # None = unlimited
+
+    def charge(self, usage: Dict[str, int], turns: int = 1):
+        self.ledger.charge(self.session_id, self.tenant, usage, turns)
+
+
+class TokenLedger:
+    """
+    Running token usage per session and per tenant (per UTC day), with budgets
+
+    Args:
+        session_budget: Tokens per session per day (0 = unlimited)
+        tenant_budget: Tokens per tenant per day (0 = unlimited)
+        max_sessions: Sessions tracked; the least recently active are forgotten
+    """
+
+    def __init__(
+        self,
+        session_budget: int = SESSION_TOKEN_BUDGET,
+        tenant_budget: int = TENANT_TOKEN_BUDGET,
+        max_sessions: int = LEDGER_MAX_SESSIONS
+    ):
+        self.session_budget = session_budget
+        self.tenant_budget = tenant_budget
+        self.max_sessions = max_sessions
+        self._day = _today()
+        self._sessions: "OrderedDict[str, int]" = OrderedDict()
+        self._tenants: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            "turns": 0,
+            "tokens": 0,
+            "refused_session": 0,
+            "refused_tenant": 0,
+            "refused_allowance": 0,  # Left some budget, but not enough for the turn
+            "refused_too_large": 0,
+            "trimmed_turns": 0,
+            "capped_calls": 0,
+            "estimated_input_tokens": 0,
+            "actual_input_tokens": 0,
+        }
+
+    def _roll(self):
+        """Start a new day's counts. Caller must hold the lock"""
+        today = _today()
+        if today != self._day:
+            self._day = today
+            self._sessions.clear()
+            self._tenants.clear()
+
+    def for_turn(self, session_id: str, tenant: str = DEFAULT_TENANT) -> TurnBudget:
+        """
+        Start a turn: its allowance is what's left of the tighter budget
+
+        Raises:
+            BudgetExceeded: the session or tenant has used its budget for today
+        """
+        with self._lock:
+            self._roll()
+            remaining = []
+            if self.session_budget > 0:
+                left = self.session_budget - self._sessions.get(session_id, 0)
+                if left <= 0:
+                    self._metrics["refused_session"] += 1
+                    raise BudgetExceeded(
+                        "This conversation has reached its limit for today - please call us or use the contact form",
+                        _seconds_to_midnight()
+                    )
+                remaining.append(left)
+            if self.tenant_budget > 0:
+                left = self.tenant_budget - self._tenants.get(tenant, 0)
+                if left <= 0:
+                    self._metrics["refused_tenant"] += 1
+                    raise BudgetExceeded(
+                        "The assistant has reached its limit for today - please call us or use the contact form",
+                        _seconds_to_midnight()
+                    )
+                remaining.append(left)
+        return TurnBudget(self, session_id, tenant, min(remaining) if remaining else None)
+
+    def charge(self, session_id: str, tenant: str, usage: Dict[str, int], turns: int = 1):
+        """Add a finished turn's usage to its session and tenant (turns=0 for a side call like a summary)"""
+        tokens = usage_total(usage)
+        with self._lock:
+            self._roll()
+            self._sessions[session_id] = self._sessions.pop(session_id, 0) + tokens
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._tenants[tenant] = self._tenants.get(tenant, 0) + tokens
+            self._metrics["turns"] += turns
+            self._metrics["tokens"] += tokens
+
+    def observe(self, event: str, count: int = 1):
+        """Count a sizing event (refused_allowance, refused_too_large, trimmed_turns, capped_calls)"""
+        with self._lock:
+            self._metrics[event] += count
+
+    def observe_estimate(self, estimated: int, usage: Dict[str, int]):
+        """Compare a first call's estimate with the input the API reported"""
+        with self._lock:
+            self._metrics["estimated_input_tokens"] += estimated
+            self._metrics["actual_input_tokens"] += usage_total(usage) - usage.get("output_tokens", 0)
+
+    def used(self, session_id: Optional[str] = None, tenant: Optional[str] = None) -> int:
+        """Tokens used today by a session or a tenant"""
+        with self._lock:
+            self._roll()
+            if session_id is not None:
+                return self._sessions.get(session_id, 0)
+            return self._tenants.get(tenant or DEFAULT_TENANT, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Budgets, today's usage by tenant, refusals and estimator accuracy"""
+        with self._lock:
+            self._roll()
+            metrics = dict(self._metrics)
+            tenants = dict(sorted(self._tenants.items(), key=lambda item: -item[1])[:20])
+            sessions = len(self._sessions)
+        estimated = metrics["estimated_input_tokens"]
+        return {
+            "day": self._day,
+            "session_budget": self.session_budget,
+            "tenant_budget": self.tenant_budget,
+            "sessions_today": sessions,
+            "tenants_today": tenants,
+            # Above 1 means estimates run high (safe), below 1 that they run low
+            "estimate_ratio": round(estimated / metrics["actual_input_tokens"], 3) if metrics["actual_input_tokens"] else 0.0,
+            **metrics
+        }
+
+
+def fit_turn(
+    history: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    budget: Optional[TurnBudget],
+    ledger: Optional["TokenLedger"] = None
+) -> int:
+    """
+    Make sure a turn's first call fits before anything is sent
+
+    Drops the oldest turns from history (in place) if the call wouldn't
+    leave MIN_OUTPUT_TOKENS within the context window or the allowance.
+
+    Args:
+        history: Conversation so far, ending with this turn's user message
+        params: The first call's request, built from history
+        budget: The turn's budget (None = only the context window applies)
+        ledger: Where to count trims and refusals
+
+    Returns:
+        Number of leading messages dropped (0 if it already fit) - the
+        caller rebuilds params if this isn't 0
+
+    Raises:
+        BudgetExceeded: the allowance can't cover the call even without earlier turns
+        PromptTooLarge: the message alone doesn't fit the context window
+    """
+    allowance = budget.allowance if budget is not None else None
+    limit = CONTEXT_WINDOW_TOKENS if allowance is None else min(CONTEXT_WINDOW_TOKENS, allowance)
+    prompt = estimate_request_tokens(params)
+    if prompt + MIN_OUTPUT_TOKENS <= limit:
+        return 0
+
+    # Room for earlier turns once the system prompt, tools and this message are in
+    sizes = [estimate_tokens(message) for message in history[:-1]]
+    fixed = prompt - int(sum(sizes) * ESTIMATE_MARGIN)
+    room = limit - MIN_OUTPUT_TOKENS - fixed
+
+    if room < 0:
+        if fixed + MIN_OUTPUT_TOKENS > CONTEXT_WINDOW_TOKENS:
+            if ledger is not None:
+                ledger.observe("refused_too_large")
+            raise PromptTooLarge("That message is too long for the assistant - please shorten it")
+        if ledger is not None:
+            ledger.observe("refused_allowance")
+        raise BudgetExceeded(
+            "This conversation has reached its limit for today - please call us or use the contact form",
+            _seconds_to_midnight()
+        )
+
+    # Keep the most recent whole turns that fit (this turn's message always does)
+    remaining = sum(sizes)
+    cut = len(history) - 1
+    for i, message in enumerate(history[:-1]):
+        if is_turn_start(message) and remaining * ESTIMATE_MARGIN <= room:
+            cut = i
+            break
+        remaining -= sizes[i]
+
+    if cut:
+        del history[:cut]
+        if ledger is not None:
+            ledger.observe("trimmed_turns")
+    return cut
+
+
+_ledger: Optional[TokenLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_token_ledger() -> TokenLedger:
+    """Get the process-wide token ledger"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = TokenLedger()
+    return _ledger
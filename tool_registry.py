@@ -0,0 +1,243 @@
+"""
+Tool registry
+Tools register themselves with a decorator; the chatbot dispatches by name
+
+- Each tool's input schema is compiled once, at registration, into a
+  validator, so a malformed tool call from the model is answered with an
+  error it can correct instead of reaching the handler.
+- Tool definitions sent to the API are built once per set of enabled
+  features and shared.
+- Feature flags are process-wide: toggling one swaps in a new snapshot
+  of the enabled set, and every chatbot picks up the new tool list on
+  its next request - there's nothing per session to rebuild. The set
+  itself keys the definitions cache (and the chatbot's FAQ cache
+  namespace), so switching a flag back reuses what was built before.
+"""
+
+import threading
+from typing import Optional, Dict, Any, List, Callable, FrozenSet
+
+Handler = Callable[[Dict[str, Any]], Dict[str, Any]]
+Validator = Callable[[Any, str], None]
+
+
+class ToolInputError(ValueError):
+    """Tool input doesn't match the tool's schema"""
+
+
+# JSON schema types -> Python types (bool is excluded from the numeric types below)
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """
+    Compile a JSON schema into a validator function
+
+    Supports the subset tool schemas use: type, properties, required,
+    additionalProperties (false), enum, items, minLength/maxLength and
+    minimum/maximum. The validator raises ToolInputError naming the
+    offending field.
+    """
+    checks: List[Validator] = []
+
+    expected = schema.get("type")
+    if expected is not None:
+        python_type = JSON_TYPES[expected]
+        numeric = expected in ("integer", "number")
+
+        def check_type(value, path):
+            if not isinstance(value, python_type) or (numeric and isinstance(value, bool)):
+                raise ToolInputError(f"{path} must be of type {expected}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+        allowed_set = frozenset(allowed)
+
+        def check_enum(value, path):
+            if value not in allowed_set:
+                raise ToolInputError(f"{path} must be one of {', '.join(map(str, allowed))}")
+        checks.append(check_enum)
+
+    for keyword, test, message in (
+        ("minLength", lambda value, limit: len(value) >= limit, "at least {} characters"),
+        ("maxLength", lambda value, limit: len(value) <= limit, "at most {} characters"),
+        ("minimum", lambda value, limit: value >= limit, "at least {}"),
+        ("maximum", lambda value, limit: value <= limit, "at most {}"),
+    ):
+        if keyword in schema:
+            def check_limit(value, path, test=test, limit=schema[keyword], message=message):
+                if not test(value, limit):
+                    raise ToolInputError(f"{path} must be {message.format(limit)}")
+            checks.append(check_limit)
+
+    if "properties" in schema or "required" in schema:
+        properties = {
+            name: compile_schema(subschema)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = tuple(schema.get("required", ()))
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value, path):
+            for name in required:
+                if name not in value:
+                    raise ToolInputError(f"{path}.{name} is required")
+            for name, item in value.items():
+                validate = properties.get(name)
+                if validate is not None:
+                    validate(item, f"{path}.{name}")
+                elif closed:
+                    raise ToolInputError(f"{path}.{name} is not allowed")
+        checks.append(check_object)
+
+    if "items" in schema:
+        validate_item = compile_schema(schema["items"])
+
+        def check_items(value, path):
+            for index, item in enumerate(value):
+                validate_item(item, f"{path}[{index}]")
+        checks.append(check_items)
+
+    def validate(value, path="input"):
+        for check in checks:
+            check(value, path)
+
+    return validate
+
+
+class Tool:
+    """A registered tool: its API definition, handler and compiled validator"""
+
+    __slots__ = ("name", "feature", "handler", "definition", "validate")
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        input_schema: Dict[str, Any],
+        handler: Handler,
+        feature: Optional[str] = None
+    ):
+        self.name = name
+        self.feature = feature
+        self.handler = handler
+        self.definition = {"name": name, "description": description, "input_schema": input_schema}
+        self.validate = compile_schema(input_schema)
+
+    def available(self, enabled: FrozenSet[str]) -> bool:
+        """Whether the tool is offered with these features enabled"""
+        return self.feature is None or self.feature in enabled
+
+
+class ToolRegistry:
+    """Tools by name, with their definitions cached per set of enabled features"""
+
+    def __init__(self):
+        self._tools: Dict[str, Tool] = {}
+        self._definitions: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def tool(
+        self,
+        name: str,
+        description: str,
+        input_schema: Dict[str, Any],
+        feature: Optional[str] = None
+    ) -> Callable[[Handler], Handler]:
+        """
+        Decorator registering a tool handler
+
+        Args:
+            name: Tool name the model calls
+            description: When the model should use it
+            input_schema: JSON schema for the input (validated before the handler runs)
+            feature: Feature flag the tool depends on (None = always offered)
+        """
+        def register(handler: Handler) -> Handler:
+            with self._lock:
+                if name in self._tools:
+                    raise ValueError(f"Tool {name!r} is already registered")
+                self._tools[name] = Tool(name, description, input_schema, handler, feature)
+                self._definitions.clear()
+            return handler
+        return register
+
+    def definitions(self, enabled: FrozenSet[str]) -> List[Dict[str, Any]]:
+        """
+        Tool definitions for the API, in registration order
+        Built once per feature set and shared - do not mutate the result
+        """
+        definitions = self._definitions.get(enabled)
+        if definitions is None:
+            definitions = self.build_definitions(enabled)
+            self._definitions[enabled] = definitions
+        return definitions
+
+    def build_definitions(self, enabled: FrozenSet[str]) -> List[Dict[str, Any]]:
+        """Uncached version of definitions()"""
+        return [tool.definition for tool in self._tools.values() if tool.available(enabled)]
+
+    def execute(self, name: str, tool_input: Dict[str, Any], enabled: FrozenSet[str]) -> Dict[str, Any]:
+        """
+        Validate a tool call's input and run its handler
+
+        Returns:
+            The handler's result, or an error result (unknown or disabled
+            tool, invalid input) for the model to act on
+        """
+        tool = self._tools.get(name)
+        if tool is None or not tool.available(enabled):
+            return {"success": False, "error": f"Unknown tool: {name}"}
+        try:
+            tool.validate(tool_input)
+        except ToolInputError as e:
+            return {"success": False, "error": f"Invalid input: {e}"}
+        return tool.handler(tool_input)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+
+class FeatureFlags:
+    """
+    Process-wide feature flags
+    Readers get an immutable snapshot (`enabled`); set() replaces it
+    """
+
+    def __init__(self, defaults: Dict[str, bool]):
+        self._flags = dict(defaults)
+        self._lock = threading.Lock()
+        self.enabled: FrozenSet[str] = frozenset(name for name, on in defaults.items() if on)
+
+    def set(self, name: str, enabled: bool) -> bool:
+        """
+        Turn a feature on or off
+
+        Returns:
+            False if there is no such feature
+        """
+        with self._lock:
+            if name not in self._flags:
+                return False
+            if self._flags[name] != enabled:
+                self._flags[name] = enabled
+                self.enabled = frozenset(flag for flag, on in self._flags.items() if on)
+            return True
+
+    def as_dict(self) -> Dict[str, bool]:
+        with self._lock:
+            return dict(self._flags)
+
+
+# The registry the chatbot dispatches through (tools are in chatbot_tools.py)
+registry = ToolRegistry()
+tool = registry.tool
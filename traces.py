@@ -0,0 +1,327 @@
+"""
+Sampled request traces
+
+Records a sample of chat turns to a rotating JSONL log so real traffic can
+be replayed against a test server (benchmarks/replay_traces.py) for
+capacity planning. Off unless TRACE_SAMPLE_RATE is set.
+
+- Sampling is per session (a hash of the session id), so a sampled
+  conversation is captured turn by turn and replays with its real pacing.
+- Requests only put a tuple on a bounded queue. A background thread
+  redacts, serializes and writes it, so a request never waits on the disk.
+  If the writer falls behind, records are dropped and counted instead.
+- Redaction: emails, phone numbers, card and SSN-like numbers and
+  introduced names ("my name is ...") are masked in messages. The
+  contact fields of tool inputs are masked entirely. Replies aren't
+  kept, only their length.
+- The log rotates at TRACE_MAX_BYTES, keeping TRACE_BACKUPS old files
+  (traces.jsonl.1 is the newest of them).
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from typing import Optional, Dict, Any, List
+
+# Share of sessions traced (0 = off, 1 = every session)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+TRACE_FILE = os.environ.get(
+    "TRACE_FILE", os.path.join(os.environ.get("DATA_DIR", "data"), "traces", "traces.jsonl")
+)
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", 10 * 1024 * 1024))
+TRACE_BACKUPS = int(os.environ.get("TRACE_BACKUPS", 5))
+# Records waiting for the writer; beyond this they're dropped
+TRACE_QUEUE_SIZE = int(os.environ.get("TRACE_QUEUE_SIZE", 10000))
+
+REDACTED = "[redacted]"
+
+# Applied in order - card and SSN numbers before the phone pattern can claim their digits
+PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "[email]"),
+    (re.compile(r"\b(?:\d[ -]?){12,18}\d\b"), "[card]"),
+    (re.compile(r"\b\d{3}-\d{2}-\d{4}\b"), "[ssn]"),
+    (re.compile(r"(?:\+?1[\s.-]?)?(?:\(\d{3}\)|\b\d{3})[\s.-]?\d{3}[\s.-]?\d{4}\b"), "[phone]"),
+    # Visitors often type names in lowercase, so the (up to three) words after
+    # an introduction are masked whatever their case - "I'm looking for a
+    # quote" loses a few words too, which is the safer mistake
+    (re.compile(r"\b(my name is|my name's|i'm|i’m|i am|im|this is)\s+[^\W\d_][\w'-]*(?:[ \t]+[^\W\d_][\w'-]*){0,2}", re.I),
+     r"\1 [name]"),
+]
+
+# Tool input fields that identify the customer (see chatbot_tools.py)
+CONTACT_FIELDS = frozenset({
+    "name", "email", "phone",
+    "customer_name", "customer_email", "customer_phone",
+})
+
+_STOP = object()
+
+
+def redact_text(text: str) -> str:
+    """Mask emails, phone/card/SSN numbers and introduced names in free text"""
+    for pattern, replacement in PII_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact_tool_input(tool_input: Any) -> Any:
+    """Mask contact fields of a tool input and redact its other text"""
+    if not isinstance(tool_input, dict):
+        return tool_input
+    return {
+        key: REDACTED if key in CONTACT_FIELDS else (
+            redact_text(value) if isinstance(value, str) else value
+        )
+        for key, value in tool_input.items()
+    }
+
+
+def build_record(
+    received_at: float,
+    endpoint: str,
+    status: int,
+    duration_ms: float,
+    data: Dict[str, Any],
+    result: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    One trace line, redacted
+
+    Args:
+        received_at: Unix time the request arrived
+        endpoint: Route the turn came in on (replayed to the same one)
+        status: HTTP status returned (200 for a stream that started)
+        duration_ms: Time to the full reply
+        data: Request body
+        result: Response body (the done event for streams), None on errors
+    """
+    record = {
+        "ts": round(received_at, 3),
+        "endpoint": endpoint,
+        "session_id": str(data.get("session_id", "default")),
+        "message": redact_text(str(data.get("message", ""))),
+        "status": status,
+        "duration_ms": round(duration_ms, 1),
+    }
+    if result:
+        record.update({
+            "first_token_ms": result.get("first_token_ms"),
+            "model": result.get("model"),
+            "answered_by": (
+                "cache" if result.get("cached") else
+                "coalesced" if result.get("coalesced") else
+                "fallback" if result.get("degraded") else "model"
+            ),
+            "usage": result.get("usage", {}),
+            "tools": [
+                {
+                    "tool": action.get("tool"),
+                    "input": redact_tool_input(action.get("input")),
+                    "success": (action.get("result") or {}).get("success", True),
+                }
+                for action in result.get("actions", [])
+            ],
+            "response_chars": len(result.get("response") or ""),
+        })
+    else:
+        record["error"] = True
+    return record
+
+
+class TraceLog:
+    """
+    Sampled, redacted chat turns written to a rotating JSONL file by a
+    background thread
+
+    Args:
+        path: Current log file; rotated files get .1, .2, ... suffixes
+        sample_rate: Share of sessions traced (0 disables tracing)
+        max_bytes: Rotate once the file would grow past this
+        backups: Rotated files kept
+        queue_size: Records waiting for the writer before new ones are dropped
+    """
+
+    def __init__(
+        self,
+        path: str = TRACE_FILE,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        max_bytes: int = TRACE_MAX_BYTES,
+        backups: int = TRACE_BACKUPS,
+        queue_size: int = TRACE_QUEUE_SIZE
+    ):
+        self.path = path
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._threshold = int(self.sample_rate * 0xFFFFFFFF)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._size = 0
+        self._writer: Optional[threading.Thread] = None
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._metrics = {"written": 0, "dropped": 0, "rotations": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def sampled(self, session_id: str) -> bool:
+        """Whether this session's turns are traced (the same answer for every turn)"""
+        return self.enabled and zlib.crc32(session_id.encode()) <= self._threshold
+
+    def record(
+        self,
+        endpoint: str,
+        status: int,
+        started: Optional[float],
+        data: Any,
+        result: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Queue a turn for the log if its session is sampled - never blocks
+
+        Args:
+            endpoint: Route the turn came in on
+            status: HTTP status returned
+            started: time.perf_counter() when the request arrived
+            data: Request body
+            result: Response body (the done event for streams), None on errors
+        """
+        if not self.enabled or not isinstance(data, dict) or "message" not in data:
+            return  # Nothing to replay
+        if not self.sampled(str(data.get("session_id", "default"))):
+            return
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        self._start()
+        try:
+            self._queue.put_nowait((time.time() - elapsed, endpoint, status, elapsed * 1000, data, result))
+        except queue.Full:
+            with self._lock:
+                self._metrics["dropped"] += 1
+
+    def _start(self):
+        """Start the writer thread for this process (threads don't survive a fork)"""
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._file = None
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+            self._started_pid = os.getpid()
+
+    def close(self, timeout: float = 5.0):
+        """Write what's queued and stop the writer"""
+        if self._started_pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout)
+        self._started_pid = None
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Write whatever else is waiting before flushing
+            while item is not _STOP:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            for entry in batch:
+                if entry is _STOP:
+                    continue
+                try:
+                    self._write(json.dumps(build_record(*entry), default=str) + "\n")
+                    outcome = "written"
+                except Exception:
+                    outcome = "errors"
+                with self._lock:
+                    self._metrics[outcome] += 1
+            if self._file is not None:
+                self._file.flush()
+
+            if batch[-1] is _STOP:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, line: str):
+        """Append a line, rotating first if it would take the file past max_bytes"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._size = os.path.getsize(self.path)
+        size = len(line.encode("utf-8"))
+        if self.max_bytes and self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += size
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+        with self._lock:
+            self._metrics["rotations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Sampling settings and writer counters"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            **metrics
+        }
+
+
+def trace_files(path: str = TRACE_FILE) -> List[str]:
+    """The log and its rotated files, oldest first"""
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    rotated = sorted(
+        (int(name[len(prefix):]) for name in os.listdir(directory)
+         if name.startswith(prefix) and name[len(prefix):].isdigit()),
+        reverse=True
+    ) if os.path.isdir(directory) else []
+    files = [os.path.join(directory, f"{prefix}{n}") for n in rotated]
+    return files + ([path] if os.path.exists(path) else [])
+
+
+_trace_log: Optional[TraceLog] = None
+_trace_log_lock = threading.Lock()
+
+
+def get_trace_log() -> TraceLog:
+    """Get the process-wide trace log (writes what's queued on exit)"""
+    global _trace_log
+    if _trace_log is None:
+        with _trace_log_lock:
+            if _trace_log is None:
+                _trace_log = TraceLog()
+                atexit.register(_trace_log.close)
+    return _trace_log